@@ -0,0 +1,108 @@
+import asyncio
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from cache_backend import CacheBackend, cache_backend
+
+# How long a computed analytics response is served from cache (0 disables storage)
+ANALYTICS_CACHE_TTL_SECONDS = float(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", "60"))
+
+NAMESPACE = "analytics"
+
+
+class AnalyticsCache:
+    """Response cache for analytics endpoints.
+
+    Entries are keyed by endpoint name + query parameters and expire after a TTL.
+    Concurrent misses for the same key share a single computation (single-flight),
+    and every entry carries coarse tags ("tickets", "chatbot", "agents") so that
+    write paths can invalidate whatever depends on the data they changed.
+
+    Entries are stored in the shared cache backend, so with CACHE_BACKEND=redis
+    all replicas serve (and invalidate) the same responses. Each tag is a backend
+    namespace and the current tag versions are part of the entry key, which makes
+    entries written before an invalidation unreachable.
+    """
+
+    def __init__(self, backend: CacheBackend = cache_backend, ttl_seconds: float = ANALYTICS_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "invalidations": 0, "errors": 0}
+
+    @staticmethod
+    def make_key(endpoint: str, params: Optional[dict] = None, versions: Optional[Dict[str, int]] = None) -> str:
+        """Build a stable cache key from an endpoint name, its parameters and tag versions"""
+        key = endpoint
+        if params:
+            key += f"?{json.dumps(params, sort_keys=True, default=str)}"
+        if versions:
+            key += "#" + ",".join(f"{tag}={version}" for tag, version in sorted(versions.items()))
+        return key
+
+    async def get_or_compute(
+        self,
+        endpoint: str,
+        compute: Callable[[], Awaitable[Any]],
+        params: Optional[dict] = None,
+        tags: Iterable[str] = ("tickets",),
+    ) -> Any:
+        """Return the cached response for endpoint+params, computing it at most once"""
+        versions = {tag: await self.backend.version(f"{NAMESPACE}:{tag}") for tag in set(tags)}
+        key = self.make_key(endpoint, params, versions)
+
+        value = await self.backend.get(NAMESPACE, key)
+        if value is not None:
+            self._stats["hits"] += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            # Someone is already computing this response; wait for their result
+            self._stats["coalesced"] += 1
+            return await asyncio.shield(task)
+
+        self._stats["misses"] += 1
+        task = asyncio.ensure_future(self._compute_and_store(key, compute))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+
+        # Shield so a disconnecting client does not cancel the shared computation
+        return await asyncio.shield(task)
+
+    async def _compute_and_store(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        value = await compute()
+        # If a tag was invalidated meanwhile, this key's versions are already stale
+        # and the stored entry simply becomes unreachable
+        if self.ttl_seconds > 0:
+            await self.backend.set(NAMESPACE, key, value, ttl=self.ttl_seconds)
+        return value
+
+    def _finish(self, key: str, task: asyncio.Future):
+        """Completion callback for a computation started by get_or_compute"""
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            self._stats["errors"] += 1
+
+    async def invalidate(self, *tags: str):
+        """Drop every cached response that depends on any of the given tags"""
+        for tag in tags:
+            await self.backend.invalidate(f"{NAMESPACE}:{tag}")
+        self._stats["invalidations"] += 1
+
+    def stats(self) -> dict:
+        """Cache statistics for monitoring"""
+        lookups = self._stats["hits"] + self._stats["misses"] + self._stats["coalesced"]
+        served_without_compute = self._stats["hits"] + self._stats["coalesced"]
+        return {
+            **self._stats,
+            "inflight": len(self._inflight),
+            "ttl_seconds": self.ttl_seconds,
+            "hit_ratio": round(served_without_compute / lookups, 3) if lookups > 0 else 0,
+            "backend": self.backend.stats()
+        }
+
+
+# Global analytics cache instance
+analytics_cache = AnalyticsCache()
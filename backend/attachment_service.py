@@ -0,0 +1,289 @@
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import uuid
+from datetime import datetime
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from pymongo import ReturnDocument, UpdateOne
+
+from database import database
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+# Per-file and per-request upload limits in bytes
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(10 * 1024 * 1024)))
+MAX_REQUEST_UPLOAD_SIZE = int(os.getenv("MAX_REQUEST_UPLOAD_SIZE", str(50 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+SHA256_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+def is_blob_name(stored_filename: str) -> bool:
+    """True for content-addressed attachments, False for legacy uuid-named files"""
+    return bool(SHA256_PATTERN.fullmatch(stored_filename or ""))
+
+
+def _close_and_publish(handle: BinaryIO, temp_path: str, final_path: str):
+    """Flush a finished upload to disk and move it into place atomically"""
+    handle.flush()
+    os.fsync(handle.fileno())
+    handle.close()
+    os.replace(temp_path, final_path)
+
+
+def _remove_if_exists(file_path: str):
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+
+def _discard(handle: Optional[BinaryIO], temp_path: str):
+    """Close and remove a partially written upload"""
+    if handle is not None and not handle.closed:
+        handle.close()
+    _remove_if_exists(temp_path)
+
+
+def _open_for_write(file_path: str) -> BinaryIO:
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    return open(file_path, "wb")
+
+
+class AttachmentService:
+    """Stores uploaded files for tickets, comments and knowledge base articles.
+
+    Files are content-addressed: each upload is hashed (SHA-256) while being
+    streamed in chunks, and stored once as a blob named after its digest in a
+    sharded directory. `attachment_blobs` keeps a reference count per digest,
+    so the same screenshot attached to many tickets costs one hash computation
+    and no extra disk, and a blob is deleted only when its last reference goes.
+
+    All disk I/O runs in worker threads, size limits are enforced while
+    hashing (before anything is written), and blobs are written to a temporary
+    name and renamed into place once complete.
+    """
+
+    def __init__(self, upload_dir: str = UPLOAD_DIR, max_file_size: int = MAX_UPLOAD_SIZE,
+                 max_request_size: int = MAX_REQUEST_UPLOAD_SIZE):
+        self.upload_dir = upload_dir
+        self.blob_dir = os.path.join(upload_dir, "blobs")
+        self.max_file_size = max_file_size
+        self.max_request_size = max_request_size
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+    def blob_relpath(self, digest: str) -> str:
+        """Path of a blob relative to the upload directory (blobs/<aa>/<bb>/<sha256>)"""
+        return f"blobs/{digest[:2]}/{digest[2:4]}/{digest}"
+
+    def derivative_dir(self, digest: str) -> str:
+        """Directory holding the generated thumbnails/previews of a blob"""
+        return os.path.join(self.upload_dir, "derivatives", digest[:2], digest[2:4], digest)
+
+    def derivative_path(self, digest: str, variant: str) -> str:
+        return os.path.join(self.derivative_dir(digest), f"{variant}.jpg")
+
+    def path_for(self, stored_filename: str) -> str:
+        """Filesystem path of a stored attachment (blob or legacy file)"""
+        if is_blob_name(stored_filename):
+            return os.path.join(self.upload_dir, self.blob_relpath(stored_filename))
+        return os.path.join(self.upload_dir, stored_filename)
+
+    async def save_uploads(self, files: List[UploadFile]) -> List[dict]:
+        """Save every named upload and return the attachment metadata list"""
+        files = [file for file in files if file.filename]
+
+        # Reject oversized requests before reading anything when sizes are known
+        declared_total = 0
+        for file in files:
+            if file.size is not None:
+                self._check_file_size(file.filename, file.size)
+                declared_total += file.size
+        self._check_request_size(declared_total)
+
+        attachments = []
+        total_size = 0
+        try:
+            for file in files:
+                attachment = await self._save_upload(file, total_size)
+                total_size += attachment["size"]
+                attachments.append(attachment)
+        except BaseException:
+            # Drop the references taken by a rejected request
+            for attachment in attachments:
+                await self.release(attachment["stored_filename"])
+            raise
+
+        return attachments
+
+    async def _save_upload(self, file: UploadFile, request_bytes_so_far: int) -> dict:
+        digest, size = await self._hash_upload(file, request_bytes_so_far)
+
+        # Take the reference before making sure the blob exists, so a concurrent
+        # release of the same digest can see that it is still in use
+        await database.attachment_blobs.update_one(
+            {"_id": digest},
+            {
+                "$inc": {"refcount": 1},
+                "$setOnInsert": {"size": size, "created_at": datetime.utcnow()}
+            },
+            upsert=True
+        )
+        try:
+            await self._ensure_blob(file, digest)
+        except BaseException:
+            await self.release(digest)
+            raise
+
+        return {
+            "filename": file.filename,
+            "stored_filename": digest,
+            "url": f"/attachments/{digest}",
+            "size": size,
+            "content_type": file.content_type,
+            "sha256": digest
+        }
+
+    async def _hash_upload(self, file: UploadFile, request_bytes_so_far: int) -> tuple:
+        """Hash an upload in chunks, enforcing size limits as it goes"""
+        hasher = hashlib.sha256()
+        size = 0
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            self._check_file_size(file.filename, size)
+            self._check_request_size(request_bytes_so_far + size)
+            await asyncio.to_thread(hasher.update, chunk)
+
+        return hasher.hexdigest(), size
+
+    async def _ensure_blob(self, file: UploadFile, digest: str):
+        """Write the blob for `digest` from the upload unless it is already stored"""
+        final_path = self.path_for(digest)
+        if await asyncio.to_thread(os.path.exists, final_path):
+            return
+
+        temp_path = f"{final_path}.{uuid.uuid4().hex}.part"
+        handle = None
+        try:
+            await file.seek(0)
+            handle = await asyncio.to_thread(_open_for_write, temp_path)
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await asyncio.to_thread(handle.write, chunk)
+
+            await asyncio.to_thread(_close_and_publish, handle, temp_path, final_path)
+        except BaseException:
+            await asyncio.to_thread(_discard, handle, temp_path)
+            raise
+
+    def stage_file(self, source: BinaryIO, filename: str) -> Tuple[str, int, str]:
+        """Copy a file object to a temporary file next to the blobs, hashing it
+        on the way (blocking: run it in a worker thread).
+
+        Returns (digest, size, temp_path). Take the references with
+        `add_references` before `publish_staged` moves the file into place,
+        like uploads do. Raises ValueError for files over the size limit.
+        """
+        temp_path = os.path.join(self.blob_dir, f"staged.{uuid.uuid4().hex}.part")
+        hasher = hashlib.sha256()
+        size = 0
+        handle = _open_for_write(temp_path)
+        try:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > self.max_file_size:
+                    raise ValueError(f"File '{filename}' exceeds the maximum upload size of {self.max_file_size} bytes")
+                hasher.update(chunk)
+                handle.write(chunk)
+            handle.flush()
+            os.fsync(handle.fileno())
+            handle.close()
+        except BaseException:
+            _discard(handle, temp_path)
+            raise
+        return hasher.hexdigest(), size, temp_path
+
+    def publish_staged(self, digest: str, temp_path: str):
+        """Move a staged file into place as its blob, or drop it if the blob exists"""
+        final_path = self.path_for(digest)
+        if os.path.exists(final_path):
+            _remove_if_exists(temp_path)
+            return
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(temp_path, final_path)
+
+    def discard_staged(self, temp_path: str):
+        _remove_if_exists(temp_path)
+
+    async def add_references(self, references: Dict[str, int], sizes: Dict[str, int]):
+        """Take `references[digest]` references per blob with one bulk_write"""
+        now = datetime.utcnow()
+        updates = [UpdateOne(
+            {"_id": digest},
+            {"$inc": {"refcount": count}, "$setOnInsert": {"size": sizes[digest], "created_at": now}},
+            upsert=True
+        ) for digest, count in references.items() if count]
+        if updates:
+            await database.attachment_blobs.bulk_write(updates, ordered=False)
+
+    def _check_file_size(self, filename: str, size: int):
+        if size > self.max_file_size:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File '{filename}' exceeds the maximum upload size of {self.max_file_size} bytes"
+            )
+
+    def _check_request_size(self, size: int):
+        if size > self.max_request_size:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Attachments exceed the maximum total upload size of {self.max_request_size} bytes"
+            )
+
+    async def release(self, stored_filename: str):
+        """Drop one reference to a stored attachment, deleting it when unreferenced"""
+        if not is_blob_name(stored_filename):
+            # Legacy uuid-named uploads are never shared
+            await asyncio.to_thread(_remove_if_exists, self.path_for(stored_filename))
+            return
+
+        blob = await database.attachment_blobs.find_one_and_update(
+            {"_id": stored_filename},
+            {"$inc": {"refcount": -1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if blob is None or blob.get("refcount", 0) > 0:
+            return
+
+        result = await database.attachment_blobs.delete_one({"_id": stored_filename, "refcount": {"$lte": 0}})
+        if result.deleted_count == 0:
+            return
+
+        # Move the blob aside first; if an upload re-referenced the digest in the
+        # meantime it gets moved back instead of being deleted under it
+        blob_path = self.path_for(stored_filename)
+        trash_path = f"{blob_path}.{uuid.uuid4().hex}.deleted"
+        try:
+            await asyncio.to_thread(os.replace, blob_path, trash_path)
+        except FileNotFoundError:
+            return
+
+        if await database.attachment_blobs.find_one({"_id": stored_filename}, {"_id": 1}) \
+                and not await asyncio.to_thread(os.path.exists, blob_path):
+            await asyncio.to_thread(os.replace, trash_path, blob_path)
+        else:
+            await asyncio.to_thread(_remove_if_exists, trash_path)
+            await asyncio.to_thread(shutil.rmtree, self.derivative_dir(stored_filename), True)
+
+
+# Global attachment service instance
+attachment_service = AttachmentService()
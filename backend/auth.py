@@ -13,6 +13,8 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
+# For endpoints browsers open directly (<img src>, downloads), which can't send headers
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
 
 def verify_password(plain_password, hashed_password):
     # For testing, use plain text
@@ -70,4 +72,23 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     if user_data:
         user_data["_id"] = str(user_data["_id"])
         return User(**user_data)
-    raise credentials_exception
\ No newline at end of file
+    raise credentials_exception
+
+async def get_current_user_from_header_or_query(
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    access_token: Optional[str] = None
+):
+    """Authenticate with the Authorization header or an `access_token` query parameter"""
+    if not token and not access_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await get_current_user(token or access_token)
+
+def can_access_ticket(user: User, ticket: dict) -> bool:
+    """Staff can access every ticket; other users only their own"""
+    if user.role in ["agent", "manager", "admin"]:
+        return True
+    return ticket.get("user_id") == str(user.id)
@@ -0,0 +1,591 @@
+import json
+import os
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import AsyncIterable, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pydantic import ValidationError
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from database import database
+from duplicate_detector import duplicate_detector
+from models import RequestCreate, TicketUrgency, NotificationType
+from notification_service import notification_service
+from sla_service import sla_service
+from sync_service import sync_service
+from ticket_classifier import ticket_classifier
+from ticket_events import ticket_events
+
+# Largest number of tickets a single bulk request may touch
+BULK_MAX_TICKETS = int(os.getenv("BULK_MAX_TICKETS", "5000"))
+# Ingested tickets are inserted and assigned this many at a time
+BULK_INGEST_BATCH_SIZE = int(os.getenv("BULK_INGEST_BATCH_SIZE", "500"))
+# Longest NDJSON line accepted by bulk ticket creation and knowledge base import
+BULK_MAX_LINE_BYTES = int(os.getenv("BULK_MAX_LINE_BYTES", str(1024 * 1024)))
+
+# Tickets in these states no longer count towards their agent's load
+CLOSED_STATUSES = {"resolved", "closed"}
+PRIORITIES = {"low", "medium", "high", "urgent"}
+
+
+class LineTooLongError(ValueError):
+    """A streamed line exceeded the maximum length; the rest of the body is not read"""
+
+
+async def iter_lines(chunks: AsyncIterable[bytes], max_line_bytes: int = BULK_MAX_LINE_BYTES) -> AsyncIterable[str]:
+    """Split a streamed request body into lines as it arrives.
+
+    Raises LineTooLongError as soon as a line is longer than `max_line_bytes`,
+    so one huge line can't be buffered whole.
+    """
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *complete, buffer = buffer.split(b"\n")
+        for line in complete:
+            if len(line) > max_line_bytes:
+                raise LineTooLongError(f"Line longer than {max_line_bytes} bytes")
+            yield line.decode("utf-8", "replace")
+        if len(buffer) > max_line_bytes:
+            raise LineTooLongError(f"Line longer than {max_line_bytes} bytes")
+    if buffer:
+        yield buffer.decode("utf-8", "replace")
+
+
+class BulkTicketService:
+    """Reassign, close, reprioritize or escalate many tickets per request.
+
+    Each operation loads the tickets with one `$in` query, writes them with one
+    bulk_write, adjusts `current_ticket_count` with one grouped update per
+    affected agent, and queues timeline events, sync tombstones and
+    notifications in batches (one notification per recipient, summarising
+    when a recipient is affected by several tickets).
+
+    Results are reported per id: "updated", "unchanged", "invalid_id",
+    "not_found", "forbidden" or "failed".
+
+    `create_many` ingests tickets from NDJSON lines: each batch is validated,
+    checked for duplicates, inserted with insert_many and assigned in one pass
+    over the agent pool, using the same rules as single-ticket assignment.
+    """
+
+    def __init__(self, max_tickets: int = BULK_MAX_TICKETS, ingest_batch_size: int = BULK_INGEST_BATCH_SIZE):
+        self.max_tickets = max_tickets
+        self.ingest_batch_size = max(1, ingest_batch_size)
+
+    def parse_ids(self, payload: dict) -> List[str]:
+        """Ticket ids of a bulk request, deduplicated; raises ValueError if malformed"""
+        ids = payload.get("ids")
+        if not isinstance(ids, list) or not ids or not all(isinstance(i, str) for i in ids):
+            raise ValueError("'ids' must be a non-empty list of ticket ids")
+        if len(ids) > self.max_tickets:
+            raise ValueError(f"At most {self.max_tickets} tickets can be changed per request")
+        return list(dict.fromkeys(ids))
+
+    async def _load(self, ticket_ids: List[str], actor, check_access: bool = True) -> Tuple[Dict[str, dict], Dict[str, str]]:
+        """Tickets the actor may change, and results for the ids that were rejected"""
+        results = {i: "invalid_id" for i in ticket_ids if not ObjectId.is_valid(i)}
+        object_ids = [ObjectId(i) for i in ticket_ids if i not in results]
+
+        tickets = {}
+        for ticket in await database.requests.find({"_id": {"$in": object_ids}}).to_list(None):
+            ticket_id = str(ticket["_id"])
+            if check_access and actor.role == "agent" and ticket.get("assigned_agent") != str(actor.id):
+                results[ticket_id] = "forbidden"
+            else:
+                tickets[ticket_id] = ticket
+
+        for object_id in object_ids:
+            results.setdefault(str(object_id), "not_found")
+        return tickets, results
+
+    async def _write(self, updates: Dict[str, UpdateOne], results: Dict[str, str]) -> List[str]:
+        """Apply the per-ticket updates in one bulk_write; returns the ids written"""
+        if not updates:
+            return []
+
+        ticket_ids = list(updates)
+        failed = set()
+        try:
+            await database.requests.bulk_write(list(updates.values()), ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                failed.add(ticket_ids[error["index"]])
+                print(f"Bulk ticket update failed for {ticket_ids[error['index']]}: {error.get('errmsg')}")
+
+        for ticket_id in ticket_ids:
+            results[ticket_id] = "failed" if ticket_id in failed else "updated"
+        return [ticket_id for ticket_id in ticket_ids if ticket_id not in failed]
+
+    async def _adjust_agent_loads(self, load_changes: Dict[str, Counter], written: List[str]):
+        """Apply the written tickets' agent load changes, one grouped $inc per agent,
+        and update busy/active status to match"""
+        deltas = Counter()
+        for ticket_id in written:
+            deltas.update(load_changes.get(ticket_id, {}))
+        deltas = {agent: delta for agent, delta in deltas.items() if delta and ObjectId.is_valid(agent)}
+        if not deltas:
+            return
+
+        await database.users.bulk_write(
+            [UpdateOne({"_id": ObjectId(agent)}, {"$inc": {"current_ticket_count": delta}})
+             for agent, delta in deltas.items()],
+            ordered=False
+        )
+
+        agent_ids = [ObjectId(agent) for agent in deltas]
+        capacity = {"$ifNull": ["$max_concurrent_tickets", 5]}
+        # Never let a drifted counter go negative
+        await database.users.update_many(
+            {"_id": {"$in": agent_ids}, "current_ticket_count": {"$lt": 0}},
+            {"$set": {"current_ticket_count": 0}}
+        )
+        await database.users.update_many(
+            {"_id": {"$in": agent_ids}, "status": "busy",
+             "$expr": {"$lt": ["$current_ticket_count", capacity]}},
+            {"$set": {"status": "active"}}
+        )
+        await database.users.update_many(
+            {"_id": {"$in": agent_ids}, "status": {"$ne": "busy"},
+             "$expr": {"$gte": ["$current_ticket_count", capacity]}},
+            {"$set": {"status": "busy"}}
+        )
+
+    async def _notify(self, recipients: Dict[str, List[str]], kind: str, title: str,
+                      single_message, summary_message):
+        """One notification per recipient: about the ticket, or a summary of several"""
+        for user_id, ticket_ids in recipients.items():
+            if len(ticket_ids) == 1:
+                ticket_id = ticket_ids[0]
+                await notification_service.create({
+                    "user_id": user_id,
+                    "ticket_id": ticket_id,
+                    "type": kind,
+                    "title": title,
+                    "message": single_message(ticket_id),
+                    "created_at": datetime.utcnow()
+                })
+            else:
+                await notification_service.create({
+                    "user_id": user_id,
+                    "type": kind,
+                    "title": title,
+                    "message": summary_message(len(ticket_ids)),
+                    "ticket_ids": ticket_ids,
+                    "created_at": datetime.utcnow()
+                })
+
+    @staticmethod
+    def report(results: Dict[str, str], ticket_ids: List[str]) -> dict:
+        return {
+            "results": [{"id": ticket_id, "result": results[ticket_id]} for ticket_id in ticket_ids],
+            "summary": dict(Counter(results.values()))
+        }
+
+    async def reassign(self, ticket_ids: List[str], agent_id: str, actor) -> dict:
+        """Assign every ticket to `agent_id`"""
+        tickets, results = await self._load(ticket_ids, actor)
+        now = datetime.utcnow()
+
+        updates, loads, removals = {}, defaultdict(Counter), []
+        for ticket_id, ticket in tickets.items():
+            previous = ticket.get("assigned_agent")
+            if previous == agent_id:
+                results[ticket_id] = "unchanged"
+                continue
+
+            changes = {"assigned_agent": agent_id, "updated_at": now}
+            if ticket.get("status", "open") == "open":
+                changes["status"] = "assigned"
+            updates[ticket_id] = UpdateOne({"_id": ticket["_id"]}, {"$set": changes})
+
+            if ticket.get("status") not in CLOSED_STATUSES:
+                loads[ticket_id][agent_id] += 1
+                if previous:
+                    loads[ticket_id][previous] -= 1
+            if previous:
+                removals.append({"ticket_id": ticket_id, "user_id": previous, "reason": "reassigned"})
+
+        written = await self._write(updates, results)
+        if written:
+            await database.users.update_one({"_id": ObjectId(agent_id)}, {"$set": {"last_assigned_at": now}})
+        await self._adjust_agent_loads(loads, written)
+        written_set = set(written)
+        await sync_service.record_removals([r for r in removals if r["ticket_id"] in written_set])
+
+        await ticket_events.append_many([{
+            "ticket_id": ticket_id,
+            "action_type": "assigned",
+            "description": "Ticket reassigned in bulk",
+            "user_id": str(actor.id),
+            "metadata": {"previous_agent": tickets[ticket_id].get("assigned_agent"), "new_agent": agent_id, "bulk": True}
+        } for ticket_id in written])
+
+        if written:
+            await self._notify(
+                {agent_id: written}, NotificationType.TICKET_ASSIGNED, "Tickets assigned",
+                lambda t: f"You have been assigned ticket #{t[:8]}: {tickets[t].get('title', 'Untitled')}",
+                lambda n: f"You have been assigned {n} tickets"
+            )
+        return self.report(results, ticket_ids)
+
+    async def close(self, ticket_ids: List[str], status: str, actor, check_access: bool = True) -> dict:
+        """Resolve or close every ticket, and the duplicates linked to them"""
+        tickets, results = await self._load(ticket_ids, actor, check_access)
+        now = datetime.utcnow()
+
+        updates, loads, clients = {}, defaultdict(Counter), defaultdict(list)
+        for ticket_id, ticket in tickets.items():
+            if ticket.get("status") == status:
+                results[ticket_id] = "unchanged"
+                continue
+
+            changes = {"status": status, "updated_at": now}
+            if not ticket.get("resolved_at"):
+                changes["resolved_at"] = now
+            if status == "closed":
+                changes["closed_at"] = now
+            updates[ticket_id] = UpdateOne({"_id": ticket["_id"]}, {"$set": changes})
+
+            # Only tickets that were still open free up their agent
+            if ticket.get("status") not in CLOSED_STATUSES and ticket.get("assigned_agent"):
+                loads[ticket_id][ticket["assigned_agent"]] -= 1
+
+        written = await self._write(updates, results)
+        await self._adjust_agent_loads(loads, written)
+
+        await ticket_events.append_many([{
+            "ticket_id": ticket_id,
+            "action_type": "status_changed",
+            "description": f"Ticket {status}",
+            "user_id": str(actor.id),
+            "metadata": {"old_status": tickets[ticket_id].get("status"), "new_status": status, "bulk": True}
+        } for ticket_id in written])
+
+        for ticket_id in written:
+            clients[tickets[ticket_id]["user_id"]].append(ticket_id)
+        await self._notify(
+            clients, NotificationType.TICKET_RESOLVED if status == "resolved" else NotificationType.TICKET_UPDATED,
+            f"Ticket {status}",
+            lambda t: f"Your ticket #{t[:8]} has been {status}",
+            lambda n: f"{n} of your tickets have been {status}"
+        )
+
+        await duplicate_detector.forget(written)
+        await self.close_linked(written, status, actor)
+        return self.report(results, ticket_ids)
+
+    async def close_linked(self, parent_ids: List[str], status: str, actor):
+        """Close the open duplicates linked to incidents that were just closed"""
+        if not parent_ids:
+            return
+        children = await database.requests.distinct("_id", {
+            "parent_ticket_id": {"$in": parent_ids},
+            "status": {"$nin": list(CLOSED_STATUSES)}
+        })
+        if children:
+            # Whoever may close the incident may close its duplicates
+            await self.close([str(child) for child in children], status, actor, check_access=False)
+
+    async def set_priority(self, ticket_ids: List[str], priority: Optional[str],
+                           urgency_level: Optional[TicketUrgency], actor) -> dict:
+        """Change priority and/or urgency; a new urgency also moves the SLA due date"""
+        tickets, results = await self._load(ticket_ids, actor)
+        now = datetime.utcnow()
+
+        updates, agents = {}, defaultdict(list)
+        for ticket_id, ticket in tickets.items():
+            changes = {}
+            if priority is not None and ticket.get("priority") != priority:
+                changes["priority"] = priority
+            if urgency_level is not None and ticket.get("urgency_level") != urgency_level:
+                changes["urgency_level"] = int(urgency_level)
+                hours = sla_service.sla_rules[urgency_level]["resolution_time"]
+                changes["sla_due_date"] = ticket.get("created_at", now) + timedelta(hours=hours)
+            if not changes:
+                results[ticket_id] = "unchanged"
+                continue
+
+            changes["updated_at"] = now
+            updates[ticket_id] = UpdateOne({"_id": ticket["_id"]}, {"$set": changes})
+
+        written = await self._write(updates, results)
+
+        await ticket_events.append_many([{
+            "ticket_id": ticket_id,
+            "action_type": "priority_changed",
+            "description": "Ticket priority changed",
+            "user_id": str(actor.id),
+            "metadata": {
+                "old_priority": tickets[ticket_id].get("priority"),
+                "new_priority": priority,
+                "old_urgency_level": tickets[ticket_id].get("urgency_level"),
+                "new_urgency_level": urgency_level,
+                "bulk": True
+            }
+        } for ticket_id in written])
+
+        for ticket_id in written:
+            agent = tickets[ticket_id].get("assigned_agent")
+            if agent and agent != str(actor.id):
+                agents[agent].append(ticket_id)
+        await self._notify(
+            agents, NotificationType.TICKET_UPDATED, "Ticket priority changed",
+            lambda t: f"The priority of ticket #{t[:8]} has changed",
+            lambda n: f"The priority of {n} of your tickets has changed"
+        )
+        return self.report(results, ticket_ids)
+
+    async def escalate(self, ticket_ids: List[str], actor) -> dict:
+        """Escalate every open ticket one level, as POST /escalate/{id} does"""
+        tickets, results = await self._load(ticket_ids, actor)
+        now = datetime.utcnow()
+
+        plans = {}
+        for ticket_id, ticket in tickets.items():
+            if ticket.get("status") in CLOSED_STATUSES:
+                results[ticket_id] = "unchanged"
+                continue
+            urgency = ticket.get("urgency_level", TicketUrgency.MILD)
+            levels = sla_service.sla_rules.get(urgency, sla_service.sla_rules[TicketUrgency.MILD])["escalation_levels"]
+            count = ticket.get("escalation_count", 0) + 1
+            plans[ticket_id] = (count, levels[count - 1] if count <= len(levels) else None)
+
+        # Available agents of every level needed, handed out in order like the
+        # single-ticket path (which takes the first and marks them unavailable)
+        needed = sorted({level for _, level in plans.values() if level is not None})
+        available = defaultdict(list)
+        if needed:
+            for agent in await database.users.find(
+                {"role": "agent", "agent_level": {"$in": needed}, "is_available": True}
+            ).to_list(None):
+                available[agent["agent_level"]].append(str(agent["_id"]))
+        manager = None
+        if any(level is None for _, level in plans.values()):
+            manager = await database.users.find_one({"role": "manager"})
+
+        updates, loads, removals, taken = {}, defaultdict(Counter), [], []
+        assignees = {}
+        for ticket_id, (count, level) in plans.items():
+            ticket = tickets[ticket_id]
+            if level is None:
+                assignee = str(manager["_id"]) if manager else None
+            elif available[level]:
+                assignee = available[level].pop(0)
+                taken.append(ObjectId(assignee))
+            else:
+                assignee = None
+
+            changes = {"status": "escalated", "escalated_at": now, "updated_at": now}
+            previous = ticket.get("assigned_agent")
+            if assignee and assignee != previous:
+                changes["assigned_agent"] = assignee
+                assignees[ticket_id] = assignee
+                loads[ticket_id][assignee] += 1
+                if previous:
+                    loads[ticket_id][previous] -= 1
+                    removals.append({"ticket_id": ticket_id, "user_id": previous, "reason": "reassigned"})
+            updates[ticket_id] = UpdateOne(
+                {"_id": ticket["_id"]}, {"$set": changes, "$inc": {"escalation_count": 1}}
+            )
+
+        written = await self._write(updates, results)
+        written_set = set(written)
+        if taken:
+            await database.users.update_many({"_id": {"$in": taken}}, {"$set": {"is_available": False}})
+        await self._adjust_agent_loads(loads, written)
+        await sync_service.record_removals([r for r in removals if r["ticket_id"] in written_set])
+
+        await ticket_events.append_many([{
+            "ticket_id": ticket_id,
+            "action_type": "escalated",
+            "description": f"Ticket manually escalated (Level {plans[ticket_id][0]})",
+            "user_id": str(actor.id),
+            "metadata": {"manual_escalation": True, "bulk": True}
+        } for ticket_id in written])
+
+        recipients = defaultdict(list)
+        for ticket_id in written:
+            if ticket_id in assignees:
+                recipients[assignees[ticket_id]].append(ticket_id)
+        await self._notify(
+            recipients, NotificationType.TICKET_ESCALATED, "Escalated ticket assigned",
+            lambda t: f"Ticket #{t[:8]} has been escalated to you",
+            lambda n: f"{n} escalated tickets have been assigned to you"
+        )
+        return self.report(results, ticket_ids)
+
+    async def create_many(self, lines: AsyncIterable[str], actor) -> dict:
+        """Create a ticket from every NDJSON line (a RequestCreate payload).
+
+        Returns the created ids in input order (None for rejected lines) and
+        the errors by line number, counting non-blank lines; valid lines are
+        created even if others fail. Reading stops at the first line past
+        `max_tickets` or longer than the line limit, with one error for it.
+        """
+        ids: List[Optional[str]] = []
+        errors = []
+        batch: List[Tuple[int, dict]] = []
+        stats = Counter()
+
+        try:
+            async for line in lines:
+                line = line.strip()
+                if not line:
+                    continue
+                line_number = len(ids) + 1
+                if line_number > self.max_tickets:
+                    # The rest of the body is not read
+                    errors.append({"line": line_number, "error": f"At most {self.max_tickets} tickets can be created per request; "
+                                                                  "this line and any after it were not read"})
+                    break
+                ids.append(None)
+                try:
+                    ticket = RequestCreate(**json.loads(line))
+                except (ValueError, TypeError, ValidationError) as e:
+                    errors.append({"line": line_number, "error": str(e)})
+                    continue
+
+                batch.append((line_number, self._new_ticket(ticket, actor)))
+                if len(batch) >= self.ingest_batch_size:
+                    await self._ingest_batch(batch, ids, errors, stats, actor)
+                    batch = []
+        except LineTooLongError as e:
+            errors.append({"line": len(ids) + 1, "error": f"{e}; this line and any after it were not read"})
+
+        if batch:
+            await self._ingest_batch(batch, ids, errors, stats, actor)
+        return {"ids": ids, "created": stats["created"], "assigned": stats["assigned"],
+                "linked": stats["linked"], "errors": errors}
+
+    @staticmethod
+    def _new_ticket(ticket: RequestCreate, actor) -> dict:
+        now = datetime.utcnow()
+        document = ticket.dict()
+        ticket_classifier.apply(document)
+        urgency = TicketUrgency(document.get("urgency_level") or TicketUrgency.MILD)
+        document.update({
+            "user_id": str(actor.id),
+            "urgency_level": int(urgency),
+            "status": "open",
+            "created_at": now,
+            "updated_at": now,
+            "sla_due_date": now + timedelta(hours=sla_service.sla_rules[urgency]["resolution_time"])
+        })
+        return document
+
+    async def _ingest_batch(self, batch: List[Tuple[int, dict]], ids: List[Optional[str]], errors: List[dict],
+                            stats: Counter, actor):
+        documents = [document for _, document in batch]
+        for document in documents:
+            document["_id"] = ObjectId()
+        checked = documents
+        try:
+            await duplicate_detector.check(checked)
+            try:
+                await database.requests.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                # Unordered: everything but the reported rows was inserted
+                failed = {error["index"]: error for error in e.details.get("writeErrors", [])}
+                for index, error in sorted(failed.items()):
+                    errors.append({"line": batch[index][0], "error": error.get("errmsg", "Insert failed")})
+                batch = [entry for index, entry in enumerate(batch) if index not in failed]
+                documents = [document for _, document in batch]
+            except PyMongoError as e:
+                errors.extend({"line": line_number, "error": f"Not created: {e}"} for line_number, _ in batch)
+                return
+            await duplicate_detector.save(documents)
+        finally:
+            duplicate_detector.discard(checked)
+        for line_number, document in batch:
+            ids[line_number - 1] = str(document["_id"])
+        stats["created"] += len(documents)
+
+        # Duplicates linked to an open incident are handled with it rather than assigned
+        linked = [document for document in documents if document.get("parent_ticket_id")]
+        stats["linked"] += len(linked)
+        assignments = await self._assign_batch([document for document in documents if not document.get("parent_ticket_id")])
+        stats["assigned"] += len(assignments)
+
+        # Each ticket's events go out together so its sequence numbers are reserved at once
+        await ticket_events.append_many([{
+            "ticket_id": str(document["_id"]),
+            "action_type": "created",
+            "description": "Ticket created",
+            "user_id": str(actor.id)
+        } for document in documents] + assignments + duplicate_detector.link_events(linked, str(actor.id)))
+
+    async def _assign_batch(self, tickets: List[dict]) -> List[dict]:
+        """Assign new tickets like assign_agent_to_ticket does, in one pass;
+        returns the "assigned" timeline events to record.
+
+        The agent pool is read once; each ticket goes to the least loaded
+        category specialist under capacity (else the least loaded agent under
+        capacity), oldest last assignment first, with loads tracked in memory.
+        """
+        if not tickets:
+            return []
+        agents = await database.users.find(
+            {"role": "agent", "status": {"$in": ["active", "busy"]}},
+            {"name": 1, "categories": 1, "current_ticket_count": 1, "max_concurrent_tickets": 1, "last_assigned_at": 1}
+        ).to_list(None)
+        now = datetime.utcnow()
+
+        assigned: Dict[str, List[dict]] = defaultdict(list)
+        for position, ticket in enumerate(tickets):
+            available = [
+                agent for agent in agents
+                if agent.get("max_concurrent_tickets") is not None
+                and agent.get("current_ticket_count", 0) < agent["max_concurrent_tickets"]
+            ]
+            category = ticket.get("routing_category") or ticket["category"]
+            specialists = [agent for agent in available if category in (agent.get("categories") or [])]
+            candidates = specialists or available
+            if not candidates:
+                continue
+
+            agent = min(candidates, key=lambda a: (a.get("current_ticket_count", 0), a.get("last_assigned_at") or datetime.min))
+            agent["current_ticket_count"] = agent.get("current_ticket_count", 0) + 1
+            # Keeps round robin order between tickets of this batch
+            agent["last_assigned_at"] = now + timedelta(microseconds=position)
+            ticket["category_match"] = bool(specialists)
+            assigned[str(agent["_id"])].append(ticket)
+
+        if not assigned:
+            return []
+
+        await database.requests.bulk_write([
+            UpdateMany({"_id": {"$in": [ticket["_id"] for ticket in agent_tickets]}},
+                       {"$set": {"assigned_agent": agent_id, "status": "assigned"}})
+            for agent_id, agent_tickets in assigned.items()
+        ], ordered=False)
+
+        agents_by_id = {str(agent["_id"]): agent for agent in agents}
+        await database.users.bulk_write([
+            UpdateOne({"_id": ObjectId(agent_id)}, {"$set": {"last_assigned_at": agents_by_id[agent_id]["last_assigned_at"]}})
+            for agent_id in assigned
+        ], ordered=False)
+        loads = {str(ticket["_id"]): Counter({agent_id: 1})
+                 for agent_id, agent_tickets in assigned.items() for ticket in agent_tickets}
+        await self._adjust_agent_loads(loads, list(loads))
+
+        titles = {str(ticket["_id"]): ticket.get("title", "Untitled") for agent_tickets in assigned.values() for ticket in agent_tickets}
+        await self._notify(
+            {agent_id: [str(ticket["_id"]) for ticket in agent_tickets] for agent_id, agent_tickets in assigned.items()},
+            NotificationType.TICKET_ASSIGNED, "New ticket assigned",
+            lambda t: f"You have been assigned a new ticket: {titles[t]}",
+            lambda n: f"You have been assigned {n} new tickets"
+        )
+        return [{
+            "ticket_id": str(ticket["_id"]),
+            "action_type": "assigned",
+            "description": "Ticket assigned to agent via load balancing",
+            "user_id": agent_id,
+            "metadata": {"assignment_method": "load_balanced", "category_match": ticket.pop("category_match"), "bulk": True}
+        } for agent_id, agent_tickets in assigned.items() for ticket in agent_tickets]
+
+
+# Global bulk ticket service instance
+bulk_ticket_service = BulkTicketService()
@@ -0,0 +1,374 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set
+
+# "memory" (per-process LRU) or "redis" (shared between backend replicas)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# "orjson", "msgpack" or "json"; only used by backends that store bytes
+CACHE_SERIALIZER = os.getenv("CACHE_SERIALIZER", "orjson")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+# Redis keys always get a TTL so that entries of old namespace versions age out
+CACHE_DEFAULT_TTL_SECONDS = float(os.getenv("CACHE_DEFAULT_TTL_SECONDS", "3600"))
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "helpdesk")
+# A slow or unreachable Redis is treated as a cache miss after this long
+CACHE_REDIS_TIMEOUT_SECONDS = float(os.getenv("CACHE_REDIS_TIMEOUT_SECONDS", "0.5"))
+
+
+def _default(value: Any):
+    """Fallback encoder for values the serializers don't handle natively (ObjectId, datetime)"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class Serializer:
+    """Encode cache values to bytes with orjson, msgpack or the standard json module"""
+
+    def __init__(self, name: str = CACHE_SERIALIZER):
+        if name not in ("orjson", "msgpack"):
+            name = "json"
+
+        if name == "orjson":
+            try:
+                import orjson
+            except ImportError:
+                print("orjson is not installed, falling back to json cache serialization")
+                name = "json"
+            else:
+                options = orjson.OPT_NON_STR_KEYS
+                self.dumps = lambda value: orjson.dumps(value, default=_default, option=options)
+                self.loads = orjson.loads
+        elif name == "msgpack":
+            try:
+                import msgpack
+            except ImportError:
+                print("msgpack is not installed, falling back to json cache serialization")
+                name = "json"
+            else:
+                self.dumps = lambda value: msgpack.packb(value, default=_default, use_bin_type=True)
+                self.loads = lambda data: msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+        if name == "json":
+            self.dumps = lambda value: json.dumps(value, default=_default).encode()
+            self.loads = json.loads
+
+        self.name = name
+
+
+class CacheBackend(ABC):
+    """Interface shared by the cache implementations.
+
+    Keys live in namespaces. Invalidating a namespace bumps its version, which
+    makes every key written under the previous version unreachable, and tells
+    invalidation listeners (including those in other replicas, for shared
+    backends) so that they can drop any local copies. A stored value of None
+    is indistinguishable from a miss.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self._listeners: List[Callable[[str], None]] = []
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "invalidations": 0}
+
+    async def start(self):
+        """Start background work (e.g. invalidation subscriptions)"""
+
+    async def close(self):
+        """Release connections and stop background work"""
+
+    @abstractmethod
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        """A cached value, or None on a miss"""
+
+    @abstractmethod
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        """Store a value; `ttl` in seconds, None for the backend default"""
+
+    @abstractmethod
+    async def delete(self, namespace: str, key: str):
+        """Drop one key of the current namespace version"""
+
+    @abstractmethod
+    async def version(self, namespace: str) -> int:
+        """Current version of a namespace (0 until first invalidated)"""
+
+    @abstractmethod
+    async def invalidate(self, namespace: str):
+        """Make every key of a namespace unreachable and notify listeners"""
+
+    def add_invalidation_listener(self, callback: Callable[[str], None]):
+        """Call `callback(namespace)` whenever a namespace is invalidated"""
+        self._listeners.append(callback)
+
+    def _notify(self, namespace: str):
+        for callback in self._listeners:
+            try:
+                callback(namespace)
+            except Exception as e:
+                print(f"Cache invalidation listener error: {e}")
+
+    def stats(self) -> dict:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            "backend": self.name,
+            **self._stats,
+            "hit_ratio": round(self._stats["hits"] / lookups, 3) if lookups > 0 else 0
+        }
+
+
+class LRUCacheBackend(CacheBackend):
+    """In-process LRU cache; values are stored as-is without serialization"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        super().__init__()
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        entry_key = (namespace, self._versions.get(namespace, 0), key)
+        entry = self._entries.get(entry_key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at is None or expires_at > time.monotonic():
+                self._entries.move_to_end(entry_key)
+                self._stats["hits"] += 1
+                return value
+            del self._entries[entry_key]
+
+        self._stats["misses"] += 1
+        return None
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        entry_key = (namespace, self._versions.get(namespace, 0), key)
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._entries[entry_key] = (expires_at, value)
+        self._entries.move_to_end(entry_key)
+        self._stats["sets"] += 1
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, namespace: str, key: str):
+        self._entries.pop((namespace, self._versions.get(namespace, 0), key), None)
+
+    async def version(self, namespace: str) -> int:
+        return self._versions.get(namespace, 0)
+
+    async def invalidate(self, namespace: str):
+        self._versions[namespace] = self._versions.get(namespace, 0) + 1
+        for entry_key in [k for k in self._entries if k[0] == namespace]:
+            del self._entries[entry_key]
+
+        self._stats["invalidations"] += 1
+        self._notify(namespace)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "entries": len(self._entries), "max_entries": self.max_entries}
+
+
+class RedisCacheBackend(CacheBackend):
+    """Cache shared by all backend replicas through a Redis-protocol server.
+
+    Namespace versions are kept in Redis and cached locally for a few seconds;
+    invalidations are broadcast on a pub/sub channel so other replicas pick up
+    the new version (and notify their listeners) immediately. Pass `client` to
+    use an existing client, e.g. `fakeredis.aioredis.FakeRedis()` in tests.
+
+    A Redis outage degrades to the database rather than failing requests:
+    reads miss, writes are skipped, and invalidations bump the local version
+    and are sent to Redis once it answers again.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = REDIS_URL, client=None, serializer: Optional[Serializer] = None,
+                 version_ttl: float = 5.0, default_ttl: float = CACHE_DEFAULT_TTL_SECONDS):
+        super().__init__()
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package")
+            client = redis.from_url(url, socket_timeout=CACHE_REDIS_TIMEOUT_SECONDS,
+                                    socket_connect_timeout=CACHE_REDIS_TIMEOUT_SECONDS)
+        try:
+            from redis.exceptions import RedisError
+            self._errors = (RedisError, OSError)
+        except ImportError:
+            self._errors = (OSError,)
+
+        self._redis = client
+        self._serializer = serializer or Serializer()
+        self._versions: Dict[str, tuple] = {}
+        self._version_ttl = version_ttl
+        self._default_ttl = default_ttl
+        self._origin = uuid.uuid4().hex
+        self._channel = f"{CACHE_KEY_PREFIX}:cache:invalidate"
+        self._listener_task: Optional[asyncio.Task] = None
+        # Namespaces invalidated while Redis was unreachable
+        self._unsent_invalidations: Set[str] = set()
+        self._last_error_log = 0.0
+        self._stats["errors"] = 0
+
+    def _key(self, namespace: str, version: int, key: str) -> str:
+        return f"{CACHE_KEY_PREFIX}:{namespace}:{version}:{key}"
+
+    def _version_key(self, namespace: str) -> str:
+        return f"{CACHE_KEY_PREFIX}:{namespace}:version"
+
+    async def start(self):
+        if self._listener_task is None:
+            self._listener_task = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+
+        close = getattr(self._redis, "aclose", None) or self._redis.close
+        await close()
+
+    async def _listen(self):
+        """Apply invalidations broadcast by other replicas"""
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(self._channel)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    data = json.loads(message["data"])
+                    if data.get("origin") == self._origin:
+                        continue
+                    self._versions[data["namespace"]] = (int(data["version"]), time.monotonic())
+                    self._notify(data["namespace"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Cache invalidation subscription error, reconnecting: {e}")
+                await asyncio.sleep(1)
+            finally:
+                close = getattr(pubsub, "aclose", None) or pubsub.close
+                try:
+                    await close()
+                except Exception:
+                    pass
+
+    def _failed(self, operation: str, error: Exception):
+        """Count a Redis error; logged at most every few seconds"""
+        self._stats["errors"] += 1
+        if time.monotonic() - self._last_error_log >= 10:
+            self._last_error_log = time.monotonic()
+            print(f"Redis cache {operation} failed, using the database: {error}")
+
+    async def version(self, namespace: str) -> int:
+        cached = self._versions.get(namespace)
+        if namespace in self._unsent_invalidations:
+            if await self._send_invalidation(namespace):
+                return self._versions[namespace][0]
+            return cached[0]
+        if cached is not None and time.monotonic() - cached[1] < self._version_ttl:
+            return cached[0]
+
+        try:
+            raw = await self._redis.get(self._version_key(namespace))
+        except self._errors as e:
+            self._failed("version read", e)
+            return cached[0] if cached is not None else 0
+        version = int(raw or 0)
+        self._versions[namespace] = (version, time.monotonic())
+        return version
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        try:
+            raw = await self._redis.get(self._key(namespace, await self.version(namespace), key))
+        except self._errors as e:
+            self._failed("read", e)
+            raw = None
+        if raw is None:
+            self._stats["misses"] += 1
+            return None
+
+        self._stats["hits"] += 1
+        return self._serializer.loads(raw)
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        ttl_ms = max(1, int((ttl or self._default_ttl) * 1000))
+        try:
+            await self._redis.set(
+                self._key(namespace, await self.version(namespace), key),
+                self._serializer.dumps(value),
+                px=ttl_ms
+            )
+        except self._errors as e:
+            self._failed("write", e)
+            return
+        self._stats["sets"] += 1
+
+    async def delete(self, namespace: str, key: str):
+        try:
+            await self._redis.delete(self._key(namespace, await self.version(namespace), key))
+        except self._errors as e:
+            self._failed("delete", e)
+
+    async def invalidate(self, namespace: str):
+        if not await self._send_invalidation(namespace):
+            # Entries of the old version stop being read here; the new
+            # version is sent to Redis (and other replicas) on recovery
+            cached = self._versions.get(namespace)
+            self._versions[namespace] = ((cached[0] if cached else 0) + 1, time.monotonic())
+            self._unsent_invalidations.add(namespace)
+
+        self._stats["invalidations"] += 1
+        self._notify(namespace)
+
+    async def _send_invalidation(self, namespace: str) -> bool:
+        """Bump a namespace's version in Redis and broadcast it; False if Redis is unreachable"""
+        try:
+            version = await self._redis.incr(self._version_key(namespace))
+            local = self._versions.get(namespace)
+            if local is not None and namespace in self._unsent_invalidations and int(version) < local[0]:
+                # Don't go back to a version this replica already moved past
+                version = await self._redis.incrby(self._version_key(namespace), local[0] - int(version))
+            self._versions[namespace] = (int(version), time.monotonic())
+            await self._redis.publish(self._channel, json.dumps({
+                "namespace": namespace,
+                "version": int(version),
+                "origin": self._origin
+            }))
+        except self._errors as e:
+            self._failed("invalidation", e)
+            return False
+        self._unsent_invalidations.discard(namespace)
+        return True
+
+    def stats(self) -> dict:
+        return {**super().stats(), "serializer": self._serializer.name}
+
+
+def create_cache_backend(kind: str = CACHE_BACKEND) -> CacheBackend:
+    """Build the cache backend selected by CACHE_BACKEND"""
+    if kind == "redis":
+        return RedisCacheBackend()
+    if kind != "memory":
+        print(f"Unknown CACHE_BACKEND '{kind}', using in-process memory cache")
+    return LRUCacheBackend()
+
+
+# Global cache backend instance
+cache_backend = create_cache_backend()
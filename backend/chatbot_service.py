@@ -5,6 +5,9 @@ from datetime import datetime
 from models import User, RequestCreate, ChatbotInteraction
 from bson import ObjectId
 import uuid
+from analytics_cache import analytics_cache
+from kb_article_cache import kb_article_cache
+from ticket_events import ticket_events
 
 
 class ChatbotService:
@@ -174,66 +177,65 @@ class ChatbotService:
         return responses[0] if isinstance(responses, list) else responses
 
     async def _search_knowledge_base(self, query: str) -> Optional[str]:
-        """Search knowledge base for relevant articles, prioritizing by helpful votes"""
+        """Knowledge base answer for a query, cached until the knowledge base changes"""
+        cached = await kb_article_cache.get_answer(query)
+        if cached is not None:
+            return cached or None
         try:
-            # Search in questions and answers
-            knowledge = await self.database.knowledgebase.find({
-                "$or": [
-                    {"question": {"$regex": query, "$options": "i"}},
-                    {"answer": {"$regex": query, "$options": "i"}},
-                    {"category": {"$regex": query, "$options": "i"}}
-                ]
-            }).to_list(None)  # Get all matches, not just limited
-
-            if knowledge:
-                # Sort by helpful votes (descending) to prioritize most helpful articles
-                knowledge_sorted = sorted(knowledge, key=lambda x: x.get('helpful_votes', 0), reverse=True)
-                best_match = knowledge_sorted[0]  # Most helpful article
-
-                # Get the article content (support both old and new formats)
-                question = best_match.get('question') or best_match.get('title', 'Article')
-                answer = best_match.get('answer') or best_match.get('content', 'No content available')
-                helpful_votes = best_match.get('helpful_votes', 0)
-
-                # Add helpfulness indicator
-                helpful_indicator = ""
-                if helpful_votes > 0:
-                    helpful_indicator = f" (👍 {helpful_votes} people found this helpful)"
-
-                return f"📚 **{question}**{helpful_indicator}\n\n{answer}"
-
-            # Try keyword matching if no direct matches
-            keywords = self._extract_keywords(query)
-            if keywords:
-                for keyword in keywords:
-                    knowledge = await self.database.knowledgebase.find({
-                        "$or": [
-                            {"question": {"$regex": keyword, "$options": "i"}},
-                            {"answer": {"$regex": keyword, "$options": "i"}},
-                            {"title": {"$regex": keyword, "$options": "i"}},
-                            {"content": {"$regex": keyword, "$options": "i"}}
-                        ]
-                    }).to_list(None)
-
-                    if knowledge:
-                        # Sort by helpful votes and pick the best
-                        knowledge_sorted = sorted(knowledge, key=lambda x: x.get('helpful_votes', 0), reverse=True)
-                        match = knowledge_sorted[0]
-
-                        question = match.get('question') or match.get('title', 'Article')
-                        answer = match.get('answer') or match.get('content', 'No content available')
-                        helpful_votes = match.get('helpful_votes', 0)
-
-                        helpful_indicator = ""
-                        if helpful_votes > 0:
-                            helpful_indicator = f" (👍 {helpful_votes} people found this helpful)"
-
-                        return f"📚 **{question}**{helpful_indicator}\n\n{answer}"
-
-            return None
+            answer = await self._query_knowledge_base(query)
         except Exception as e:
             print(f"Knowledge base search error: {e}")
             return None
+        await kb_article_cache.set_answer(query, answer or "")
+        return answer
+
+    async def _query_knowledge_base(self, query: str) -> Optional[str]:
+        """Search knowledge base for relevant articles, prioritizing by helpful votes"""
+        # Search in questions and answers
+        best_match = await self._most_helpful_match([
+            {"question": {"$regex": query, "$options": "i"}},
+            {"answer": {"$regex": query, "$options": "i"}},
+            {"category": {"$regex": query, "$options": "i"}}
+        ])
+        if best_match:
+            return self._format_article(best_match)
+
+        # Try keyword matching if no direct matches
+        keywords = self._extract_keywords(query)
+        if keywords:
+            for keyword in keywords:
+                match = await self._most_helpful_match([
+                    {"question": {"$regex": keyword, "$options": "i"}},
+                    {"answer": {"$regex": keyword, "$options": "i"}},
+                    {"title": {"$regex": keyword, "$options": "i"}},
+                    {"content": {"$regex": keyword, "$options": "i"}}
+                ])
+                if match:
+                    return self._format_article(match)
+
+        return None
+
+    async def _most_helpful_match(self, conditions: List[dict]) -> Optional[dict]:
+        """The matching article with the most helpful votes, without its HTML content"""
+        return await self.database.knowledgebase.find_one(
+            {"$or": conditions},
+            {"question": 1, "answer": 1, "title": 1, "plain_text": 1, "helpful_votes": 1},
+            sort=[("helpful_votes", -1)]
+        )
+
+    @staticmethod
+    def _format_article(article: dict) -> str:
+        # Get the article content (support both old and new formats)
+        question = article.get('question') or article.get('title', 'Article')
+        answer = article.get('answer') or article.get('plain_text') or 'No content available'
+        helpful_votes = article.get('helpful_votes', 0)
+
+        # Add helpfulness indicator
+        helpful_indicator = ""
+        if helpful_votes > 0:
+            helpful_indicator = f" (👍 {helpful_votes} people found this helpful)"
+
+        return f"📚 **{question}**{helpful_indicator}\n\n{answer}"
 
     def _extract_keywords(self, text: str) -> List[str]:
         """Extract relevant keywords from text"""
@@ -271,6 +273,7 @@ class ChatbotService:
                 "created_at": datetime.utcnow()
             }
             await self.database.chatbot_interactions.insert_one(interaction_data)
+            await analytics_cache.invalidate("chatbot")
         except Exception as e:
             print(f"Error logging chatbot interaction: {e}")
 
@@ -314,6 +317,7 @@ class ChatbotService:
             
             result = await self.database.requests.insert_one(ticket_data)
             ticket_id = str(result.inserted_id)
+            await ticket_events.append(ticket_id, "created", "Ticket created from chatbot escalation", user_id=str(user.id))
             
             # Try to assign to an available agent
             agent = await self.database.agents.find_one({"available": True})
@@ -1,6 +1,8 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timedelta
 from models import TicketUrgency, SLARule
+from notification_service import notification_service
+from ticket_events import ticket_events
 
 MONGO_URL = "mongodb://localhost:27017"
 
@@ -166,23 +168,12 @@ class DatabaseManager:
             "created_at": datetime.now()
         }
         
-        result = await notifications.insert_one(notification)
-        return str(result.inserted_id)
+        return await notification_service.create(notification)
     
     async def add_timeline_entry(self, ticket_id: str, user_id: str, action_type: str, 
                                description: str, metadata: dict = None):
         """Add entry to ticket timeline"""
-        timeline_entry = {
-            "ticket_id": ticket_id,
-            "user_id": user_id,
-            "action_type": action_type,
-            "description": description,
-            "metadata": metadata or {},
-            "created_at": datetime.now()
-        }
-        
-        result = await timeline.insert_one(timeline_entry)
-        return str(result.inserted_id)
+        return await ticket_events.append(ticket_id, action_type, description, user_id=user_id, metadata=metadata)
 
 # Global database manager instance
 db_manager = DatabaseManager()
@@ -48,7 +48,7 @@ class MockDatabase:
             self.data.append(doc)
             return MockResult(doc["_id"])
             
-        async def find_one(self, query):
+        async def find_one(self, query, projection=None, sort=None):
             return self.data[0] if self.data else None
             
         async def update_one(self, query, update):
@@ -0,0 +1,131 @@
+import asyncio
+import os
+from typing import Optional
+from urllib.parse import quote
+
+from fastapi import HTTPException
+from fastapi.responses import FileResponse, Response
+
+from attachment_service import AttachmentService, attachment_service, is_blob_name
+from database import database
+from models import User
+
+# When set (e.g. "/protected-uploads/"), responses carry X-Accel-Redirect and
+# nginx streams the file itself from an `internal` location with sendfile
+ATTACHMENT_X_ACCEL_PREFIX = os.getenv("ATTACHMENT_X_ACCEL_PREFIX", "")
+# Blobs are content-addressed and never change, so clients may keep them for a year
+ATTACHMENT_MAX_AGE_SECONDS = int(os.getenv("ATTACHMENT_MAX_AGE_SECONDS", str(365 * 24 * 3600)))
+LEGACY_ATTACHMENT_MAX_AGE_SECONDS = 3600
+
+
+class AttachmentDownloadService:
+    """Authorizes and serves attachment downloads.
+
+    Content-addressed blobs get a strong ETag (their SHA-256) and long-lived
+    private caching. Range requests and If-Range are handled by FileResponse,
+    or by nginx when X-Accel-Redirect mode is enabled, in which case the
+    backend only performs the authorization check.
+    """
+
+    def __init__(self, storage: AttachmentService = attachment_service,
+                 x_accel_prefix: str = ATTACHMENT_X_ACCEL_PREFIX):
+        self.storage = storage
+        self.x_accel_prefix = x_accel_prefix
+
+    async def find_attachment(self, stored_filename: str, user: User) -> dict:
+        """Return the attachment metadata if `user` may download it.
+
+        Blobs can be shared by several tickets, comments and articles; access
+        through any one of them is enough.
+        """
+        query = {"attachments.stored_filename": stored_filename}
+        projection = {"attachments.$": 1}
+
+        # Knowledge base attachments are readable by every signed-in user
+        article = await database.knowledgebase.find_one(query, projection)
+        if article:
+            return article["attachments"][0]
+
+        # One query per source decides access, however many tickets share the blob
+        staff = user.role in ["agent", "manager", "admin"]
+        ticket_query = query if staff else {**query, "user_id": str(user.id)}
+        ticket = await database.requests.find_one(ticket_query, projection)
+        if ticket:
+            return ticket["attachments"][0]
+
+        comment_query = query
+        if not staff:
+            own_tickets = await database.requests.distinct("_id", {"user_id": str(user.id)})
+            comment_query = {**query, "ticket_id": {"$in": [str(t) for t in own_tickets]},
+                             "is_internal": {"$in": [False, None]}}
+        comment = await database.comments.find_one(comment_query, projection)
+        if comment:
+            return comment["attachments"][0]
+
+        referenced = not staff and (
+            await database.requests.find_one(query, {"_id": 1}) is not None
+            or await database.comments.find_one(query, {"_id": 1}) is not None
+        )
+        if referenced:
+            raise HTTPException(status_code=403, detail="Not authorized")
+        raise HTTPException(status_code=404, detail="Attachment not found")
+
+    def etag_for(self, attachment: dict, variant: Optional[str] = None) -> Optional[str]:
+        if is_blob_name(attachment["stored_filename"]):
+            suffix = f"-{variant}" if variant else ""
+            return f'"{attachment["stored_filename"]}{suffix}"'
+        return None
+
+    def cache_headers(self, attachment: dict, variant: Optional[str] = None) -> dict:
+        headers = {}
+        etag = self.etag_for(attachment, variant)
+        if etag:
+            headers["ETag"] = etag
+            headers["Cache-Control"] = f"private, max-age={ATTACHMENT_MAX_AGE_SECONDS}, immutable"
+        else:
+            headers["Cache-Control"] = f"private, max-age={LEGACY_ATTACHMENT_MAX_AGE_SECONDS}"
+        return headers
+
+    async def build_response(self, attachment: dict, if_none_match: Optional[str] = None,
+                             download: bool = False, variant: Optional[str] = None) -> Response:
+        """Build the file response for an authorized attachment or one of its
+        generated variants ("thumbnail", "preview")"""
+        stored_filename = attachment["stored_filename"]
+        if variant:
+            if not is_blob_name(stored_filename):
+                raise HTTPException(status_code=404, detail="Attachment variant not found")
+            file_path = self.storage.derivative_path(stored_filename, variant)
+        else:
+            file_path = self.storage.path_for(stored_filename)
+        if not await asyncio.to_thread(os.path.isfile, file_path):
+            raise HTTPException(status_code=404, detail="Attachment not found")
+
+        headers = self.cache_headers(attachment, variant)
+        etag = headers.get("ETag")
+        if etag and if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        media_type = attachment.get("content_type") or "application/octet-stream"
+        filename = attachment.get("filename") or stored_filename
+        if variant:
+            media_type = "image/jpeg"
+            filename = f"{os.path.splitext(filename)[0]}-{variant}.jpg"
+        disposition = "attachment" if download else "inline"
+
+        if self.x_accel_prefix:
+            relative_path = os.path.relpath(file_path, self.storage.upload_dir).replace(os.sep, "/")
+            headers["X-Accel-Redirect"] = self.x_accel_prefix.rstrip("/") + "/" + quote(relative_path)
+            headers["Content-Disposition"] = f"{disposition}; filename*=utf-8''{quote(filename)}"
+            return Response(status_code=200, media_type=media_type, headers=headers)
+
+        return FileResponse(
+            file_path,
+            media_type=media_type,
+            filename=filename,
+            content_disposition_type=disposition,
+            headers=headers
+        )
+
+
+# Global download service instance
+download_service = AttachmentDownloadService()
@@ -0,0 +1,268 @@
+import asyncio
+import os
+import random
+import re
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from bson import ObjectId
+
+from database import database
+
+# Number of MinHash permutations, split into LSH bands of equal size. More bands
+# find less similar pairs; more rows per band make candidates more precise.
+DUPLICATE_MINHASH_PERMUTATIONS = int(os.getenv("DUPLICATE_MINHASH_PERMUTATIONS", "64"))
+DUPLICATE_LSH_BANDS = int(os.getenv("DUPLICATE_LSH_BANDS", "16"))
+# Estimated Jaccard similarity (of character shingles) to report a possible duplicate
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.5"))
+# Link new tickets to the incident they duplicate instead of assigning them
+DUPLICATE_AUTO_LINK = os.getenv("DUPLICATE_AUTO_LINK", "false").lower() == "true"
+DUPLICATE_LINK_THRESHOLD = float(os.getenv("DUPLICATE_LINK_THRESHOLD", "0.8"))
+# How often to pick up signatures stored by other replicas
+DUPLICATE_REFRESH_SECONDS = float(os.getenv("DUPLICATE_REFRESH_SECONDS", "5"))
+
+SHINGLE_SIZE = 3
+# Long descriptions add little once this much text has been shingled
+MAX_TEXT_LENGTH = 1000
+CLOSED_STATUSES = ["resolved", "closed"]
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^\w]+", " ", text.lower()).split())
+
+
+def shingles(title: str, description: str) -> Set[int]:
+    """Hashed character shingles of a ticket's normalized title and description"""
+    text = normalize(f"{title} {description}")[:MAX_TEXT_LENGTH]
+    if len(text) < SHINGLE_SIZE:
+        return {zlib.crc32(text.encode())}
+    return {zlib.crc32(text[i:i + SHINGLE_SIZE].encode()) for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+class DuplicateDetector:
+    """Near-duplicate ticket detection with MinHash and LSH.
+
+    Every open ticket has a MinHash signature of its normalized title and
+    description in `ticket_signatures`. The signatures are also kept in an
+    in-memory LSH index (signature bands -> ticket ids), so finding the
+    candidates for a new ticket is a few dict lookups; candidates are then
+    ranked by the fraction of matching signature values, which estimates
+    their Jaccard similarity.
+
+    New tickets get `possible_duplicates`; with DUPLICATE_AUTO_LINK, a ticket
+    close enough to an open one gets its `parent_ticket_id` (the root incident)
+    and is not assigned separately. Closing a ticket drops it from the index.
+    Each replica loads the index at startup and picks up signatures stored by
+    the others every DUPLICATE_REFRESH_SECONDS.
+    """
+
+    def __init__(self, permutations: int = DUPLICATE_MINHASH_PERMUTATIONS, bands: int = DUPLICATE_LSH_BANDS,
+                 threshold: float = DUPLICATE_THRESHOLD, auto_link: bool = DUPLICATE_AUTO_LINK,
+                 link_threshold: float = DUPLICATE_LINK_THRESHOLD, refresh_seconds: float = DUPLICATE_REFRESH_SECONDS):
+        if permutations % bands:
+            raise ValueError("DUPLICATE_MINHASH_PERMUTATIONS must be a multiple of DUPLICATE_LSH_BANDS")
+        self.bands = bands
+        self.rows = permutations // bands
+        self.threshold = threshold
+        self.auto_link = auto_link
+        self.link_threshold = link_threshold
+        self.refresh_seconds = refresh_seconds
+
+        # Fixed seed: signatures are stored and compared across processes and restarts
+        rng = random.Random(1729)
+        self._permutations = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(permutations)
+        ]
+        self._buckets: List[Dict[tuple, Set[str]]] = [defaultdict(set) for _ in range(bands)]
+        self._signatures: Dict[str, List[int]] = {}
+        self._parents: Dict[str, Optional[str]] = {}
+        # Signatures computed by `check` for tickets not stored yet
+        self._unsaved: Dict[str, List[int]] = {}
+        self._loaded_until = datetime.min
+        self._last_refresh = 0.0
+        self._stats = {"checked": 0, "flagged": 0, "linked": 0}
+
+    def signature(self, title: str, description: str) -> List[int]:
+        hashes = shingles(title, description)
+        return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self._permutations]
+
+    def signatures(self, tickets: List[dict]) -> List[List[int]]:
+        return [self.signature(ticket.get("title", ""), ticket.get("description", "")) for ticket in tickets]
+
+    def similarity(self, first: List[int], second: List[int]) -> float:
+        return sum(1 for x, y in zip(first, second) if x == y) / len(first)
+
+    def _bands(self, signature: List[int]):
+        for band in range(self.bands):
+            yield band, tuple(signature[band * self.rows:(band + 1) * self.rows])
+
+    def _add(self, ticket_id: str, signature: List[int], parent_ticket_id: Optional[str] = None):
+        if ticket_id in self._signatures:
+            return
+        self._signatures[ticket_id] = signature
+        self._parents[ticket_id] = parent_ticket_id
+        for band, key in self._bands(signature):
+            self._buckets[band][key].add(ticket_id)
+
+    def _remove(self, ticket_id: str):
+        signature = self._signatures.pop(ticket_id, None)
+        self._parents.pop(ticket_id, None)
+        if signature is None:
+            return
+        for band, key in self._bands(signature):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(ticket_id)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    def candidates(self, signature: List[int]) -> List[tuple]:
+        """(ticket_id, similarity) of indexed tickets above the threshold, most similar first"""
+        found = set()
+        for band, key in self._bands(signature):
+            found.update(self._buckets[band].get(key, ()))
+        scored = [(ticket_id, self.similarity(signature, self._signatures[ticket_id])) for ticket_id in found]
+        return sorted([c for c in scored if c[1] >= self.threshold], key=lambda c: c[1], reverse=True)
+
+    async def start(self):
+        """Load the signatures of open tickets, computing any that are missing"""
+        await self._refresh(force=True)
+
+        unsigned = [ticket async for ticket in database.requests.find(
+            {"status": {"$nin": CLOSED_STATUSES}},
+            {"title": 1, "description": 1, "parent_ticket_id": 1, "created_at": 1}
+        ) if str(ticket["_id"]) not in self._signatures]
+        missing = []
+        for ticket, signature in zip(unsigned, await asyncio.to_thread(self.signatures, unsigned)):
+            ticket_id = str(ticket["_id"])
+            self._add(ticket_id, signature, ticket.get("parent_ticket_id"))
+            missing.append(self._signature_document(ticket_id, signature, ticket.get("parent_ticket_id")))
+
+        if missing:
+            await database.ticket_signatures.insert_many(missing, ordered=False)
+            print(f"Computed duplicate detection signatures for {len(missing)} open tickets")
+
+    async def _refresh(self, force: bool = False):
+        if not force and time.monotonic() - self._last_refresh < self.refresh_seconds:
+            return
+        self._last_refresh = time.monotonic()
+
+        # Re-read a little history so signatures stored slightly out of order aren't missed
+        since = self._loaded_until - timedelta(seconds=self.refresh_seconds) if self._loaded_until > datetime.min else datetime.min
+        async for document in database.ticket_signatures.find({"created_at": {"$gt": since}}):
+            self._add(document["_id"], document["minhash"], document.get("parent_ticket_id"))
+            self._loaded_until = max(self._loaded_until, document["created_at"])
+
+    @staticmethod
+    def _signature_document(ticket_id: str, signature: List[int], parent_ticket_id: Optional[str]) -> dict:
+        return {
+            "_id": ticket_id,
+            "minhash": signature,
+            "parent_ticket_id": parent_ticket_id,
+            "created_at": datetime.utcnow()
+        }
+
+    async def check(self, tickets: List[dict]):
+        """Annotate new ticket documents (with `_id` set, not yet inserted).
+
+        Sets `possible_duplicates` ([{ticket_id, similarity}]) and, with
+        auto-linking, `parent_ticket_id`. Tickets earlier in `tickets` count as
+        open, so bursts arriving in one batch are linked too. Call `save`
+        once the tickets are stored, and `discard` (in a finally) for tickets
+        that may not have been.
+        """
+        await self._refresh()
+        batch = {str(ticket["_id"]) for ticket in tickets}
+        verified: Set[str] = set()
+        # Hashing is CPU-bound; keep it off the event loop
+        signatures = await asyncio.to_thread(self.signatures, tickets)
+
+        for ticket, signature in zip(tickets, signatures):
+            ticket_id = str(ticket["_id"])
+            self._unsaved[ticket_id] = signature
+            matches = self.candidates(signature)
+            self._stats["checked"] += 1
+
+            # The index may still hold tickets another replica has closed
+            unverified = [t for t, _ in matches if t not in batch and t not in verified]
+            if unverified:
+                still_open = await database.requests.distinct("_id", {
+                    "_id": {"$in": [ObjectId(t) for t in unverified if ObjectId.is_valid(t)]},
+                    "status": {"$nin": CLOSED_STATUSES}
+                })
+                verified.update(str(t) for t in still_open)
+                for stale in set(unverified) - verified:
+                    self._remove(stale)
+                matches = [(t, s) for t, s in matches if t in batch or t in verified]
+
+            ticket["possible_duplicates"] = [
+                {"ticket_id": t, "similarity": round(s, 3)} for t, s in matches[:5]
+            ]
+            parent = None
+            if matches:
+                self._stats["flagged"] += 1
+                best, score = matches[0]
+                if self.auto_link and score >= self.link_threshold:
+                    parent = self._parents.get(best) or best
+                    ticket["parent_ticket_id"] = parent
+                    self._stats["linked"] += 1
+            self._add(ticket_id, signature, parent)
+
+    async def save(self, tickets: List[dict]):
+        """Store the signatures computed by `check` for tickets now in the database"""
+        documents = [
+            self._signature_document(str(ticket["_id"]), self._unsaved.pop(str(ticket["_id"])), ticket.get("parent_ticket_id"))
+            for ticket in tickets if str(ticket["_id"]) in self._unsaved
+        ]
+        if documents:
+            await database.ticket_signatures.insert_many(documents, ordered=False)
+
+    def discard(self, tickets: List[dict]):
+        """Forget checked tickets that were never saved (their insert failed)"""
+        for ticket in tickets:
+            ticket_id = str(ticket["_id"])
+            if self._unsaved.pop(ticket_id, None) is not None:
+                self._remove(ticket_id)
+
+    @staticmethod
+    def link_events(tickets: List[dict], user_id: str) -> List[dict]:
+        """Timeline events (for append_many) recording the links set by `check`"""
+        events = []
+        for ticket in tickets:
+            parent = ticket.get("parent_ticket_id")
+            if parent:
+                ticket_id = str(ticket["_id"])
+                events.append({
+                    "ticket_id": ticket_id,
+                    "action_type": "linked",
+                    "description": f"Linked to incident #{parent[:8]} as a duplicate",
+                    "user_id": user_id,
+                    "metadata": {"parent_ticket_id": parent}
+                })
+                events.append({
+                    "ticket_id": parent,
+                    "action_type": "duplicate_linked",
+                    "description": f"Duplicate ticket #{ticket_id[:8]} linked",
+                    "user_id": user_id,
+                    "metadata": {"ticket_id": ticket_id}
+                })
+        return events
+
+    async def forget(self, ticket_ids: List[str]):
+        """Stop matching closed tickets"""
+        for ticket_id in ticket_ids:
+            self._remove(ticket_id)
+        if ticket_ids:
+            await database.ticket_signatures.delete_many({"_id": {"$in": list(ticket_ids)}})
+
+    def stats(self) -> dict:
+        return {**self._stats, "indexed": len(self._signatures)}
+
+
+# Global duplicate detector instance
+duplicate_detector = DuplicateDetector()
@@ -0,0 +1,32 @@
+from pymongo.errors import OperationFailure
+
+from database import database
+
+
+async def ensure_ttl_index(collection, field: str, expire_after_seconds: int):
+    """Create the TTL index on `field`, or change its expiry to match the setting.
+
+    mongo-init creates these indexes with default expiries; an existing index is
+    changed in place with collMod, and a plain (non-TTL) index on the field is
+    replaced.
+    """
+    key = [(field, 1)]
+    existing = next((info for info in (await collection.index_information()).values()
+                     if info["key"] == key), None)
+
+    if existing is not None and "expireAfterSeconds" in existing:
+        if existing["expireAfterSeconds"] == expire_after_seconds:
+            return
+        try:
+            await database.command({
+                "collMod": collection.name,
+                "index": {"keyPattern": {field: 1}, "expireAfterSeconds": expire_after_seconds}
+            })
+            print(f"Set {collection.name}.{field} TTL to {expire_after_seconds}s")
+            return
+        except OperationFailure as e:
+            print(f"Could not change {collection.name}.{field} TTL in place, recreating the index: {e}")
+
+    if existing is not None:
+        await collection.drop_index(key)
+    await collection.create_index(key, expireAfterSeconds=expire_after_seconds)
@@ -0,0 +1,110 @@
+import hashlib
+import os
+from typing import Optional
+
+from bson import ObjectId
+
+from cache_backend import CacheBackend, Serializer, cache_backend
+from database import database
+from kb_counters import kb_counters
+
+# How long a cached article (and its view/vote counts) may be served; edits
+# made through the API invalidate it straight away
+KB_ARTICLE_CACHE_TTL_SECONDS = float(os.getenv("KB_ARTICLE_CACHE_TTL_SECONDS", "300"))
+
+ARTICLE_NAMESPACE = "kb_articles"
+# Chatbot knowledge base answers, keyed by query
+ANSWER_NAMESPACE = "kb_answers"
+
+
+def article_response(article: dict, include_content: bool = True) -> dict:
+    """API representation of a knowledge base article document; list responses
+    leave out the (HTML) content and show the plain-text snippet instead"""
+    response = {
+        "id": str(article["_id"]),
+        "title": article.get("title", article.get("question", "")),  # Backward compatibility
+        "summary": article.get("summary", ""),
+        "snippet": article.get("snippet", ""),
+        "word_count": article.get("word_count", 0),
+        "category": article["category"],
+        "tags": article.get("tags", []),
+        "attachments": article.get("attachments", []),
+        "links": article.get("links", []),
+        "author": article.get("author", ""),
+        "created_at": article.get("created_at"),
+        "updated_at": article.get("updated_at"),
+        "views": article.get("views", 0),
+        "helpful_votes": article.get("helpful_votes", 0),
+        "status": article.get("status", "published")
+    }
+    if include_content:
+        response["content"] = article.get("content", article.get("answer", ""))  # Backward compatibility
+    return response
+
+
+class KnowledgeArticleCache:
+    """Read-through cache of serialized knowledge base article responses.
+
+    An entry holds the article's JSON body, its version (`updated_at`) and an
+    ETag derived from the two, so a hit is served without touching MongoDB or
+    re-shaping the document, and clients revalidate with If-None-Match.
+    Only published articles are cached. Every write path (update, delete,
+    attachment removal, thumbnails) calls `invalidate`, which also drops the
+    chatbot's cached answers. View and vote counts in a cached body are those
+    at the time it was cached; they catch up when the entry expires.
+    """
+
+    def __init__(self, backend: CacheBackend = cache_backend, ttl_seconds: float = KB_ARTICLE_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl_seconds
+        # Bodies are sent as JSON whatever CACHE_SERIALIZER the backend uses
+        self.serializer = Serializer("orjson")
+
+    @staticmethod
+    def etag(article_id: str, version) -> str:
+        digest = hashlib.sha1(f"{article_id}:{version}".encode()).hexdigest()
+        return f'W/"{digest}"'
+
+    async def get(self, article_id: str) -> Optional[dict]:
+        """{"body", "etag", "version", "status"} for an article, or None if it doesn't exist"""
+        entry = await self.backend.get(ARTICLE_NAMESPACE, article_id)
+        if entry is not None:
+            return entry
+
+        article = await database.knowledgebase.find_one({"_id": ObjectId(article_id)})
+        if not article:
+            return None
+        kb_counters.apply_pending(article)
+
+        version = article.get("updated_at") or article.get("created_at")
+        entry = {
+            # Stored as text: not every cache serializer round-trips bytes
+            "body": self.serializer.dumps(article_response(article)).decode(),
+            "etag": self.etag(article_id, version),
+            "version": version,
+            "status": article.get("status", "published")
+        }
+        if entry["status"] == "published":
+            await self.backend.set(ARTICLE_NAMESPACE, article_id, entry, ttl=self.ttl)
+        return entry
+
+    async def invalidate(self, article_id: Optional[str] = None):
+        """Drop an article's cached response (if given) and all chatbot answers"""
+        if article_id is not None:
+            await self.backend.delete(ARTICLE_NAMESPACE, article_id)
+        await self.backend.invalidate(ANSWER_NAMESPACE)
+
+    async def get_answer(self, query: str) -> Optional[str]:
+        return await self.backend.get(ANSWER_NAMESPACE, self._answer_key(query))
+
+    async def set_answer(self, query: str, answer: str):
+        """Cache a chatbot answer; "" records that nothing matched"""
+        await self.backend.set(ANSWER_NAMESPACE, self._answer_key(query), answer, ttl=self.ttl)
+
+    @staticmethod
+    def _answer_key(query: str) -> str:
+        return hashlib.sha1(query.encode()).hexdigest()
+
+
+# Global knowledge base article cache instance
+kb_article_cache = KnowledgeArticleCache()
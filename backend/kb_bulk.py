@@ -0,0 +1,436 @@
+"""Bulk knowledge base import and export.
+
+Archives are ZIP files holding the articles as NDJSON parts
+(`articles/00001.ndjson`, ...) and each attachment once under
+`attachments/<sha256>`; an article's attachment entries name their file with
+`path`. Plain NDJSON (no files) is accepted as well; its attachments must name
+blobs already stored here by `sha256`.
+
+    python kb_bulk.py import archive.zip [--author admin@example.com]
+    python kb_bulk.py export archive.zip [--status published]
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from attachment_service import AttachmentService, attachment_service, is_blob_name
+from bulk_ticket_service import LineTooLongError
+from cache_backend import Serializer
+from database import database
+from kb_article_cache import kb_article_cache
+from kb_facets import kb_facets
+from kb_revisions import kb_revisions
+from kb_text import text_projection
+from models import KnowledgeImport
+
+# Articles validated and inserted per insert_many
+KB_IMPORT_BATCH_SIZE = int(os.getenv("KB_IMPORT_BATCH_SIZE", "500"))
+# Threads hashing and storing attachments during imports
+KB_IMPORT_WORKERS = int(os.getenv("KB_IMPORT_WORKERS", "4"))
+# Largest archive accepted by the import endpoint
+KB_IMPORT_MAX_BYTES = int(os.getenv("KB_IMPORT_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+EXPORT_FIELDS = ("title", "content", "summary", "category", "tags", "links", "author", "status",
+                 "created_at", "updated_at", "views", "helpful_votes")
+EXPORT_CHUNK_SIZE = 1024 * 1024
+
+
+class _ChunkSink:
+    """Write-only file object collecting what ZipFile writes until it is drained"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+class KnowledgeBulkService:
+    """Import and export many knowledge base articles at once.
+
+    Imports are read line by line and handled in batches of
+    KB_IMPORT_BATCH_SIZE: each batch is validated, its attachments are hashed
+    and stored by a pool of KB_IMPORT_WORKERS threads (each file once, however
+    many articles use it), the articles are inserted with one insert_many,
+    the blob references are taken with one bulk_write and the revision
+    history is started with one more insert_many. Facet counts and cached
+    chatbot answers are rebuilt once at the end rather than per article.
+
+    Exports stream from a cursor: the ZIP is written part by part while it is
+    sent, so neither format is ever held in memory whole.
+    """
+
+    def __init__(self, storage: AttachmentService = attachment_service, batch_size: int = KB_IMPORT_BATCH_SIZE,
+                 workers: int = KB_IMPORT_WORKERS):
+        self.storage = storage
+        self.batch_size = batch_size
+        self.workers = workers
+        self.serializer = Serializer("orjson")
+
+    async def import_lines(self, lines: AsyncIterable[str], author: str,
+                           archive: Optional[zipfile.ZipFile] = None) -> dict:
+        """Import articles from NDJSON lines; `archive` holds the files their
+        attachments' `path`s point to.
+
+        Returns the created ids in input order (None for rejected lines), the
+        errors by line number (counting non-blank lines) and the inserted
+        articles (for thumbnail generation).
+        """
+        ids: List[Optional[str]] = []
+        errors: List[dict] = []
+        batch: List[Tuple[int, KnowledgeImport]] = []
+        inserted: List[dict] = []
+        # ZIP member path -> (digest, size), for files stored by earlier batches
+        stored: Dict[str, Tuple[str, int]] = {}
+        started = time.perf_counter()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                try:
+                    async for line in lines:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        ids.append(None)
+                        try:
+                            batch.append((len(ids), KnowledgeImport(**json.loads(line))))
+                        except (ValueError, TypeError, ValidationError) as e:
+                            errors.append({"line": len(ids), "error": str(e)})
+                            continue
+
+                        if len(batch) >= self.batch_size:
+                            inserted += await self._import_batch_or_report(batch, ids, errors, author, archive, stored, pool)
+                            batch = []
+                except LineTooLongError as e:
+                    errors.append({"line": len(ids) + 1, "error": f"{e}; this line and any after it were not read"})
+                if batch:
+                    inserted += await self._import_batch_or_report(batch, ids, errors, author, archive, stored, pool)
+        finally:
+            # Earlier batches are stored whatever happened to later ones
+            if inserted:
+                await kb_facets.rebuild()
+                await kb_article_cache.invalidate()
+        return {"ids": ids, "created": len(inserted), "errors": errors, "articles": inserted,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000)}
+
+    async def _import_batch_or_report(self, batch: List[Tuple[int, KnowledgeImport]], ids: List[Optional[str]],
+                                      errors: List[dict], *args) -> List[dict]:
+        """`_import_batch`, reporting a batch the database rejected as errors of its lines"""
+        try:
+            return await self._import_batch(batch, ids, errors, *args)
+        except PyMongoError as e:
+            # `_import_batch` only fills `ids` once the batch is stored
+            errors.extend({"line": line_number, "error": f"Not imported: {e}"} for line_number, _ in batch)
+            return []
+
+    async def _import_batch(self, batch: List[Tuple[int, KnowledgeImport]], ids: List[Optional[str]],
+                            errors: List[dict], author: str, archive: Optional[zipfile.ZipFile],
+                            stored: Dict[str, Tuple[str, int]], pool: ThreadPoolExecutor) -> List[dict]:
+        loop = asyncio.get_running_loop()
+
+        # Stage every new file of the batch concurrently
+        paths = {a["path"] for _, article in batch for a in article.attachments
+                 if a.get("path") and a["path"] not in stored}
+        staged: Dict[str, Tuple[str, int, str]] = {}
+        failed: Dict[str, str] = {}
+        if paths and archive is None:
+            failed = {path: "Attachment files need a ZIP archive" for path in paths}
+        elif paths:
+            paths = sorted(paths)
+            results = await asyncio.gather(
+                *[loop.run_in_executor(pool, self._stage_member, archive, path) for path in paths],
+                return_exceptions=True
+            )
+            for path, result in zip(paths, results):
+                if isinstance(result, (KeyError, ValueError, OSError, zipfile.BadZipFile)):
+                    failed[path] = str(result)
+                elif isinstance(result, BaseException):
+                    raise result
+                else:
+                    staged[path] = result
+
+        # Attachments given by digest must already be stored
+        digests = {a["sha256"] for _, article in batch for a in article.attachments
+                   if not a.get("path") and is_blob_name(a.get("sha256", ""))}
+        known: Dict[str, int] = {}
+        if digests:
+            async for blob in database.attachment_blobs.find({"_id": {"$in": list(digests)}}, {"size": 1}):
+                known[blob["_id"]] = blob.get("size", 0)
+
+        documents, line_numbers = [], []
+        now = datetime.now()
+        for line_number, article in batch:
+            try:
+                attachments = [self._attachment(a, stored, staged, failed, known) for a in article.attachments]
+            except ValueError as e:
+                errors.append({"line": line_number, "error": str(e)})
+                continue
+
+            document = article.dict(exclude={"attachments"})
+            document.update({
+                "_id": ObjectId(),
+                "attachments": attachments,
+                "author": article.author or author,
+                "created_at": article.created_at or now,
+                "updated_at": article.updated_at or article.created_at or now,
+                "revision": 1,
+                **text_projection(article.content)
+            })
+            documents.append(document)
+            line_numbers.append(line_number)
+
+        try:
+            if documents:
+                await database.knowledgebase.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # Unordered: everything but the reported rows was inserted
+            write_errors = {error["index"]: error for error in e.details.get("writeErrors", [])}
+            for index, error in sorted(write_errors.items()):
+                errors.append({"line": line_numbers[index], "error": error.get("errmsg", "Insert failed")})
+            line_numbers = [n for i, n in enumerate(line_numbers) if i not in write_errors]
+            documents = [d for i, d in enumerate(documents) if i not in write_errors]
+        except BaseException:
+            await asyncio.gather(*[loop.run_in_executor(pool, self.storage.discard_staged, temp_path)
+                                   for _, _, temp_path in staged.values()])
+            raise
+
+        references, sizes = Counter(), {}
+        for document in documents:
+            for attachment in document["attachments"]:
+                references[attachment["sha256"]] += 1
+                sizes[attachment["sha256"]] = attachment["size"]
+        try:
+            # References first, then the files: the order uploads use
+            await self.storage.add_references(references, sizes)
+        finally:
+            # Files only used by rejected articles are not kept
+            await asyncio.gather(*[
+                loop.run_in_executor(pool, self.storage.publish_staged, digest, temp_path) if references[digest]
+                else loop.run_in_executor(pool, self.storage.discard_staged, temp_path)
+                for digest, _, temp_path in staged.values()
+            ])
+        for path, (digest, size, _) in staged.items():
+            if references[digest]:
+                stored[path] = (digest, size)
+
+        try:
+            await kb_revisions.record_many(documents)
+        except PyMongoError as e:
+            # The articles are stored; only their first revision is missing
+            print(f"Knowledge base import could not record revisions: {e}")
+        for line_number, document in zip(line_numbers, documents):
+            ids[line_number - 1] = str(document["_id"])
+        return documents
+
+    def _stage_member(self, archive: zipfile.ZipFile, path: str) -> Tuple[str, int, str]:
+        with archive.open(path) as source:
+            return self.storage.stage_file(source, os.path.basename(path))
+
+    @staticmethod
+    def _attachment(entry: dict, stored: dict, staged: dict, failed: dict, known: dict) -> dict:
+        """Attachment metadata for an import entry; ValueError if its file is missing"""
+        path = entry.get("path")
+        if path:
+            if path in failed:
+                raise ValueError(f"Attachment '{path}': {failed[path]}")
+            digest, size = stored[path] if path in stored else staged[path][:2]
+        else:
+            digest = entry.get("sha256", "")
+            if digest not in known:
+                raise ValueError(f"Attachment '{entry.get('filename', digest)}' is not stored here; include its file")
+            size = known[digest]
+        return {
+            "filename": entry.get("filename") or os.path.basename(path or digest),
+            "stored_filename": digest,
+            "url": f"/attachments/{digest}",
+            "size": size,
+            "content_type": entry.get("content_type"),
+            "sha256": digest
+        }
+
+    async def import_archive(self, archive_path: str, author: str) -> dict:
+        """Import a ZIP export (or a hand-made ZIP with a top-level articles.ndjson)"""
+        try:
+            archive = await asyncio.to_thread(zipfile.ZipFile, archive_path)
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"Not a ZIP archive: {e}")
+        try:
+            parts = sorted(name for name in archive.namelist()
+                           if name == "articles.ndjson" or (name.startswith("articles/") and name.endswith(".ndjson")))
+            if not parts:
+                raise ValueError("The archive has no articles.ndjson or articles/*.ndjson")
+            return await self.import_lines(self._archive_lines(archive, parts), author, archive)
+        finally:
+            archive.close()
+
+    @staticmethod
+    async def _archive_lines(archive: zipfile.ZipFile, parts: List[str]) -> AsyncIterator[str]:
+        for part in parts:
+            data = await asyncio.to_thread(archive.read, part)
+            for line in data.decode("utf-8").splitlines():
+                yield line
+
+    @staticmethod
+    async def spool(chunks: AsyncIterable[bytes], max_bytes: int = KB_IMPORT_MAX_BYTES) -> str:
+        """Write a streamed upload to a temporary file (ZIPs are read from the end);
+        the caller removes it. ValueError past `max_bytes`."""
+        handle = await asyncio.to_thread(tempfile.NamedTemporaryFile, suffix=".zip", delete=False)
+        size = 0
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f"Archives are limited to {max_bytes} bytes")
+                await asyncio.to_thread(handle.write, chunk)
+            await asyncio.to_thread(handle.close)
+        except BaseException:
+            handle.close()
+            os.remove(handle.name)
+            raise
+        return handle.name
+
+    def _export_record(self, article: dict, with_paths: bool) -> dict:
+        record = {"id": str(article["_id"]), **{field: article.get(field) for field in EXPORT_FIELDS if field in article}}
+        record.setdefault("content", article.get("answer", ""))  # Backward compatibility
+        record.setdefault("title", article.get("question", ""))
+        record["attachments"] = []
+        for attachment in article.get("attachments", []):
+            entry = {"filename": attachment.get("filename"), "content_type": attachment.get("content_type"),
+                     "sha256": attachment.get("stored_filename")}
+            if with_paths:
+                entry["path"] = f"attachments/{attachment['stored_filename']}"
+            record["attachments"].append(entry)
+        return record
+
+    def _cursor(self, status: Optional[str]):
+        query = {"status": status} if status else {}
+        return database.knowledgebase.find(query, {"plain_text": 0, "snippet": 0}).sort("_id", 1).batch_size(self.batch_size)
+
+    async def export_ndjson(self, status: Optional[str] = None) -> AsyncIterator[bytes]:
+        """Articles as NDJSON lines, one chunk per batch"""
+        lines = []
+        async for article in self._cursor(status):
+            lines.append(self.serializer.dumps(self._export_record(article, with_paths=False)))
+            if len(lines) >= self.batch_size:
+                yield b"\n".join(lines) + b"\n"
+                lines = []
+        if lines:
+            yield b"\n".join(lines) + b"\n"
+
+    async def export_zip(self, status: Optional[str] = None) -> AsyncIterator[bytes]:
+        """A ZIP archive of the articles and their attachment files, streamed as it is written"""
+        sink = _ChunkSink()
+        archive = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED)
+        written = set()
+        part = 0
+        batch: List[dict] = []
+
+        async def write_batch():
+            nonlocal part
+            part += 1
+            data = b"\n".join(self.serializer.dumps(self._export_record(a, with_paths=True)) for a in batch) + b"\n"
+            await asyncio.to_thread(archive.writestr, f"articles/{part:05d}.ndjson", data)
+            for article in batch:
+                for attachment in article.get("attachments", []):
+                    name = attachment.get("stored_filename")
+                    if name in written:
+                        continue
+                    written.add(name)
+                    await asyncio.to_thread(self._write_attachment, archive, name)
+                    yield sink.drain()
+            yield sink.drain()
+
+        try:
+            async for article in self._cursor(status):
+                batch.append(article)
+                if len(batch) >= self.batch_size:
+                    async for chunk in write_batch():
+                        if chunk:
+                            yield chunk
+                    batch = []
+            if batch:
+                async for chunk in write_batch():
+                    if chunk:
+                        yield chunk
+            await asyncio.to_thread(archive.close)
+            yield sink.drain()
+        finally:
+            if archive.fp is not None:
+                archive.close()
+
+    def _write_attachment(self, archive: zipfile.ZipFile, stored_filename: str):
+        path = self.storage.path_for(stored_filename)
+        if not os.path.exists(path):
+            return
+        # Most attachments (images, PDFs, archives) are compressed already
+        with open(path, "rb") as source, \
+                archive.open(zipfile.ZipInfo(f"attachments/{stored_filename}", date_time=time.localtime()[:6]), "w") as target:
+            while True:
+                chunk = source.read(EXPORT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                target.write(chunk)
+
+
+# Global knowledge base bulk import/export service instance
+kb_bulk = KnowledgeBulkService()
+
+
+async def _export_to_file(path: str, status: Optional[str]):
+    stream = kb_bulk.export_ndjson(status) if path.endswith(".ndjson") else kb_bulk.export_zip(status)
+    with open(path, "wb") as target:
+        async for chunk in stream:
+            target.write(chunk)
+
+
+async def _import_from_file(path: str, author: str):
+    if path.endswith(".ndjson"):
+        async def lines():
+            with open(path, encoding="utf-8") as source:
+                for line in source:
+                    yield line
+        result = await kb_bulk.import_lines(lines(), author)
+    else:
+        result = await kb_bulk.import_archive(path, author)
+    print(f"Imported {result['created']} articles in {result['elapsed_ms'] / 1000:.1f}s")
+    for error in result["errors"][:20]:
+        print(f"  line {error['line']}: {error['error']}")
+    if len(result["errors"]) > 20:
+        print(f"  ... {len(result['errors']) - 20} more errors")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import or export knowledge base articles")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="Import a .zip or .ndjson archive")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--author", default="import", help="Author of articles that don't name one")
+    export_parser = commands.add_parser("export", help="Export to a .zip (with attachments) or .ndjson file")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--status", default=None)
+    args = parser.parse_args()
+
+    if args.command == "import":
+        asyncio.run(_import_from_file(args.path, args.author))
+    else:
+        asyncio.run(_export_to_file(args.path, args.status))
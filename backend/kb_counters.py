@@ -0,0 +1,115 @@
+import asyncio
+import os
+from collections import Counter, defaultdict
+from typing import Dict, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import database
+
+# Buffered view/vote increments are written at most this often
+KB_COUNTER_FLUSH_INTERVAL_MS = float(os.getenv("KB_COUNTER_FLUSH_INTERVAL_MS", "1000"))
+
+COUNTER_FIELDS = ("views", "helpful_votes")
+
+
+class KnowledgeCounterBuffer:
+    """Write-behind buffer for knowledge base article counters.
+
+    Views and helpful votes are added up in memory and written every
+    KB_COUNTER_FLUSH_INTERVAL_MS as one bulk_write of `$inc` deltas (one
+    update per article, however many hits it got), so reading a popular
+    article no longer writes to its document. Counters shown to clients
+    include the deltas not flushed yet. Until `start()` is called
+    (scripts) increments are written straight away.
+    """
+
+    def __init__(self, flush_interval_ms: float = KB_COUNTER_FLUSH_INTERVAL_MS):
+        self.flush_interval = flush_interval_ms / 1000
+        self._pending: Dict[str, Counter] = defaultdict(Counter)
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"increments": 0, "flushes": 0, "updates": 0, "failed": 0}
+
+    async def start(self):
+        """Start the periodic flusher"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop the flusher and write out everything still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Knowledge counter flush failed, retrying: {e}")
+
+    async def increment(self, article_id: str, field: str, amount: int = 1):
+        if field not in COUNTER_FIELDS:
+            raise ValueError(f"Unknown counter: {field}")
+        self._pending[article_id][field] += amount
+        self._stats["increments"] += 1
+        if self._task is None:
+            await self.flush()
+
+    def pending(self, article_id: str) -> Dict[str, int]:
+        """Deltas for an article that are not stored yet"""
+        return dict(self._pending.get(article_id, {}))
+
+    def apply_pending(self, article: dict) -> dict:
+        """An article document with its unflushed counter deltas added"""
+        for field, delta in self.pending(str(article["_id"])).items():
+            article[field] = article.get(field, 0) + delta
+        return article
+
+    async def flush(self):
+        """Write all buffered deltas with one bulk_write"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, defaultdict(Counter)
+            self._stats["flushes"] += 1
+
+            article_ids = [article_id for article_id in pending if ObjectId.is_valid(article_id)]
+            updates = [UpdateOne({"_id": ObjectId(article_id)}, {"$inc": dict(pending[article_id])})
+                       for article_id in article_ids]
+            if not updates:
+                return
+            try:
+                await database.knowledgebase.bulk_write(updates, ordered=False)
+                self._stats["updates"] += len(updates)
+            except BulkWriteError as e:
+                # Only the failed updates are retried; the others are stored
+                failed = [article_ids[error["index"]] for error in e.details.get("writeErrors", [])]
+                self._stats["failed"] += len(failed)
+                self._requeue({article_id: pending[article_id] for article_id in failed})
+            except Exception:
+                # Nothing is known to be stored: keep every delta for the next flush
+                self._stats["failed"] += len(updates)
+                self._requeue(pending)
+                raise
+
+    def _requeue(self, deltas: Dict[str, Counter]):
+        # On top of anything counted since the flush started
+        for article_id, counts in deltas.items():
+            self._pending[article_id].update(counts)
+
+    def stats(self) -> dict:
+        return {**self._stats, "pending_articles": len(self._pending)}
+
+
+# Global knowledge counter buffer instance
+kb_counters = KnowledgeCounterBuffer()
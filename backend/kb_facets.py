@@ -0,0 +1,102 @@
+import asyncio
+import os
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Optional
+
+from database import database
+
+# How often each replica rebuilds its counts, picking up edits made elsewhere
+KB_FACET_REFRESH_SECONDS = float(os.getenv("KB_FACET_REFRESH_SECONDS", "300"))
+
+FACETS = ("categories", "tags")
+
+
+def article_facets(article: Optional[dict]) -> Dict[str, list]:
+    """Facet values of one article document"""
+    if not article:
+        return {"categories": [], "tags": []}
+    category = article.get("category")
+    return {
+        "categories": [category] if category else [],
+        # An article tagged twice with the same tag counts once
+        "tags": list(dict.fromkeys(article.get("tags") or []))
+    }
+
+
+def count_facets(articles: Iterable[dict]) -> Dict[str, Dict[str, int]]:
+    """{"categories": {name: count}, "tags": {name: count}} over some articles"""
+    counts = {facet: Counter() for facet in FACETS}
+    for article in articles:
+        for facet, values in article_facets(article).items():
+            counts[facet].update(values)
+    return {facet: dict(counts[facet].most_common()) for facet in FACETS}
+
+
+class KnowledgeFacets:
+    """In-memory category and tag counts of knowledge base articles, per status.
+
+    Built from one scan at startup and kept current by the create/update/delete
+    endpoints (`replace(old, new)`), so the category and tag lists are served
+    without querying. Each replica rebuilds its counts every
+    KB_FACET_REFRESH_SECONDS to pick up the others' edits.
+    """
+
+    def __init__(self, refresh_seconds: float = KB_FACET_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        # status -> facet -> value -> article count
+        self._counts: Dict[str, Dict[str, Counter]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.rebuild()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.rebuild()
+            except Exception as e:
+                print(f"Knowledge base facet refresh failed: {e}")
+
+    async def rebuild(self):
+        counts: Dict[str, Dict[str, Counter]] = defaultdict(lambda: {facet: Counter() for facet in FACETS})
+        async for article in database.knowledgebase.find({}, {"category": 1, "tags": 1, "status": 1}):
+            for facet, values in article_facets(article).items():
+                counts[article.get("status", "published")][facet].update(values)
+        self._counts = dict(counts)
+
+    def replace(self, old: Optional[dict], new: Optional[dict]):
+        """Account for an article created (old=None), changed or deleted (new=None)"""
+        for article, sign in ((old, -1), (new, 1)):
+            if not article:
+                continue
+            status = article.get("status", "published")
+            by_facet = self._counts.setdefault(status, {facet: Counter() for facet in FACETS})
+            for facet, values in article_facets(article).items():
+                for value in values:
+                    by_facet[facet][value] += sign
+                    if by_facet[facet][value] <= 0:
+                        del by_facet[facet][value]
+
+    def counts(self, facet: str, status: Optional[str] = None) -> Dict[str, int]:
+        """{value: article count} for one facet, most used first; all statuses if none given"""
+        total: Counter = Counter()
+        for article_status, by_facet in self._counts.items():
+            if status is None or article_status == status:
+                total.update(by_facet[facet])
+        return dict(total.most_common())
+
+
+# Global knowledge base facet counts instance
+kb_facets = KnowledgeFacets()
@@ -0,0 +1,233 @@
+import difflib
+import json
+import os
+import re
+import zlib
+from datetime import datetime
+from typing import List, Optional
+
+from pymongo import DESCENDING
+
+from database import database
+
+# A full (compressed) copy of an article is stored every this many revisions;
+# the revisions in between store the change from the previous one
+KB_REVISION_SNAPSHOT_INTERVAL = int(os.getenv("KB_REVISION_SNAPSHOT_INTERVAL", "10"))
+# Per-article storage cap; the oldest revisions are dropped beyond it
+KB_REVISION_MAX_BYTES = int(os.getenv("KB_REVISION_MAX_BYTES", "1000000"))
+KB_REVISION_MAX_COUNT = int(os.getenv("KB_REVISION_MAX_COUNT", "200"))
+# "zlib", or "zstd" (needs the zstandard package)
+KB_REVISION_COMPRESSION = os.getenv("KB_REVISION_COMPRESSION", "zlib")
+
+# Stored whole with every revision; `content` is stored as a delta
+REVISION_FIELDS = ("title", "summary", "category", "tags", "links", "status")
+
+# HTML tags, words and whitespace runs; a lone "<" is a token of its own so
+# the tokens always join back into the original text
+_TOKEN = re.compile(r"<[^>]*>|[^<\s]+|\s+|<")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text or "")
+
+
+def content_delta(old: str, new: str) -> list:
+    """[[start, end, replacement]]: token ranges of `old` to replace to get `new`"""
+    a, b = tokenize(old), tokenize(new)
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    return [[i1, i2, "".join(b[j1:j2])]
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"]
+
+
+def apply_delta(old: str, delta: list) -> str:
+    tokens = tokenize(old)
+    parts, position = [], 0
+    for start, end, replacement in delta:
+        parts.append("".join(tokens[position:start]))
+        parts.append(replacement)
+        position = end
+    parts.append("".join(tokens[position:]))
+    return "".join(parts)
+
+
+class Codec:
+    """Compress revision payloads with zlib or zstd"""
+
+    def __init__(self, name: str = KB_REVISION_COMPRESSION):
+        if name == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                print("zstandard is not installed, falling back to zlib revision compression")
+                name = "zlib"
+            else:
+                self._zstd = zstandard
+        self.name = name if name == "zstd" else "zlib"
+
+    def compress(self, payload) -> bytes:
+        data = json.dumps(payload, separators=(",", ":")).encode()
+        if self.name == "zstd":
+            return self._zstd.ZstdCompressor(level=10).compress(data)
+        return zlib.compress(data, 9)
+
+    def decompress(self, codec: str, data: bytes):
+        if codec == "zstd":
+            import zstandard
+            raw = zstandard.ZstdDecompressor().decompress(data)
+        else:
+            raw = zlib.decompress(data)
+        return json.loads(raw)
+
+
+class KnowledgeRevisionStore:
+    """Revision history of knowledge base articles in `kb_revisions`.
+
+    Every create/update stores a revision: the small fields as they are, and
+    the (HTML) content either as a compressed snapshot or, for the revisions
+    between snapshots, as a compressed token-level delta from the previous
+    revision. A delta is replaced by a snapshot whenever it would not be
+    smaller. Rebuilding a revision reads its nearest snapshot and the deltas
+    after it in one query. When an article's history exceeds
+    KB_REVISION_MAX_BYTES or KB_REVISION_MAX_COUNT, whole snapshot chains are
+    dropped from the oldest end; the latest chain is always kept.
+    """
+
+    def __init__(self, snapshot_interval: int = KB_REVISION_SNAPSHOT_INTERVAL,
+                 max_bytes: int = KB_REVISION_MAX_BYTES, max_count: int = KB_REVISION_MAX_COUNT,
+                 codec: Optional[Codec] = None):
+        self.snapshot_interval = max(1, snapshot_interval)
+        self.max_bytes = max_bytes
+        self.max_count = max_count
+        self.codec = codec or Codec()
+
+    @staticmethod
+    def next_revision(previous: Optional[dict]) -> int:
+        """Revision number of the next write to an article (articles written
+        before revisions existed count as revision 1)"""
+        if previous is None:
+            return 1
+        return max(previous.get("revision", 0), 1) + 1
+
+    async def record(self, article_id: str, previous: Optional[dict], current: dict, author: str) -> int:
+        """Store `current` (already written) as the revision after `previous`.
+
+        Call after the article write that claimed the number (conditional on
+        the previous one), so concurrent updates can't both record it.
+        """
+        number = self.next_revision(previous)
+        if previous is not None and not previous.get("revision"):
+            await self._store(article_id, 1, None, previous, previous.get("author", ""))
+
+        base = previous.get("content", "") if previous is not None else None
+        await self._store(article_id, number, base, current, author)
+        await self._prune(article_id)
+        return number
+
+    async def record_many(self, articles: List[dict]):
+        """Store new articles (with `_id` and `author`) as their revision 1 with one insert_many"""
+        documents = [self._snapshot_document(str(article["_id"]), 1, article, article.get("author", ""))
+                     for article in articles]
+        if documents:
+            await database.kb_revisions.insert_many(documents, ordered=False)
+
+    def _snapshot_document(self, article_id: str, number: int, article: dict, author: str) -> dict:
+        data = self.codec.compress(article.get("content", ""))
+        return {
+            "article_id": article_id,
+            "revision": number,
+            "kind": "snapshot",
+            "snapshot": number,
+            "codec": self.codec.name,
+            "data": data,
+            "size": len(data),
+            "fields": {field: article.get(field) for field in REVISION_FIELDS},
+            "author": author,
+            "created_at": article.get("updated_at") or datetime.now()
+        }
+
+    async def _store(self, article_id: str, number: int, base: Optional[str], article: dict, author: str):
+        document = self._snapshot_document(article_id, number, article, author)
+
+        if base is not None:
+            # A delta needs the previous revision; one lost to a crash between
+            # the article write and this one forces a snapshot
+            previous = await database.kb_revisions.find_one(
+                {"article_id": article_id, "revision": number - 1}, {"snapshot": 1}
+            )
+            if previous is not None and number - previous["snapshot"] < self.snapshot_interval:
+                delta = self.codec.compress(content_delta(base, article.get("content", "")))
+                if len(delta) < document["size"]:
+                    document.update(kind="delta", snapshot=previous["snapshot"], data=delta, size=len(delta))
+
+        # Replaces a revision left behind by an article write that then failed
+        await database.kb_revisions.replace_one(
+            {"article_id": article_id, "revision": number}, document, upsert=True
+        )
+
+    async def _prune(self, article_id: str):
+        history = await database.kb_revisions.find(
+            {"article_id": article_id}, {"revision": 1, "kind": 1, "size": 1}
+        ).sort("revision", 1).to_list(None)
+        snapshots = [r["revision"] for r in history if r["kind"] == "snapshot"]
+        total_bytes = sum(r["size"] for r in history)
+        total_count = len(history)
+
+        # Revisions before the cut are dropped; cut only at a snapshot so that
+        # every kept delta can still be rebuilt
+        cut = None
+        for snapshot in snapshots[1:]:
+            if total_bytes <= self.max_bytes and total_count <= self.max_count:
+                break
+            dropped = [r for r in history if (cut or 0) <= r["revision"] < snapshot]
+            total_bytes -= sum(r["size"] for r in dropped)
+            total_count -= len(dropped)
+            cut = snapshot
+        if cut is not None:
+            await database.kb_revisions.delete_many({"article_id": article_id, "revision": {"$lt": cut}})
+
+    async def history(self, article_id: str) -> List[dict]:
+        """Revision summaries, newest first"""
+        revisions = await database.kb_revisions.find(
+            {"article_id": article_id}, {"data": 0}
+        ).sort("revision", DESCENDING).to_list(None)
+        return [{
+            "revision": r["revision"],
+            "title": r["fields"].get("title"),
+            "status": r["fields"].get("status"),
+            "author": r.get("author", ""),
+            "created_at": r["created_at"],
+            "kind": r["kind"],
+            "size": r["size"]
+        } for r in revisions]
+
+    async def get(self, article_id: str, number: int) -> Optional[dict]:
+        """An article's fields and content as of a revision, or None if not stored"""
+        target = await database.kb_revisions.find_one(
+            {"article_id": article_id, "revision": number}, {"snapshot": 1}
+        )
+        if target is None:
+            return None
+        chain = await database.kb_revisions.find(
+            {"article_id": article_id, "revision": {"$gte": target["snapshot"], "$lte": number}}
+        ).sort("revision", 1).to_list(None)
+
+        content = ""
+        for revision in chain:
+            payload = self.codec.decompress(revision["codec"], revision["data"])
+            content = payload if revision["kind"] == "snapshot" else apply_delta(content, payload)
+
+        latest = chain[-1]
+        return {
+            "revision": number,
+            **latest["fields"],
+            "content": content,
+            "author": latest.get("author", ""),
+            "created_at": latest["created_at"]
+        }
+
+    async def delete(self, article_id: str):
+        await database.kb_revisions.delete_many({"article_id": article_id})
+
+
+# Global knowledge base revision store instance
+kb_revisions = KnowledgeRevisionStore()
@@ -0,0 +1,48 @@
+import html
+import re
+
+from pymongo import UpdateOne
+
+from database import database
+
+SNIPPET_LENGTH = 240
+
+_INVISIBLE = re.compile(r"<(script|style)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+# Tags that end a block of text: their removal must not glue words together
+_BREAK = re.compile(r"<(?:br|/?(?:p|div|li|ul|ol|h[1-6]|tr|td|th|table|blockquote|pre))\b[^>]*>", re.IGNORECASE)
+_TAG = re.compile(r"<[^>]*>")
+
+
+def plain_text(content: str) -> str:
+    """Readable text of an article's HTML: tags dropped, entities decoded, whitespace collapsed"""
+    text = _INVISIBLE.sub(" ", content or "")
+    text = _TAG.sub("", _BREAK.sub(" ", text))
+    return " ".join(html.unescape(text).split())
+
+
+def snippet(text: str, length: int = SNIPPET_LENGTH) -> str:
+    """`text` cut at a word boundary to at most `length` characters"""
+    if len(text) <= length:
+        return text
+    cut = text[:length].rsplit(" ", 1)[0] or text[:length]
+    return cut.rstrip(" ,.;:") + "…"
+
+
+def text_projection(content: str) -> dict:
+    """Fields stored next to an article's `content` for list, search and chatbot responses"""
+    text = plain_text(content)
+    return {"plain_text": text, "snippet": snippet(text), "word_count": len(text.split())}
+
+
+async def backfill_text_projections():
+    """Add plain_text/snippet/word_count to articles written before they existed"""
+    updates = []
+    async for article in database.knowledgebase.find(
+        {"plain_text": None}, {"content": 1, "answer": 1}
+    ).batch_size(500):
+        # Older articles keep their text in `answer`
+        content = article.get("content", article.get("answer", ""))
+        updates.append(UpdateOne({"_id": article["_id"]}, {"$set": text_projection(content)}))
+    if updates:
+        await database.knowledgebase.bulk_write(updates, ordered=False)
+        print(f"Backfilled plain text on {len(updates)} knowledge base articles")
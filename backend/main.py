@@ -1,26 +1,49 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, Header, BackgroundTasks
+from fastapi import Request as HTTPRequest
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from models import User, Request, RequestCreate, Token, KnowledgeBase, Comment, Notification, Timeline, Department, SLARule, UserCreate, UserInDB, ChatbotInteraction
-from auth import get_current_user, authenticate_user, create_access_token
+from fastapi.responses import StreamingResponse, Response
+from models import User, Request, RequestCreate, Token, KnowledgeBase, Comment, Notification, Timeline, Department, SLARule, UserCreate, UserInDB, ChatbotInteraction, TicketUrgency
+from auth import get_current_user, get_current_user_from_header_or_query, authenticate_user, create_access_token, can_access_ticket
 from database import database
 from sla_service import sla_service
+from query_fanout import QueryFanout
+from analytics_cache import analytics_cache
+from cache_backend import cache_backend
+from attachment_service import attachment_service
+from download_service import download_service
+from thumbnail_service import thumbnail_service, VARIANTS as THUMBNAIL_VARIANTS
+from notification_hub import (
+    notification_hub, serialize_notification, format_sse_event,
+    NOTIFICATION_KEEPALIVE_SECONDS, NOTIFICATION_QUEUE_SIZE
+)
+from notification_service import notification_service
+from ticket_events import ticket_events
+from pagination import encode_cursor, keyset_filter
+from sync_service import sync_service
+from duplicate_detector import duplicate_detector
+from ticket_classifier import ticket_classifier
+from ticket_search import ticket_search
+from kb_article_cache import article_response, kb_article_cache
+from kb_bulk import kb_bulk
+from kb_counters import kb_counters
+from kb_facets import count_facets, kb_facets
+from kb_revisions import REVISION_FIELDS, kb_revisions
+from kb_text import backfill_text_projections, text_projection
+from bulk_ticket_service import bulk_ticket_service, iter_lines, PRIORITIES
 from bson import ObjectId
+import asyncio
+import os
+import hashlib
 from typing import List, Optional
 from datetime import datetime, timedelta
-import os
-import uuid
-import shutil
 
 app = FastAPI(title="HelpMate API", version="1.0.0")
 
-# Create uploads directory if it doesn't exist
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
-# Mount static files for serving uploads
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+# Cached comment totals may lag behind by at most this long after a deletion
+COMMENT_COUNT_TTL_SECONDS = float(os.getenv("COMMENT_COUNT_TTL_SECONDS", "300"))
+# Most notifications returned to callers of GET /notifications that don't paginate
+NOTIFICATION_LEGACY_LIST_LIMIT = int(os.getenv("NOTIFICATION_LEGACY_LIST_LIMIT", "1000"))
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,6 +53,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_background_services():
+    """Connect shared services that need the running event loop"""
+    await cache_backend.start()
+    await notification_hub.start()
+    await notification_service.ensure_indexes()
+    await notification_service.start()
+    await ticket_events.start()
+    await kb_counters.start()
+    await backfill_text_projections()
+    await kb_facets.start()
+    await sync_service.backfill_updated_at()
+    await sync_service.ensure_indexes()
+    await duplicate_detector.start()
+    ticket_classifier.load()
+    await ticket_search.ensure_indexes()
+
+@app.on_event("shutdown")
+async def stop_background_services():
+    """Stop background services and release their connections"""
+    await ticket_events.close()
+    await kb_counters.close()
+    await kb_facets.close()
+    await notification_service.close()
+    await cache_backend.close()
+    await notification_hub.close()
+    thumbnail_service.close()
+
 @app.get("/")
 def read_root():
     return {"message": "Help Desk API is running"}
@@ -96,45 +147,44 @@ async def create_request(request: RequestCreate, current_user: User = Depends(ge
     request_dict["user_id"] = str(current_user.id)
     request_dict["created_at"] = datetime.utcnow()
     request_dict["updated_at"] = datetime.utcnow()
+    # Predicted category/urgency; may set routing_category or raise the urgency
+    ticket_classifier.apply(request_dict)
 
-    # Set SLA based on urgency
-    from models import TicketUrgency
-    urgency = request_dict.get("urgency_level", TicketUrgency.MILD)
-    sla_hours = {TicketUrgency.URGENT: 2, TicketUrgency.MODERATE: 8, TicketUrgency.MILD: 24}
-    request_dict["sla_due_date"] = datetime.utcnow() + timedelta(hours=sla_hours[urgency])
+    set_sla_due_date(request_dict)
 
-    result = await database.requests.insert_one(request_dict)
+    request_dict["_id"] = ObjectId()
+    try:
+        await duplicate_detector.check([request_dict])
+        result = await database.requests.insert_one(request_dict)
+        await duplicate_detector.save([request_dict])
+    finally:
+        duplicate_detector.discard([request_dict])
+    await ticket_events.append_many(
+        [{"ticket_id": str(result.inserted_id), "action_type": "created", "description": "Ticket created", "user_id": str(current_user.id)}]
+        + duplicate_detector.link_events([request_dict], str(current_user.id))
+    )
     request_dict["_id"] = str(result.inserted_id)
 
-    # Skill-based agent assignment
-    assigned_agent = await assign_agent_to_ticket(str(result.inserted_id), request_dict.get("required_skills", []), request_dict.get("category"))
+    # Duplicates linked to an open incident are handled with it rather than assigned
+    assigned_agent = None
+    if not request_dict.get("parent_ticket_id"):
+        # Skill-based agent assignment (logs the assignment and notifies the agent)
+        assigned_agent = await assign_agent_to_ticket(
+            str(result.inserted_id), request_dict.get("required_skills", []),
+            request_dict.get("routing_category") or request_dict.get("category")
+        )
     if assigned_agent:
         request_dict["assigned_agent"] = assigned_agent
         request_dict["status"] = "assigned"
 
-        # Create timeline entry
-        timeline_data = {
-            "ticket_id": str(result.inserted_id),
-            "user_id": assigned_agent,
-            "action_type": "assigned",
-            "description": "Ticket assigned to agent",
-            "created_at": datetime.utcnow()
-        }
-        await database.timeline.insert_one(timeline_data)
-
-        # Create notification for agent
-        notification_data = {
-            "user_id": assigned_agent,
-            "ticket_id": str(result.inserted_id),
-            "type": "ticket_assigned",
-            "title": "New ticket assigned",
-            "message": f"You have been assigned a new ticket: {request_dict.get('title', 'Untitled')}",
-            "created_at": datetime.utcnow()
-        }
-        await database.notifications.insert_one(notification_data)
-
     return Request(**request_dict)
 
+def set_sla_due_date(request_data: dict):
+    """Set the SLA deadline of a new ticket from its (possibly predicted) urgency"""
+    urgency = TicketUrgency(request_data.get("urgency_level") or TicketUrgency.MILD)
+    sla_hours = {TicketUrgency.URGENT: 2, TicketUrgency.MODERATE: 8, TicketUrgency.MILD: 24}
+    request_data["sla_due_date"] = datetime.utcnow() + timedelta(hours=sla_hours[urgency])
+
 async def assign_agent_to_ticket(ticket_id: str, required_skills: List[str], ticket_category: Optional[str] = None) -> Optional[str]:
     """Assign agent to ticket using load-based round robin with category expertise and status filtering"""
 
@@ -217,19 +267,16 @@ async def assign_agent_to_ticket(ticket_id: str, required_skills: List[str], tic
         )
         print(f"Agent {selected_agent['name']} marked as busy (at capacity)")
 
-    # Create timeline entry
-    timeline_data = {
-        "ticket_id": ticket_id,
-        "user_id": agent_id,
-        "action_type": "assigned",
-        "description": f"Ticket assigned to agent via load balancing",
-        "metadata": {
+    await ticket_events.append(
+        ticket_id,
+        "assigned",
+        "Ticket assigned to agent via load balancing",
+        user_id=agent_id,
+        metadata={
             "assignment_method": "load_balanced",
             "category_match": category in (selected_agent.get("categories") or [])
-        },
-        "created_at": datetime.utcnow()
-    }
-    await database.timeline.insert_one(timeline_data)
+        }
+    )
 
     # Create notification for agent
     notification_data = {
@@ -240,13 +287,14 @@ async def assign_agent_to_ticket(ticket_id: str, required_skills: List[str], tic
         "message": f"You have been assigned a new ticket: {ticket.get('title', 'Untitled')}",
         "created_at": datetime.utcnow()
     }
-    await database.notifications.insert_one(notification_data)
+    await notification_service.create(notification_data)
 
     print(f"Successfully assigned ticket {ticket_id} to agent {selected_agent['name']}")
     return agent_id
 
 @app.post("/requests/with-attachments")
 async def create_request_with_attachments(
+    background_tasks: BackgroundTasks,
     title: str = Form(...),
     description: str = Form(...),
     category: str = Form(...),
@@ -257,26 +305,7 @@ async def create_request_with_attachments(
     """Create a new support request with file attachments"""
     try:
         # Handle file uploads
-        attachments = []
-        for file in files:
-            if file.filename:
-                # Generate unique filename
-                file_extension = file.filename.split('.')[-1] if '.' in file.filename else ''
-                unique_filename = f"{uuid.uuid4()}.{file_extension}" if file_extension else str(uuid.uuid4())
-                file_path = os.path.join(UPLOAD_DIR, unique_filename)
-
-                # Save file
-                with open(file_path, "wb") as buffer:
-                    shutil.copyfileobj(file.file, buffer)
-
-                # Add to attachments list
-                attachments.append({
-                    "filename": file.filename,
-                    "stored_filename": unique_filename,
-                    "size": os.path.getsize(file_path),
-                    "content_type": file.content_type,
-                    "url": f"/uploads/{unique_filename}"
-                })
+        attachments = await attachment_service.save_uploads(files)
 
         # Create request
         request_data = {
@@ -287,36 +316,52 @@ async def create_request_with_attachments(
             "priority": priority,
             "status": "open",
             "attachments": attachments,
-            "created_at": datetime.utcnow()
+            "created_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow()
         }
+        # Predicted category/urgency; may set routing_category or raise the urgency
+        ticket_classifier.apply(request_data)
+        set_sla_due_date(request_data)
 
-        result = await database.requests.insert_one(request_data)
+        request_data["_id"] = ObjectId()
+        try:
+            await duplicate_detector.check([request_data])
+            result = await database.requests.insert_one(request_data)
+            await duplicate_detector.save([request_data])
+        finally:
+            duplicate_detector.discard([request_data])
         request_id = str(result.inserted_id)
+        await ticket_events.append_many(
+            [{"ticket_id": request_id, "action_type": "created", "description": "Ticket created", "user_id": str(current_user.id)}]
+            + duplicate_detector.link_events([request_data], str(current_user.id))
+        )
 
-        # Assign to agent round-robin
-        agent = await database.agents.find_one({"available": True})
-        if agent:
-            await database.requests.update_one(
-                {"_id": result.inserted_id},
-                {"$set": {"assigned_agent": agent["user_id"], "status": "assigned"}}
-            )
-            await database.agents.update_one(
-                {"_id": agent["_id"]},
-                {"$set": {"available": False}}
+        # Duplicates linked to an open incident are handled with it rather than assigned
+        if not request_data.get("parent_ticket_id"):
+            # Skill-based agent assignment, as in create_request
+            assigned_agent = await assign_agent_to_ticket(
+                request_id, [], request_data.get("routing_category") or request_data.get("category")
             )
-            request_data["assigned_agent"] = agent["user_id"]
-            request_data["status"] = "assigned"
+            if assigned_agent:
+                request_data["assigned_agent"] = assigned_agent
+                request_data["status"] = "assigned"
 
         request_data["_id"] = request_id
         request_data["id"] = request_id
 
+        # Render thumbnails/previews after the response has been sent
+        background_tasks.add_task(thumbnail_service.generate, "requests", request_id, attachments)
+
         return {
             "message": "Ticket created successfully",
             "ticket_id": request_id,
             "status": request_data["status"],
+            "parent_ticket_id": request_data.get("parent_ticket_id"),
             "attachments_count": len(attachments)
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to create ticket: {str(e)}")
 
@@ -330,9 +375,31 @@ async def get_ticket_categories(current_user: User = Depends(get_current_user)):
     # If no categories in database, return empty list (will be managed via admin interface)
     return {"categories": categories}
 
-@app.get("/requests", response_model=List[Request])
-async def get_requests(current_user: User = Depends(get_current_user)):
-    """Get requests based on user role with appropriate filtering"""
+@app.get("/requests/search")
+async def search_requests(
+    q: str,
+    status: Optional[str] = None,
+    category: Optional[str] = None,
+    agent: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    limit: int = 20,
+    current_user: User = Depends(get_current_user)
+):
+    """Full-text search over the caller's tickets and their comments, best matches first"""
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Search query is empty")
+    scope = await ticket_scope_query(current_user)
+    try:
+        return await ticket_search.search(
+            q, scope, current_user.role, limit=max(1, min(limit, 100)), status=status, category=category,
+            agent=agent, created_from=created_from, created_to=created_to
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+async def ticket_scope_query(current_user: User) -> dict:
+    """Query for the tickets a user works with, based on their role"""
 
     # Client/User: Only their own tickets
     if current_user.role in ["user", "client"]:
@@ -362,6 +429,12 @@ async def get_requests(current_user: User = Depends(get_current_user)):
     else:  # admin or any other role
         query = {}
 
+    return query
+
+@app.get("/requests", response_model=List[Request])
+async def get_requests(current_user: User = Depends(get_current_user)):
+    """Get requests based on user role with appropriate filtering"""
+    query = await ticket_scope_query(current_user)
     requests = await database.requests.find(query).to_list(None)
     return [Request(**{**req, "_id": str(req["_id"])}) for req in requests]
 
@@ -379,12 +452,111 @@ async def update_request(request_id: str, update_data: dict, current_user: User
     # Simple update, in practice add validation
     if current_user.role == "user":
         raise HTTPException(status_code=403, detail="Not authorized")
-    result = await database.requests.update_one({"_id": ObjectId(request_id)}, {"$set": update_data})
-    if result.modified_count == 0:
+    update_data.pop("_id", None)
+    update_data["updated_at"] = datetime.utcnow()
+    previous = await database.requests.find_one_and_update(
+        {"_id": ObjectId(request_id)},
+        {"$set": update_data}
+    )
+    if previous is None:
         raise HTTPException(status_code=404, detail="Request not found")
-    request = await database.requests.find_one({"_id": ObjectId(request_id)})
+    await analytics_cache.invalidate("tickets")
+
+    # The previous agent's workspace drops the ticket on its next sync
+    if "assigned_agent" in update_data and previous.get("assigned_agent") \
+            and previous["assigned_agent"] != update_data["assigned_agent"]:
+        await sync_service.record_removal(request_id, previous["assigned_agent"], "reassigned")
+
+    request = {**previous, **update_data}
     return Request(**{**request, "_id": str(request["_id"])})
 
+# Bulk ticket operations. Each takes {"ids": [...]} plus the operation's
+# fields and reports a result per id.
+
+def bulk_ticket_ids(payload: dict) -> List[str]:
+    try:
+        return bulk_ticket_service.parse_ids(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/requests/bulk")
+async def bulk_create_requests(request: HTTPRequest, current_user: User = Depends(get_current_user)):
+    """Create tickets from an NDJSON body, one RequestCreate object per line.
+
+    Tickets are inserted and assigned in batches as the body streams in; the
+    response lists the created ids in input order (null for rejected lines).
+    """
+    if current_user.role not in ["manager", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return await bulk_ticket_service.create_many(iter_lines(request.stream()), current_user)
+
+@app.post("/requests/bulk/reassign")
+async def bulk_reassign(payload: dict, current_user: User = Depends(get_current_user)):
+    if current_user.role not in ["manager", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    ticket_ids = bulk_ticket_ids(payload)
+
+    agent_id = payload.get("agent_id")
+    agent = await database.users.find_one({"_id": ObjectId(agent_id)}) if ObjectId.is_valid(agent_id or "") else None
+    if not agent or agent.get("role") not in ["agent", "manager", "admin"]:
+        raise HTTPException(status_code=400, detail="'agent_id' must be an existing agent")
+
+    return await bulk_ticket_service.reassign(ticket_ids, agent_id, current_user)
+
+@app.post("/requests/bulk/close")
+async def bulk_close(payload: dict, current_user: User = Depends(get_current_user)):
+    """Close or resolve tickets; agents may only close their own"""
+    if current_user.role not in ["agent", "manager", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    ticket_ids = bulk_ticket_ids(payload)
+
+    status = payload.get("status", "closed")
+    if status not in ["resolved", "closed"]:
+        raise HTTPException(status_code=400, detail="'status' must be 'resolved' or 'closed'")
+
+    return await bulk_ticket_service.close(ticket_ids, status, current_user)
+
+@app.post("/requests/bulk/priority")
+async def bulk_change_priority(payload: dict, current_user: User = Depends(get_current_user)):
+    """Change priority and/or urgency_level; agents may only change their own tickets"""
+    if current_user.role not in ["agent", "manager", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    ticket_ids = bulk_ticket_ids(payload)
+
+    priority = payload.get("priority")
+    if priority is not None and priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"'priority' must be one of {sorted(PRIORITIES)}")
+    urgency_level = payload.get("urgency_level")
+    if urgency_level is not None:
+        try:
+            urgency_level = TicketUrgency(urgency_level)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="'urgency_level' must be 1, 2 or 3")
+    if priority is None and urgency_level is None:
+        raise HTTPException(status_code=400, detail="Provide 'priority' and/or 'urgency_level'")
+
+    return await bulk_ticket_service.set_priority(ticket_ids, priority, urgency_level, current_user)
+
+@app.post("/requests/bulk/escalate")
+async def bulk_escalate(payload: dict, current_user: User = Depends(get_current_user)):
+    if current_user.role not in ["manager", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return await bulk_ticket_service.escalate(bulk_ticket_ids(payload), current_user)
+
+@app.get("/sync")
+async def sync_workspace(token: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    """Tickets, comments and timeline events changed since `token`.
+
+    Call without a token for a full sync, then pass back the returned token.
+    Keep calling while `has_more` is true. `deleted` lists ticket ids to drop
+    locally; `reset` means the local copy should be replaced.
+    """
+    scope = await ticket_scope_query(current_user)
+    try:
+        return await sync_service.changes(str(current_user.id), current_user.role, scope, token)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+
 @app.post("/escalate/{request_id}")
 async def escalate_request(request_id: str, current_user: User = Depends(get_current_user)):
     request = await database.requests.find_one({"_id": ObjectId(request_id)})
@@ -405,6 +577,7 @@ async def escalate_request(request_id: str, current_user: User = Depends(get_cur
 @app.post("/requests/{request_id}/comments")
 async def add_comment(
     request_id: str,
+    background_tasks: BackgroundTasks,
     content: str = Form(None),
     comment_type: str = Form("comment"),
     is_internal: bool = Form(False),
@@ -424,23 +597,7 @@ async def add_comment(
         raise HTTPException(status_code=403, detail="Not authorized")
 
     # Handle file attachments
-    attachments = []
-    for file in files:
-        if file.filename:
-            file_extension = os.path.splitext(file.filename)[1]
-            unique_filename = f"{uuid.uuid4()}{file_extension}"
-            file_path = os.path.join(UPLOAD_DIR, unique_filename)
-
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-
-            attachments.append({
-                "filename": file.filename,
-                "stored_filename": unique_filename,
-                "url": f"/uploads/{unique_filename}",
-                "size": os.path.getsize(file_path),
-                "content_type": file.content_type
-            })
+    attachments = await attachment_service.save_uploads(files)
 
     # Create comment
     comment_data = {
@@ -455,6 +612,8 @@ async def add_comment(
 
     result = await database.comments.insert_one(comment_data)
     comment_data["_id"] = str(result.inserted_id)
+    for viewer in ("staff", "public"):
+        await cache_backend.delete("comment_counts", f"{request_id}:{viewer}")
 
     # Update request updated_at
     await database.requests.update_one(
@@ -462,16 +621,13 @@ async def add_comment(
         {"$set": {"updated_at": datetime.utcnow()}}
     )
 
-    # Create timeline entry
-    timeline_data = {
-        "ticket_id": request_id,
-        "user_id": str(current_user.id),
-        "action_type": "commented",
-        "description": f"Added a {comment_type} comment",
-        "metadata": {"comment_id": str(result.inserted_id)},
-        "created_at": datetime.utcnow()
-    }
-    await database.timeline.insert_one(timeline_data)
+    await ticket_events.append(
+        request_id,
+        "commented",
+        f"Added a {comment_type} comment",
+        user_id=str(current_user.id),
+        metadata={"comment_id": str(result.inserted_id)}
+    )
 
     # Create notification for the other party
     if current_user.role == "client":
@@ -486,7 +642,7 @@ async def add_comment(
                 "metadata": {"comment_id": str(result.inserted_id)},
                 "created_at": datetime.utcnow()
             }
-            await database.notifications.insert_one(notification_data)
+            await notification_service.create(notification_data)
     else:
         # Notify client
         notification_data = {
@@ -498,87 +654,177 @@ async def add_comment(
             "metadata": {"comment_id": str(result.inserted_id)},
             "created_at": datetime.utcnow()
         }
-        await database.notifications.insert_one(notification_data)
+        await notification_service.create(notification_data)
+
+    background_tasks.add_task(thumbnail_service.generate, "comments", str(result.inserted_id), attachments)
 
     return {"message": "Comment added successfully", "comment_id": str(result.inserted_id)}
 
 @app.get("/requests/{request_id}/comments")
-async def get_comments(request_id: str, page: int = 1, limit: int = 50, current_user: User = Depends(get_current_user)):
-    """Get comments for a ticket with pagination"""
+async def get_comments(
+    request_id: str,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    page: Optional[int] = None,
+    include_total: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """Get comments for a ticket, newest first.
+
+    Pass `pagination.next_cursor` from the previous page as `cursor` to get the
+    next one. `include_total` adds the total count (cached for a few minutes).
+    Without a cursor the response also has the `page`, `pages` and `total`
+    older clients expect, and `page` skips to that page; prefer cursors for
+    anything but the first page.
+    """
+    if not ObjectId.is_valid(request_id):
+        raise HTTPException(status_code=404, detail="Request not found")
+    limit = max(1, min(limit, 200))
+
     # Check if request exists and user has access
-    request = await database.requests.find_one({"_id": ObjectId(request_id)})
+    request = await database.requests.find_one({"_id": ObjectId(request_id)}, {"user_id": 1, "assigned_agent": 1})
     if not request:
         raise HTTPException(status_code=404, detail="Request not found")
-
-    # Check permissions
-    if current_user.role == "client" and request["user_id"] != str(current_user.id):
-        raise HTTPException(status_code=403, detail="Not authorized")
-    if current_user.role not in ["agent", "manager", "admin"] and request["assigned_agent"] != str(current_user.id):
+    if not can_access_ticket(current_user, request):
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    # Calculate skip for pagination
-    skip = (page - 1) * limit
-
-    # Get total count for pagination info
-    total_count = await database.comments.count_documents({"ticket_id": request_id})
-
-    # Get comments with pagination, sorted by created_at descending (most recent first)
-    comments = await database.comments.find({"ticket_id": request_id}).sort("created_at", -1).skip(skip).limit(limit).to_list(None)
-
-    # Filter internal comments for clients
-    if current_user.role == "client":
-        comments = [c for c in comments if not c.get("is_internal", False)]
-
-    # Get user information for each comment
-    enriched_comments = []
-    for comment in comments:
-        comment_dict = {"id": str(comment["_id"]), **{k: v for k, v in comment.items() if k != "_id"}}
-
-        # Try to get user name for the comment author
-        try:
-            user = await database.users.find_one({"_id": ObjectId(comment.get("user_id"))})
-            if user:
-                comment_dict["user_name"] = user.get("name", "Unknown User")
-                comment_dict["user_role"] = user.get("role", "unknown")
-            else:
-                comment_dict["user_name"] = "Unknown User"
-                comment_dict["user_role"] = "unknown"
-        except:
-            comment_dict["user_name"] = "Unknown User"
-            comment_dict["user_role"] = "unknown"
-
-        enriched_comments.append(comment_dict)
+    # Internal comments are filtered in the query so pages stay full
+    query = {"ticket_id": request_id}
+    if current_user.role not in ["agent", "manager", "admin"]:
+        query["is_internal"] = {"$in": [False, None]}
+    try:
+        page_query = {**query, **keyset_filter(cursor)}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # Without a cursor this is a page-numbered request (page 1 by default)
+    page = None if cursor else max(1, page or 1)
+    skip = (page - 1) * limit if page else 0
+
+    # Fetch one extra comment to know whether another page exists
+    comments = await database.comments.find(page_query).sort(
+        [("created_at", -1), ("_id", -1)]
+    ).skip(skip).limit(limit + 1).to_list(None)
+    has_more = len(comments) > limit
+    comments = comments[:limit]
+
+    # Resolve all authors in one query
+    author_ids = [ObjectId(c["user_id"]) for c in comments if ObjectId.is_valid(c.get("user_id"))]
+    authors = await database.users.find({"_id": {"$in": author_ids}}, {"name": 1, "role": 1}).to_list(None)
+    users_by_id = {str(a["_id"]): a for a in authors}
+
+    pagination = {
+        "limit": limit,
+        "next_cursor": encode_cursor(comments[-1]) if has_more else None,
+        "has_more": has_more
+    }
+    if include_total or page:
+        pagination["total"] = await count_comments(request_id, query, current_user)
+    if page:
+        pagination["page"] = page
+        pagination["pages"] = (pagination["total"] + limit - 1) // limit
 
     return {
-        "comments": enriched_comments,
-        "pagination": {
-            "page": page,
-            "limit": limit,
-            "total": total_count,
-            "pages": (total_count + limit - 1) // limit  # Ceiling division
-        }
+        "comments": [with_author(c, users_by_id, "Unknown User", "unknown") for c in comments],
+        "pagination": pagination
     }
 
+async def count_comments(request_id: str, query: dict, current_user: User) -> int:
+    """Comment count for a ticket as seen by the user's role, cached until a comment is added"""
+    key = f"{request_id}:{'staff' if 'is_internal' not in query else 'public'}"
+    total = await cache_backend.get("comment_counts", key)
+    if total is None:
+        total = await database.comments.count_documents(query)
+        await cache_backend.set("comment_counts", key, total, ttl=COMMENT_COUNT_TTL_SECONDS)
+    return total
+
 # Notification Endpoints
 
 @app.get("/notifications")
-async def get_notifications(current_user: User = Depends(get_current_user)):
-    """Get notifications for current user"""
-    notifications = await database.notifications.find(
-        {"user_id": str(current_user.id)}
-    ).sort("created_at", -1).to_list(None)
+async def get_notifications(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    unread_only: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """Get notifications for current user, newest first.
+
+    With `limit` or `cursor`, returns one page (`notifications`, `pagination`,
+    `unread_count`); pass `pagination.next_cursor` as `cursor` to get the next
+    one. Without either, returns the plain list as before pagination existed
+    (at most NOTIFICATION_LEGACY_LIST_LIMIT notifications).
+    """
+    if limit is None and cursor is None:
+        page = await notification_service.list(str(current_user.id), NOTIFICATION_LEGACY_LIST_LIMIT, None, unread_only)
+        return page["notifications"]
+
+    limit = max(1, min(limit or 50, 200))
+    try:
+        return await notification_service.list(str(current_user.id), limit, cursor, unread_only)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/notifications/unread-count")
+async def get_unread_notification_count(current_user: User = Depends(get_current_user)):
+    """Get the number of unread notifications for current user"""
+    return {"unread_count": await notification_service.unread_count(str(current_user.id))}
+
+@app.put("/notifications/read")
+async def mark_notifications_read(payload: Optional[dict] = None, current_user: User = Depends(get_current_user)):
+    """Mark several notifications as read in one call.
+
+    Body `{"ids": [...]}` marks those notifications; without ids, all of them.
+    """
+    ids = (payload or {}).get("ids")
+    updated = await notification_service.mark_many_read(str(current_user.id), ids)
+    return {
+        "message": f"{updated} notifications marked as read",
+        "updated": updated,
+        "unread_count": await notification_service.unread_count(str(current_user.id))
+    }
 
-    return [{"id": str(n["_id"]), **{k: v for k, v in n.items() if k != "_id"}} for n in notifications]
+@app.get("/notifications/stream")
+async def stream_notifications(
+    last_event_id: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user_from_header_or_query)
+):
+    """Server-sent event stream of new notifications for the current user.
+
+    EventSource can't send headers, so the token may be passed as `access_token`.
+    On reconnect the browser sends Last-Event-ID and missed notifications are replayed.
+    """
+    user_id = str(current_user.id)
+
+    async def event_stream():
+        # Subscribe before replaying so nothing falls between the two
+        async with notification_hub.subscribe(user_id) as queue:
+            yield "retry: 5000\n\n"
+
+            if last_event_id and ObjectId.is_valid(last_event_id):
+                missed = await database.notifications.find(
+                    {"user_id": user_id, "_id": {"$gt": ObjectId(last_event_id)}}
+                ).sort("_id", 1).to_list(NOTIFICATION_QUEUE_SIZE)
+                for notification in missed:
+                    yield format_sse_event(serialize_notification(notification))
+
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=NOTIFICATION_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse_event(payload)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.put("/notifications/{notification_id}/read")
 async def mark_notification_read(notification_id: str, current_user: User = Depends(get_current_user)):
     """Mark a notification as read"""
-    result = await database.notifications.update_one(
-        {"_id": ObjectId(notification_id), "user_id": str(current_user.id)},
-        {"$set": {"is_read": True}}
-    )
-
-    if result.modified_count == 0:
+    if not await notification_service.mark_read(str(current_user.id), notification_id):
         raise HTTPException(status_code=404, detail="Notification not found")
 
     return {"message": "Notification marked as read"}
@@ -599,8 +845,8 @@ async def get_timeline(request_id: str, current_user: User = Depends(get_current
     if current_user.role not in ["agent", "manager", "admin"] and request["assigned_agent"] != str(current_user.id):
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    # Get timeline entries
-    timeline = await database.timeline.find({"ticket_id": request_id}).sort("created_at", 1).to_list(None)
+    # Get timeline entries (the ticket's event log, in sequence order)
+    timeline = await ticket_events.list_events(request_id)
 
     # Get user information for each timeline event
     enriched_timeline = []
@@ -624,6 +870,98 @@ async def get_timeline(request_id: str, current_user: User = Depends(get_current
 
     return enriched_timeline
 
+def ticket_detail_etag(ticket: dict, event_state: Optional[dict], current_user: User) -> str:
+    """ETag for a ticket detail view: changes with the ticket, its event log and
+    whether the viewer can see internal comments"""
+    viewer = "staff" if current_user.role in ["agent", "manager", "admin"] else "client"
+    updated_at = ticket.get("updated_at") or ticket.get("created_at")
+    seq = (event_state or {}).get("seq", 0)
+    digest = hashlib.sha1(f"{ticket['_id']}:{updated_at}:{seq}:{viewer}".encode()).hexdigest()
+    return f'W/"{digest}"'
+
+def with_author(document: dict, users_by_id: dict, unknown_name: str, unknown_role: str) -> dict:
+    """API representation of a comment/timeline entry with its author's name and role"""
+    item = {"id": str(document["_id"]), **{k: v for k, v in document.items() if k != "_id"}}
+    author = users_by_id.get(document.get("user_id"))
+    item["user_name"] = author.get("name", "Unknown User") if author else unknown_name
+    item["user_role"] = author.get("role", "unknown") if author else unknown_role
+    return item
+
+@app.get("/requests/{request_id}/detail")
+async def get_request_detail(
+    request_id: str,
+    response: Response,
+    comment_limit: int = 50,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    """Ticket, latest comments, timeline and their authors in one call.
+
+    Replaces GET /requests/{id} + /comments + /timeline for the ticket view.
+    Responses carry an ETag; send it back as If-None-Match to get 304 when
+    nothing changed.
+    """
+    if not ObjectId.is_valid(request_id):
+        raise HTTPException(status_code=404, detail="Request not found")
+    comment_limit = max(1, min(comment_limit, 200))
+
+    # Queued events must be stored before the sequence number goes into the ETag
+    await ticket_events.flush()
+    fanout = QueryFanout("ticket-detail")
+    fanout.add("ticket", database.requests.find_one, {"_id": ObjectId(request_id)})
+    fanout.add("event_state", database.ticket_event_state.find_one, {"_id": request_id}, {"seq": 1})
+    results = await fanout.run()
+
+    request = results["ticket"]
+    if not request:
+        raise HTTPException(status_code=404, detail="Request not found")
+    if not can_access_ticket(current_user, request):
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    etag = ticket_detail_etag(request, results["event_state"], current_user)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    comment_query = {"ticket_id": request_id}
+    if current_user.role not in ["agent", "manager", "admin"]:
+        comment_query["is_internal"] = {"$in": [False, None]}
+
+    fanout = QueryFanout("ticket-detail")
+    fanout.add(
+        "comments",
+        database.comments.find(comment_query).sort([("created_at", -1), ("_id", -1)]).limit(comment_limit + 1).to_list,
+        None
+    )
+    fanout.add("timeline", ticket_events.list_events, request_id)
+    results = await fanout.run()
+    comments, timeline = results["comments"], results["timeline"]
+    has_more_comments = len(comments) > comment_limit
+    comments = comments[:comment_limit]
+
+    # Resolve every author in one query
+    author_ids = {request.get("user_id"), request.get("assigned_agent")}
+    author_ids.update(c.get("user_id") for c in comments)
+    author_ids.update(e.get("user_id") for e in timeline)
+    object_ids = [ObjectId(i) for i in author_ids if i and ObjectId.is_valid(i)]
+    authors = await database.users.find(
+        {"_id": {"$in": object_ids}}, {"name": 1, "role": 1, "email": 1}
+    ).to_list(None)
+    users_by_id = {str(a["_id"]): {**{k: v for k, v in a.items() if k != "_id"}, "id": str(a["_id"])} for a in authors}
+
+    response.headers.update(headers)
+    return {
+        "ticket": Request(**{**request, "_id": str(request["_id"])}),
+        "comments": [with_author(c, users_by_id, "Unknown User", "unknown") for c in comments],
+        "comments_pagination": {
+            "limit": comment_limit,
+            "next_cursor": encode_cursor(comments[-1]) if has_more_comments else None,
+            "has_more": has_more_comments
+        },
+        "timeline": [with_author(e, users_by_id, "System", "system") for e in timeline],
+        "users": users_by_id
+    }
+
 # Knowledge Base Management Endpoints
 
 @app.get("/knowledge")
@@ -632,9 +970,17 @@ async def get_knowledge(
     category: Optional[str] = None,
     tag: Optional[str] = None,
     status: Optional[str] = "published",
+    facets: bool = False,
+    include_content: bool = False,
     current_user: User = Depends(get_current_user)
 ):
-    """Get knowledge base articles with search and filtering"""
+    """Get knowledge base articles with search and filtering.
+
+    Articles carry a plain-text `snippet` and `word_count`; their full HTML
+    `content` is only included with `include_content=true`. With
+    `facets=true` the response is {"articles", "facets"}, where facets
+    counts the matching articles per category and tag.
+    """
     query = {"status": status}
 
     if q:
@@ -651,60 +997,115 @@ async def get_knowledge(
     if tag:
         query["tags"] = {"$in": [tag]}
 
-    knowledge = await database.knowledgebase.find(query).sort("created_at", -1).to_list(None)
-
-    return [{
-        "id": str(k["_id"]),
-        "title": k.get("title", k.get("question", "")),  # Backward compatibility
-        "content": k.get("content", k.get("answer", "")),  # Backward compatibility
-        "summary": k.get("summary", ""),
-        "category": k["category"],
-        "tags": k.get("tags", []),
-        "attachments": k.get("attachments", []),
-        "links": k.get("links", []),
-        "author": k.get("author", ""),
-        "created_at": k.get("created_at"),
-        "updated_at": k.get("updated_at"),
-        "views": k.get("views", 0),
-        "helpful_votes": k.get("helpful_votes", 0),
-        "status": k.get("status", "published")
-    } for k in knowledge]
+    projection = None if include_content else {"content": 0, "answer": 0, "plain_text": 0}
+    knowledge = await database.knowledgebase.find(query, projection).sort("created_at", -1).to_list(None)
+    for k in knowledge:
+        kb_counters.apply_pending(k)
 
-@app.get("/knowledge/{article_id}")
-async def get_knowledge_article(article_id: str, current_user: User = Depends(get_current_user)):
-    """Get a specific knowledge base article and increment view count"""
+    articles = [article_response(k, include_content) for k in knowledge]
+    if facets:
+        return {"articles": articles, "facets": count_facets(knowledge)}
+    return articles
+
+@app.get("/knowledge/categories")
+async def get_knowledge_categories(status: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    """Knowledge base categories (of articles with `status`, or all) and their article counts"""
+    counts = kb_facets.counts("categories", status)
+    return {"categories": list(counts), "counts": counts}
+
+@app.get("/knowledge/tags")
+async def get_knowledge_tags(status: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    """Knowledge base tags (of articles with `status`, or all) and their article counts"""
+    counts = kb_facets.counts("tags", status)
+    return {"tags": list(counts), "counts": counts}
+
+@app.post("/knowledge/import")
+async def import_knowledge(
+    request: HTTPRequest,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user)
+):
+    """Import articles from a ZIP export (Content-Type: application/zip) or an
+    NDJSON body with one article per line.
+
+    Returns the created ids in input order (null for rejected lines) and the
+    errors by line number; valid articles are imported even if others fail.
+    """
+    if current_user.role not in ["manager", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized to import knowledge base articles")
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
     try:
-        # Increment view count
-        await database.knowledgebase.update_one(
-            {"_id": ObjectId(article_id)},
-            {"$inc": {"views": 1}}
-        )
+        if content_type in ("application/zip", "application/x-zip-compressed"):
+            archive_path = await kb_bulk.spool(request.stream())
+            try:
+                result = await kb_bulk.import_archive(archive_path, current_user.email)
+            finally:
+                await asyncio.to_thread(os.remove, archive_path)
+        else:
+            result = await kb_bulk.import_lines(iter_lines(request.stream()), current_user.email)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        article = await database.knowledgebase.find_one({"_id": ObjectId(article_id)})
-        if not article:
-            raise HTTPException(status_code=404, detail="Article not found")
+    articles = result.pop("articles")
+    background_tasks.add_task(generate_knowledge_thumbnails, articles)
+    return result
 
-        return {
-            "id": str(article["_id"]),
-            "title": article.get("title", article.get("question", "")),
-            "content": article.get("content", article.get("answer", "")),
-            "summary": article.get("summary", ""),
-            "category": article["category"],
-            "tags": article.get("tags", []),
-            "attachments": article.get("attachments", []),
-            "links": article.get("links", []),
-            "author": article.get("author", ""),
-            "created_at": article.get("created_at"),
-            "updated_at": article.get("updated_at"),
-            "views": article.get("views", 0),
-            "helpful_votes": article.get("helpful_votes", 0),
-            "status": article.get("status", "published")
-        }
-    except Exception as e:
+async def generate_knowledge_thumbnails(articles: List[dict]):
+    for article in articles:
+        if article["attachments"]:
+            await thumbnail_service.generate("knowledgebase", str(article["_id"]), article["attachments"])
+
+@app.get("/knowledge/export")
+async def export_knowledge(
+    format: str = "zip",
+    status: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Stream every article (with `status`, if given) as a ZIP archive with
+    attachment files, or as NDJSON without them"""
+    if current_user.role not in ["manager", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized to export knowledge base articles")
+
+    filename = f"knowledge-{datetime.now():%Y%m%d-%H%M%S}"
+    if format == "ndjson":
+        return StreamingResponse(kb_bulk.export_ndjson(status), media_type="application/x-ndjson",
+                                 headers={"Content-Disposition": f'attachment; filename="{filename}.ndjson"'})
+    if format == "zip":
+        return StreamingResponse(kb_bulk.export_zip(status), media_type="application/zip",
+                                 headers={"Content-Disposition": f'attachment; filename="{filename}.zip"'})
+    raise HTTPException(status_code=400, detail="'format' must be 'zip' or 'ndjson'")
+
+@app.get("/knowledge/{article_id}")
+async def get_knowledge_article(
+    article_id: str,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    """Get a specific knowledge base article and count the view.
+
+    Published articles are served from the article cache. Responses carry an
+    ETag; send it back as If-None-Match to get 304 while the article is
+    unchanged.
+    """
+    if not ObjectId.is_valid(article_id):
         raise HTTPException(status_code=400, detail="Invalid article ID")
 
+    entry = await kb_article_cache.get(article_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Article not found")
+
+    # Buffered and written in batches, so reads don't contend on the document
+    await kb_counters.increment(article_id, "views")
+
+    headers = {"ETag": entry["etag"], "Cache-Control": "private, no-cache"}
+    if if_none_match and entry["etag"] in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry["body"], media_type="application/json", headers=headers)
+
 @app.post("/knowledge")
 async def create_knowledge(
+    background_tasks: BackgroundTasks,
     title: str = Form(...),
     content: str = Form(...),
     summary: str = Form(...),
@@ -732,25 +1133,7 @@ async def create_knowledge(
             link_list = []
 
     # Process file attachments
-    attachments = []
-    for file in files:
-        if file.filename:
-            # Generate unique filename
-            file_extension = os.path.splitext(file.filename)[1]
-            unique_filename = f"{uuid.uuid4()}{file_extension}"
-            file_path = os.path.join(UPLOAD_DIR, unique_filename)
-
-            # Save file
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-
-            attachments.append({
-                "filename": file.filename,
-                "stored_filename": unique_filename,
-                "url": f"/uploads/{unique_filename}",
-                "size": os.path.getsize(file_path),
-                "content_type": file.content_type
-            })
+    attachments = await attachment_service.save_uploads(files)
 
     # Create article
     article_data = {
@@ -766,18 +1149,46 @@ async def create_knowledge(
         "updated_at": datetime.now(),
         "views": 0,
         "helpful_votes": 0,
-        "status": status
+        "status": status,
+        "revision": 1,
+        **text_projection(content)
     }
 
     result = await database.knowledgebase.insert_one(article_data)
+    await kb_revisions.record(str(result.inserted_id), None, article_data, current_user.email)
+    # The chatbot may now have a better answer for cached queries
+    await kb_article_cache.invalidate()
+    kb_facets.replace(None, article_data)
     article_data["_id"] = str(result.inserted_id)
     article_data["id"] = str(result.inserted_id)
 
+    background_tasks.add_task(thumbnail_service.generate, "knowledgebase", article_data["id"], attachments)
+
     return article_data
 
+async def save_knowledge_revision(article_id: str, existing_article: dict, update_data: dict, current_user: User):
+    """Write an article update as its next revision.
+
+    The write only applies if nobody else stored a revision since
+    `existing_article` was read (409 otherwise).
+    """
+    update_data["revision"] = kb_revisions.next_revision(existing_article)
+    update_data.update(text_projection(update_data["content"]))
+    result = await database.knowledgebase.update_one(
+        {"_id": ObjectId(article_id), "revision": existing_article.get("revision")},
+        {"$set": update_data}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=409, detail="The article was changed by someone else; reload it and try again")
+
+    await kb_revisions.record(article_id, existing_article, {**existing_article, **update_data}, current_user.email)
+    await kb_article_cache.invalidate(article_id)
+    kb_facets.replace(existing_article, update_data)
+
 @app.put("/knowledge/{article_id}")
 async def update_knowledge(
     article_id: str,
+    background_tasks: BackgroundTasks,
     title: str = Form(...),
     content: str = Form(...),
     summary: str = Form(...),
@@ -811,23 +1222,7 @@ async def update_knowledge(
                 link_list = []
 
         # Process new file attachments
-        new_attachments = []
-        for file in files:
-            if file.filename:
-                file_extension = os.path.splitext(file.filename)[1]
-                unique_filename = f"{uuid.uuid4()}{file_extension}"
-                file_path = os.path.join(UPLOAD_DIR, unique_filename)
-
-                with open(file_path, "wb") as buffer:
-                    shutil.copyfileobj(file.file, buffer)
-
-                new_attachments.append({
-                    "filename": file.filename,
-                    "stored_filename": unique_filename,
-                    "url": f"/uploads/{unique_filename}",
-                    "size": os.path.getsize(file_path),
-                    "content_type": file.content_type
-                })
+        new_attachments = await attachment_service.save_uploads(files)
 
         # Combine existing and new attachments
         existing_attachments = existing_article.get("attachments", [])
@@ -845,14 +1240,14 @@ async def update_knowledge(
             "updated_at": datetime.now(),
             "status": status
         }
+        await save_knowledge_revision(article_id, existing_article, update_data, current_user)
 
-        await database.knowledgebase.update_one(
-            {"_id": ObjectId(article_id)},
-            {"$set": update_data}
-        )
+        background_tasks.add_task(thumbnail_service.generate, "knowledgebase", article_id, new_attachments)
 
         return {"message": "Article updated successfully", "id": article_id}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail="Invalid article ID or update failed")
 
@@ -868,37 +1263,74 @@ async def delete_knowledge(article_id: str, current_user: User = Depends(get_cur
         if not article:
             raise HTTPException(status_code=404, detail="Article not found")
 
-        # Delete associated files
+        # Release associated files (shared blobs are kept while still referenced)
         for attachment in article.get("attachments", []):
-            file_path = os.path.join(UPLOAD_DIR, attachment["stored_filename"])
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            await attachment_service.release(attachment["stored_filename"])
 
         # Delete article from database
         result = await database.knowledgebase.delete_one({"_id": ObjectId(article_id)})
+        await kb_article_cache.invalidate(article_id)
+        await kb_revisions.delete(article_id)
 
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Article not found")
+        kb_facets.replace(article, None)
 
         return {"message": "Article deleted successfully"}
 
     except Exception as e:
         raise HTTPException(status_code=400, detail="Invalid article ID or deletion failed")
 
+@app.get("/knowledge/{article_id}/revisions")
+async def get_knowledge_revisions(article_id: str, current_user: User = Depends(get_current_user)):
+    """Stored revisions of an article, newest first"""
+    if current_user.role not in ["agent", "manager"]:
+        raise HTTPException(status_code=403, detail="Not authorized to view article revisions")
+    return {"article_id": article_id, "revisions": await kb_revisions.history(article_id)}
+
+@app.get("/knowledge/{article_id}/revisions/{revision}")
+async def get_knowledge_revision(article_id: str, revision: int, current_user: User = Depends(get_current_user)):
+    """An article as it was at a revision"""
+    if current_user.role not in ["agent", "manager"]:
+        raise HTTPException(status_code=403, detail="Not authorized to view article revisions")
+    stored = await kb_revisions.get(article_id, revision)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    return {"article_id": article_id, **stored}
+
+@app.post("/knowledge/{article_id}/revisions/{revision}/restore")
+async def restore_knowledge_revision(article_id: str, revision: int, current_user: User = Depends(get_current_user)):
+    """Make an old revision's text and fields current again (as a new revision).
+    Attachments are not part of revisions and stay as they are."""
+    if current_user.role not in ["agent", "manager"]:
+        raise HTTPException(status_code=403, detail="Not authorized to update knowledge base articles")
+    if not ObjectId.is_valid(article_id):
+        raise HTTPException(status_code=400, detail="Invalid article ID")
+
+    existing_article = await database.knowledgebase.find_one({"_id": ObjectId(article_id)})
+    if not existing_article:
+        raise HTTPException(status_code=404, detail="Article not found")
+    stored = await kb_revisions.get(article_id, revision)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+
+    update_data = {field: stored[field] for field in (*REVISION_FIELDS, "content")}
+    update_data["updated_at"] = datetime.now()
+    await save_knowledge_revision(article_id, existing_article, update_data, current_user)
+    return {"message": f"Revision {revision} restored", "id": article_id, "revision": update_data["revision"]}
+
 @app.post("/knowledge/{article_id}/vote")
 async def vote_helpful(article_id: str, current_user: User = Depends(get_current_user)):
     """Vote an article as helpful"""
     try:
-        result = await database.knowledgebase.update_one(
-            {"_id": ObjectId(article_id)},
-            {"$inc": {"helpful_votes": 1}}
-        )
-
-        if result.matched_count == 0:
+        if not await database.knowledgebase.find_one({"_id": ObjectId(article_id)}, {"_id": 1}):
             raise HTTPException(status_code=404, detail="Article not found")
 
+        await kb_counters.increment(article_id, "helpful_votes")
         return {"message": "Vote recorded successfully"}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail="Invalid article ID")
 
@@ -921,49 +1353,74 @@ async def delete_attachment(
         # Find and remove attachment
         attachments = article.get("attachments", [])
         updated_attachments = []
-        file_to_delete = None
+        files_to_delete = []
 
         for attachment in attachments:
             if attachment["stored_filename"] == filename:
-                file_to_delete = attachment
+                files_to_delete.append(attachment)
             else:
                 updated_attachments.append(attachment)
 
-        if not file_to_delete:
+        if not files_to_delete:
             raise HTTPException(status_code=404, detail="Attachment not found")
 
-        # Delete file from filesystem
-        file_path = os.path.join(UPLOAD_DIR, filename)
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        # Release one reference per removed entry; the blob goes when unreferenced
+        for attachment in files_to_delete:
+            await attachment_service.release(attachment["stored_filename"])
 
         # Update article in database
         await database.knowledgebase.update_one(
             {"_id": ObjectId(article_id)},
             {"$set": {"attachments": updated_attachments, "updated_at": datetime.now()}}
         )
+        await kb_article_cache.invalidate(article_id)
 
         return {"message": "Attachment deleted successfully"}
 
     except Exception as e:
         raise HTTPException(status_code=400, detail="Invalid article ID or deletion failed")
 
-@app.get("/knowledge/categories")
-async def get_categories(current_user: User = Depends(get_current_user)):
-    """Get all unique categories"""
-    categories = await database.knowledgebase.distinct("category")
-    return {"categories": categories}
-
-@app.get("/knowledge/tags")
-async def get_tags(current_user: User = Depends(get_current_user)):
-    """Get all unique tags"""
-    # Get all articles and extract unique tags
-    articles = await database.knowledgebase.find({}, {"tags": 1}).to_list(None)
-    all_tags = []
-    for article in articles:
-        all_tags.extend(article.get("tags", []))
-    unique_tags = list(set(all_tags))
-    return {"tags": unique_tags}
+@app.get("/attachments/{stored_filename}")
+async def download_attachment(
+    stored_filename: str,
+    download: bool = False,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user_from_header_or_query)
+):
+    """Download a ticket, comment or knowledge base attachment.
+
+    Supports Range requests and conditional requests (ETag/If-None-Match).
+    Accepts the token as `access_token` query parameter for <img>/<a> links.
+    """
+    attachment = await download_service.find_attachment(stored_filename, current_user)
+    return await download_service.build_response(attachment, if_none_match=if_none_match, download=download)
+
+@app.get("/uploads/{stored_filename}")
+async def download_legacy_upload(
+    stored_filename: str,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user_from_header_or_query)
+):
+    """Old attachment links (/uploads/<file>), authorized like /attachments.
+
+    The upload directory is not served as static files: it also holds the
+    blobs and thumbnails, which must only be reachable through an access check.
+    """
+    attachment = await download_service.find_attachment(stored_filename, current_user)
+    return await download_service.build_response(attachment, if_none_match=if_none_match)
+
+@app.get("/attachments/{stored_filename}/{variant}")
+async def download_attachment_variant(
+    stored_filename: str,
+    variant: str,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user_from_header_or_query)
+):
+    """Download a generated thumbnail or preview of an image attachment"""
+    if variant not in THUMBNAIL_VARIANTS:
+        raise HTTPException(status_code=404, detail="Attachment variant not found")
+    attachment = await download_service.find_attachment(stored_filename, current_user)
+    return await download_service.build_response(attachment, if_none_match=if_none_match, variant=variant)
 
 # Category Management Endpoints
 
@@ -1099,6 +1556,7 @@ async def create_user(user_data: dict, current_user: User = Depends(get_current_
 
     result = await database.users.insert_one(user_dict)
     user_dict["_id"] = str(result.inserted_id)
+    await analytics_cache.invalidate("agents")
 
     return {"id": str(result.inserted_id), "message": "User created successfully"}
 
@@ -1121,6 +1579,8 @@ async def update_user(user_id: str, update_data: dict, current_user: User = Depe
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
 
+    await analytics_cache.invalidate("agents")
+
     return {"message": "User updated successfully"}
 
 @app.delete("/users/{user_id}")
@@ -1138,6 +1598,8 @@ async def delete_user(user_id: str, current_user: User = Depends(get_current_use
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
 
+    await analytics_cache.invalidate("agents")
+
     return {"message": "User deleted successfully"}
 
 @app.get("/agents")
@@ -1293,16 +1755,13 @@ async def close_ticket(
 
     await database.requests.update_one({"_id": ObjectId(request_id)}, {"$set": update_data})
 
-    # Create timeline entry
-    timeline_data = {
-        "ticket_id": request_id,
-        "user_id": str(current_user.id),
-        "action_type": "status_changed",
-        "description": f"Ticket {status}",
-        "metadata": {"old_status": request.get("status"), "new_status": status},
-        "created_at": datetime.utcnow()
-    }
-    await database.timeline.insert_one(timeline_data)
+    await ticket_events.append(
+        request_id,
+        "status_changed",
+        f"Ticket {status}",
+        user_id=str(current_user.id),
+        metadata={"old_status": request.get("status"), "new_status": status}
+    )
 
     # Create notification for the other party
     if current_user.role == "client":
@@ -1316,7 +1775,7 @@ async def close_ticket(
                 "message": f"Client has {status} ticket #{request_id[:8]}",
                 "created_at": datetime.utcnow()
             }
-            await database.notifications.insert_one(notification_data)
+            await notification_service.create(notification_data)
     else:
         # Notify client
         notification_data = {
@@ -1327,7 +1786,11 @@ async def close_ticket(
             "message": f"Your ticket #{request_id[:8]} has been {status}",
             "created_at": datetime.utcnow()
         }
-        await database.notifications.insert_one(notification_data)
+        await notification_service.create(notification_data)
+
+    if status in ["resolved", "closed"]:
+        await duplicate_detector.forget([request_id])
+        await bulk_ticket_service.close_linked([request_id], status, current_user)
 
     return {"message": f"Ticket {status} successfully"}
     """Close or resolve a ticket"""
@@ -1373,16 +1836,13 @@ async def close_ticket(
 
     await database.requests.update_one({"_id": ObjectId(request_id)}, {"$set": update_data})
 
-    # Create timeline entry
-    timeline_data = {
-        "ticket_id": request_id,
-        "user_id": str(current_user.id),
-        "action_type": "status_changed",
-        "description": f"Ticket {status}",
-        "metadata": {"old_status": request.get("status"), "new_status": status},
-        "created_at": datetime.utcnow()
-    }
-    await database.timeline.insert_one(timeline_data)
+    await ticket_events.append(
+        request_id,
+        "status_changed",
+        f"Ticket {status}",
+        user_id=str(current_user.id),
+        metadata={"old_status": request.get("status"), "new_status": status}
+    )
 
     # Create notification for the other party
     if current_user.role == "client":
@@ -1396,7 +1856,7 @@ async def close_ticket(
                 "message": f"Client has {status} ticket #{request_id[:8]}",
                 "created_at": datetime.utcnow()
             }
-            await database.notifications.insert_one(notification_data)
+            await notification_service.create(notification_data)
     else:
         # Notify client
         notification_data = {
@@ -1407,7 +1867,7 @@ async def close_ticket(
             "message": f"Your ticket #{request_id[:8]} has been {status}",
             "created_at": datetime.utcnow()
         }
-        await database.notifications.insert_one(notification_data)
+        await notification_service.create(notification_data)
 
     return {"message": f"Ticket {status} successfully"}
 
@@ -1419,32 +1879,42 @@ async def get_dashboard_summary(current_user: User = Depends(get_current_user)):
     if current_user.role not in ["admin", "manager"]:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    # Get total tickets
-    total_tickets = await database.requests.count_documents({})
-
-    # Get open tickets
-    open_tickets = await database.requests.count_documents({"status": {"$in": ["open", "assigned", "in_progress"]}})
+    return await analytics_cache.get_or_compute("dashboard-summary", compute_dashboard_summary, tags=("tickets", "agents"))
 
-    # Get resolved today
+async def compute_dashboard_summary():
+    """Compute executive summary metrics for dashboard"""
     today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    resolved_today = await database.requests.count_documents({
+
+    # All summary metrics are independent, so run them concurrently
+    fanout = QueryFanout("dashboard-summary")
+    fanout.add("total_tickets", database.requests.count_documents, {})
+    fanout.add("open_tickets", database.requests.count_documents, {"status": {"$in": ["open", "assigned", "in_progress"]}})
+    fanout.add("resolved_today", database.requests.count_documents, {
         "status": {"$in": ["resolved", "closed"]},
         "updated_at": {"$gte": today}
     })
-
-    # Get active agents
-    active_agents = await database.users.count_documents({
+    fanout.add("active_agents", database.users.count_documents, {
         "role": "agent",
         "status": {"$in": ["active", "busy"]}
     })
+    fanout.add("escalated_count", database.requests.count_documents, {"escalated": True})
+    # Average resolution time only needs the two timestamps
+    fanout.add("resolved_tickets", database.requests.find(
+        {"status": {"$in": ["resolved", "closed"]}, "created_at": {"$exists": True}, "updated_at": {"$exists": True}},
+        {"created_at": 1, "updated_at": 1}
+    ).to_list, None)
+    fanout.add("sla_compliant", database.requests.count_documents, {
+        "sla_breached": {"$ne": True},
+        "status": {"$in": ["resolved", "closed"]}
+    })
+    results = await fanout.run()
 
-    # Get escalated tickets
-    escalated_count = await database.requests.count_documents({"escalated": True})
-
-    # Calculate average resolution time (simplified - in hours)
-    resolved_tickets = await database.requests.find(
-        {"status": {"$in": ["resolved", "closed"]}, "created_at": {"$exists": True}, "updated_at": {"$exists": True}}
-    ).to_list(None)
+    total_tickets = results["total_tickets"]
+    open_tickets = results["open_tickets"]
+    resolved_today = results["resolved_today"]
+    active_agents = results["active_agents"]
+    escalated_count = results["escalated_count"]
+    resolved_tickets = results["resolved_tickets"]
 
     avg_resolution_time = 0
     if resolved_tickets:
@@ -1456,10 +1926,7 @@ async def get_dashboard_summary(current_user: User = Depends(get_current_user)):
         avg_resolution_time = round(total_hours / len(resolved_tickets), 1)
 
     # Calculate SLA compliance (simplified)
-    sla_compliant = await database.requests.count_documents({
-        "sla_breached": {"$ne": True},
-        "status": {"$in": ["resolved", "closed"]}
-    })
+    sla_compliant = results["sla_compliant"]
     total_resolved = len(resolved_tickets)
     sla_compliance = round((sla_compliant / total_resolved * 100), 1) if total_resolved > 0 else 0
 
@@ -1479,6 +1946,10 @@ async def get_ticket_status_distribution(current_user: User = Depends(get_curren
     if current_user.role not in ["admin", "manager"]:
         raise HTTPException(status_code=403, detail="Not authorized")
 
+    return await analytics_cache.get_or_compute("ticket-status-distribution", compute_ticket_status_distribution)
+
+async def compute_ticket_status_distribution():
+    """Compute ticket distribution by status"""
     pipeline = [
         {"$group": {"_id": "$status", "count": {"$sum": 1}}},
         {"$project": {"status": "$_id", "count": 1, "_id": 0}}
@@ -1509,6 +1980,10 @@ async def get_category_breakdown(current_user: User = Depends(get_current_user))
     if current_user.role not in ["admin", "manager"]:
         raise HTTPException(status_code=403, detail="Not authorized")
 
+    return await analytics_cache.get_or_compute("category-breakdown", compute_category_breakdown)
+
+async def compute_category_breakdown():
+    """Compute ticket breakdown by category"""
     pipeline = [
         {"$group": {"_id": "$category", "count": {"$sum": 1}}},
         {"$project": {"category": "$_id", "count": 1, "_id": 0}},
@@ -1533,9 +2008,21 @@ async def get_agent_performance(current_user: User = Depends(get_current_user)):
     if current_user.role not in ["admin", "manager"]:
         raise HTTPException(status_code=403, detail="Not authorized")
 
+    return await analytics_cache.get_or_compute("agent-performance", compute_agent_performance, tags=("tickets", "agents"))
+
+async def compute_agent_performance():
+    """Compute agent performance metrics"""
     # Get all agents
     agents = await database.users.find({"role": "agent"}).to_list(None)
 
+    # Load every agent's tickets concurrently instead of one agent at a time
+    ticket_projection = {"status": 1, "created_at": 1, "updated_at": 1, "sla_breached": 1}
+    fanout = QueryFanout("agent-performance")
+    for agent in agents:
+        agent_id = str(agent["_id"])
+        fanout.add(agent_id, database.requests.find({"assigned_agent": agent_id}, ticket_projection).to_list, None)
+    tickets_by_agent = await fanout.run()
+
     performance_data = []
 
     for agent in agents:
@@ -1543,7 +2030,7 @@ async def get_agent_performance(current_user: User = Depends(get_current_user)):
         agent_name = agent["name"]
 
         # Get tickets assigned to this agent
-        agent_tickets = await database.requests.find({"assigned_agent": agent_id}).to_list(None)
+        agent_tickets = tickets_by_agent[agent_id]
 
         # Calculate metrics
         total_assigned = len(agent_tickets)
@@ -1598,6 +2085,14 @@ async def get_ticket_trends(
     if current_user.role not in ["admin", "manager"]:
         raise HTTPException(status_code=403, detail="Not authorized")
 
+    return await analytics_cache.get_or_compute(
+        "ticket-trends",
+        lambda: compute_ticket_trends(days, group_by, category),
+        params={"days": days, "group_by": group_by, "category": category}
+    )
+
+async def compute_ticket_trends(days: int, group_by: str, category: Optional[str]):
+    """Compute ticket trends over time with flexible grouping"""
     # Calculate date range
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=days)
@@ -1642,8 +2137,12 @@ async def get_ticket_trends(
         {"$sort": {"_id": 1}}
     ]
 
-    created_data = await database.requests.aggregate(pipeline_created).to_list(None)
-    resolved_data = await database.requests.aggregate(pipeline_resolved).to_list(None)
+    fanout = QueryFanout("ticket-trends")
+    fanout.add("created", database.requests.aggregate(pipeline_created).to_list, None)
+    fanout.add("resolved", database.requests.aggregate(pipeline_resolved).to_list, None)
+    results = await fanout.run()
+    created_data = results["created"]
+    resolved_data = results["resolved"]
 
     # Generate all periods in range
     periods = []
@@ -1696,29 +2195,48 @@ async def get_sla_compliance(current_user: User = Depends(get_current_user)):
     if current_user.role not in ["admin", "manager"]:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    # Overall SLA compliance
-    total_resolved = await database.requests.count_documents({"status": {"$in": ["resolved", "closed"]}})
-    sla_compliant = await database.requests.count_documents({
-        "status": {"$in": ["resolved", "closed"]},
-        "sla_breached": {"$ne": True}
-    })
-
-    overall_compliance = round((sla_compliant / total_resolved * 100), 1) if total_resolved > 0 else 0
+    return await analytics_cache.get_or_compute("sla-compliance", compute_sla_compliance)
 
-    # SLA by urgency level
+async def compute_sla_compliance():
+    """Compute SLA compliance metrics"""
     urgency_levels = ["urgent", "moderate", "mild"]
-    sla_by_urgency = []
+    week_ago = datetime.utcnow() - timedelta(days=7)
 
+    # The overall, per-urgency and recent-breach counts are independent
+    fanout = QueryFanout("sla-compliance")
+    fanout.add("total_resolved", database.requests.count_documents, {"status": {"$in": ["resolved", "closed"]}})
+    fanout.add("sla_compliant", database.requests.count_documents, {
+        "status": {"$in": ["resolved", "closed"]},
+        "sla_breached": {"$ne": True}
+    })
     for urgency in urgency_levels:
-        resolved_by_urgency = await database.requests.count_documents({
+        fanout.add(f"resolved_{urgency}", database.requests.count_documents, {
             "status": {"$in": ["resolved", "closed"]},
             "urgency_level": urgency
         })
-        compliant_by_urgency = await database.requests.count_documents({
+        fanout.add(f"compliant_{urgency}", database.requests.count_documents, {
             "status": {"$in": ["resolved", "closed"]},
             "urgency_level": urgency,
             "sla_breached": {"$ne": True}
         })
+    fanout.add("recent_breaches", database.requests.count_documents, {
+        "sla_breached": True,
+        "created_at": {"$gte": week_ago}
+    })
+    results = await fanout.run()
+
+    # Overall SLA compliance
+    total_resolved = results["total_resolved"]
+    sla_compliant = results["sla_compliant"]
+
+    overall_compliance = round((sla_compliant / total_resolved * 100), 1) if total_resolved > 0 else 0
+
+    # SLA by urgency level
+    sla_by_urgency = []
+
+    for urgency in urgency_levels:
+        resolved_by_urgency = results[f"resolved_{urgency}"]
+        compliant_by_urgency = results[f"compliant_{urgency}"]
 
         compliance_pct = round((compliant_by_urgency / resolved_by_urgency * 100), 1) if resolved_by_urgency > 0 else 0
 
@@ -1730,11 +2248,7 @@ async def get_sla_compliance(current_user: User = Depends(get_current_user)):
         })
 
     # Recent SLA breaches (last 7 days)
-    week_ago = datetime.utcnow() - timedelta(days=7)
-    recent_breaches = await database.requests.count_documents({
-        "sla_breached": True,
-        "created_at": {"$gte": week_ago}
-    })
+    recent_breaches = results["recent_breaches"]
 
     return {
         "overall_compliance": overall_compliance,
@@ -1751,6 +2265,10 @@ async def get_priority_distribution(current_user: User = Depends(get_current_use
     if current_user.role not in ["admin", "manager"]:
         raise HTTPException(status_code=403, detail="Not authorized")
 
+    return await analytics_cache.get_or_compute("priority-distribution", compute_priority_distribution)
+
+async def compute_priority_distribution():
+    """Compute ticket distribution by priority and escalation status"""
     # Priority distribution
     pipeline = [
         {"$group": {"_id": "$priority", "count": {"$sum": 1}}},
@@ -1758,11 +2276,16 @@ async def get_priority_distribution(current_user: User = Depends(get_current_use
         {"$sort": {"count": -1}}
     ]
 
-    priority_data = await database.requests.aggregate(pipeline).to_list(None)
+    fanout = QueryFanout("priority-distribution")
+    fanout.add("priorities", database.requests.aggregate(pipeline).to_list, None)
+    fanout.add("escalated", database.requests.count_documents, {"escalated": True})
+    results = await fanout.run()
+
+    priority_data = results["priorities"]
     total_tickets = sum(item["count"] for item in priority_data)
 
     # Escalation statistics
-    total_escalated = await database.requests.count_documents({"escalated": True})
+    total_escalated = results["escalated"]
     escalation_rate = round((total_escalated / total_tickets * 100), 1) if total_tickets > 0 else 0
 
     # Priority with percentages
@@ -1786,6 +2309,14 @@ async def get_priority_distribution(current_user: User = Depends(get_current_use
         }
     }
 
+@app.get("/analytics/cache-stats")
+async def get_analytics_cache_stats(current_user: User = Depends(get_current_user)):
+    """Get analytics response cache statistics for monitoring"""
+    if current_user.role not in ["admin", "manager"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    return analytics_cache.stats()
+
 # Reports Generation Endpoints
 
 @app.post("/reports/generate")
@@ -1839,32 +2370,38 @@ async def generate_report(report_request: dict, current_user: User = Depends(get
 
 async def generate_ticket_summary_report(start_date, end_date):
     """Generate ticket summary report data"""
-    # Get total tickets in date range
-    total_tickets = await database.requests.count_documents({
-        "created_at": {"$gte": start_date, "$lte": end_date}
-    })
+    date_match = {"created_at": {"$gte": start_date, "$lte": end_date}}
 
     # Get status distribution
     status_pipeline = [
-        {"$match": {"created_at": {"$gte": start_date, "$lte": end_date}}},
+        {"$match": date_match},
         {"$group": {"_id": "$status", "count": {"$sum": 1}}}
     ]
-    status_data = await database.requests.aggregate(status_pipeline).to_list(None)
 
     # Get category breakdown
     category_pipeline = [
-        {"$match": {"created_at": {"$gte": start_date, "$lte": end_date}}},
+        {"$match": date_match},
         {"$group": {"_id": "$category", "count": {"$sum": 1}}},
         {"$sort": {"count": -1}}
     ]
-    category_data = await database.requests.aggregate(category_pipeline).to_list(None)
 
-    # Calculate average resolution time
-    resolved_tickets = await database.requests.find({
+    fanout = QueryFanout("report-ticket-summary")
+    fanout.add("total_tickets", database.requests.count_documents, date_match)
+    fanout.add("status", database.requests.aggregate(status_pipeline).to_list, None)
+    fanout.add("category", database.requests.aggregate(category_pipeline).to_list, None)
+    fanout.add("resolved", database.requests.find({
         "status": {"$in": ["resolved", "closed"]},
         "created_at": {"$gte": start_date, "$lte": end_date},
         "updated_at": {"$exists": True}
-    }).to_list(None)
+    }, {"created_at": 1, "updated_at": 1, "sla_breached": 1}).to_list, None)
+    results = await fanout.run()
+
+    total_tickets = results["total_tickets"]
+    status_data = results["status"]
+    category_data = results["category"]
+
+    # Calculate average resolution time
+    resolved_tickets = results["resolved"]
 
     avg_resolution_time = 0
     if resolved_tickets:
@@ -1890,11 +2427,29 @@ async def generate_ticket_summary_report(start_date, end_date):
 
 async def generate_sla_compliance_report(start_date, end_date):
     """Generate SLA compliance report data"""
-    # Get resolved tickets in date range
-    resolved_tickets = await database.requests.find({
+    # SLA breaches by day
+    breach_pipeline = [
+        {"$match": {
+            "sla_breached": True,
+            "created_at": {"$gte": start_date, "$lte": end_date}
+        }},
+        {"$group": {
+            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+            "count": {"$sum": 1}
+        }},
+        {"$sort": {"_id": 1}}
+    ]
+
+    fanout = QueryFanout("report-sla-compliance")
+    fanout.add("resolved", database.requests.find({
         "status": {"$in": ["resolved", "closed"]},
         "created_at": {"$gte": start_date, "$lte": end_date}
-    }).to_list(None)
+    }, {"urgency_level": 1, "sla_breached": 1}).to_list, None)
+    fanout.add("breach_trends", database.requests.aggregate(breach_pipeline).to_list, None)
+    results = await fanout.run()
+
+    # Get resolved tickets in date range
+    resolved_tickets = results["resolved"]
 
     total_resolved = len(resolved_tickets)
     sla_compliant = len([t for t in resolved_tickets if not t.get("sla_breached", False)])
@@ -1919,19 +2474,7 @@ async def generate_sla_compliance_report(start_date, end_date):
             "compliance_percentage": round((stats["compliant"] / stats["total"] * 100), 1) if stats["total"] > 0 else 0
         }
 
-    # SLA breaches by day
-    breach_pipeline = [
-        {"$match": {
-            "sla_breached": True,
-            "created_at": {"$gte": start_date, "$lte": end_date}
-        }},
-        {"$group": {
-            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
-            "count": {"$sum": 1}
-        }},
-        {"$sort": {"_id": 1}}
-    ]
-    breach_trends = await database.requests.aggregate(breach_pipeline).to_list(None)
+    breach_trends = results["breach_trends"]
 
     return {
         "overall_compliance": overall_compliance,
@@ -1947,15 +2490,20 @@ async def generate_agent_productivity_report(start_date, end_date):
     # Get all agents
     agents = await database.users.find({"role": "agent"}).to_list(None)
 
-    agent_stats = []
+    # Get tickets assigned to each agent in date range, all agents at once
+    fanout = QueryFanout("report-agent-productivity")
     for agent in agents:
         agent_id = str(agent["_id"])
-
-        # Get tickets assigned to this agent in date range
-        agent_tickets = await database.requests.find({
+        fanout.add(agent_id, database.requests.find({
             "assigned_agent": agent_id,
             "created_at": {"$gte": start_date, "$lte": end_date}
-        }).to_list(None)
+        }, {"status": 1, "sla_breached": 1}).to_list, None)
+    tickets_by_agent = await fanout.run()
+
+    agent_stats = []
+    for agent in agents:
+        agent_id = str(agent["_id"])
+        agent_tickets = tickets_by_agent[agent_id]
 
         total_assigned = len(agent_tickets)
         resolved_tickets = [t for t in agent_tickets if t["status"] in ["resolved", "closed"]]
@@ -2002,21 +2550,28 @@ async def generate_ticket_trends_report(start_date, end_date):
         date_range.append(current_date.strftime("%Y-%m-%d"))
         current_date += timedelta(days=1)
 
-    trends = []
+    # Two counts per day; the fanout cap keeps long ranges from flooding the pool
+    fanout = QueryFanout("report-ticket-trends")
     for date_str in date_range:
         date_start = datetime.strptime(date_str, "%Y-%m-%d")
         date_end = date_start + timedelta(days=1)
 
         # Created tickets
-        created = await database.requests.count_documents({
+        fanout.add(f"created_{date_str}", database.requests.count_documents, {
             "created_at": {"$gte": date_start, "$lt": date_end}
         })
 
         # Resolved tickets
-        resolved = await database.requests.count_documents({
+        fanout.add(f"resolved_{date_str}", database.requests.count_documents, {
             "status": {"$in": ["resolved", "closed"]},
             "updated_at": {"$gte": date_start, "$lt": date_end}
         })
+    counts = await fanout.run()
+
+    trends = []
+    for date_str in date_range:
+        created = counts[f"created_{date_str}"]
+        resolved = counts[f"resolved_{date_str}"]
 
         trends.append({
             "date": date_str,
@@ -2057,23 +2612,15 @@ async def get_chatbot_summary(current_user: User = Depends(get_current_user)):
     if current_user.role not in ["admin", "manager"]:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    # Total interactions
-    total_interactions = await database.chatbot_interactions.count_documents({})
+    return await analytics_cache.get_or_compute("chatbot-summary", compute_chatbot_summary, tags=("chatbot",))
 
+async def compute_chatbot_summary():
+    """Compute chatbot interaction summary for analytics"""
     # Interactions by feedback type
     feedback_pipeline = [
         {"$group": {"_id": "$user_feedback", "count": {"$sum": 1}}},
         {"$project": {"feedback": "$_id", "count": 1, "_id": 0}}
     ]
-    feedback_data = await database.chatbot_interactions.aggregate(feedback_pipeline).to_list(None)
-
-    # Resolution rate (interactions where user marked as helpful)
-    resolved_count = await database.chatbot_interactions.count_documents({"resolved_by_chatbot": True})
-    resolution_rate = round((resolved_count / total_interactions * 100), 1) if total_interactions > 0 else 0
-
-    # Ticket creation rate
-    ticket_created_count = await database.chatbot_interactions.count_documents({"ticket_created": True})
-    ticket_creation_rate = round((ticket_created_count / total_interactions * 100), 1) if total_interactions > 0 else 0
 
     # Most used knowledge base articles
     kb_usage_pipeline = [
@@ -2082,7 +2629,6 @@ async def get_chatbot_summary(current_user: User = Depends(get_current_user)):
         {"$sort": {"count": -1}},
         {"$limit": 10}
     ]
-    kb_usage = await database.chatbot_interactions.aggregate(kb_usage_pipeline).to_list(None)
 
     # Daily interaction trends (last 30 days)
     thirty_days_ago = datetime.utcnow() - timedelta(days=30)
@@ -2094,7 +2640,30 @@ async def get_chatbot_summary(current_user: User = Depends(get_current_user)):
         }},
         {"$sort": {"_id": 1}}
     ]
-    daily_trends = await database.chatbot_interactions.aggregate(daily_pipeline).to_list(None)
+
+    fanout = QueryFanout("chatbot-summary")
+    fanout.add("total", database.chatbot_interactions.count_documents, {})
+    fanout.add("feedback", database.chatbot_interactions.aggregate(feedback_pipeline).to_list, None)
+    fanout.add("resolved", database.chatbot_interactions.count_documents, {"resolved_by_chatbot": True})
+    fanout.add("ticket_created", database.chatbot_interactions.count_documents, {"ticket_created": True})
+    fanout.add("kb_usage", database.chatbot_interactions.aggregate(kb_usage_pipeline).to_list, None)
+    fanout.add("daily", database.chatbot_interactions.aggregate(daily_pipeline).to_list, None)
+    results = await fanout.run()
+
+    # Total interactions
+    total_interactions = results["total"]
+    feedback_data = results["feedback"]
+
+    # Resolution rate (interactions where user marked as helpful)
+    resolved_count = results["resolved"]
+    resolution_rate = round((resolved_count / total_interactions * 100), 1) if total_interactions > 0 else 0
+
+    # Ticket creation rate
+    ticket_created_count = results["ticket_created"]
+    ticket_creation_rate = round((ticket_created_count / total_interactions * 100), 1) if total_interactions > 0 else 0
+
+    kb_usage = results["kb_usage"]
+    daily_trends = results["daily"]
 
     return {
         "total_interactions": total_interactions,
@@ -2118,43 +2687,42 @@ async def get_chatbot_efficiency(
     if current_user.role not in ["admin", "manager"]:
         raise HTTPException(status_code=403, detail="Not authorized")
 
+    return await analytics_cache.get_or_compute(
+        "chatbot-efficiency",
+        lambda: compute_chatbot_efficiency(days, group_by),
+        params={"days": days, "group_by": group_by},
+        tags=("tickets", "chatbot")
+    )
+
+async def compute_chatbot_efficiency(days: int, group_by: str):
+    """Compute chatbot efficiency metrics compared to manual ticket creation"""
     # Get date ranges for comparison
     now = datetime.utcnow()
     start_date = now - timedelta(days=days)
 
+    fanout = QueryFanout("chatbot-efficiency")
+
     # Total tickets created in date range
-    total_tickets = await database.requests.count_documents({
+    fanout.add("total_tickets", database.requests.count_documents, {
         "created_at": {"$gte": start_date}
     })
 
     # Tickets created via chatbot
-    chatbot_tickets = await database.chatbot_interactions.count_documents({
+    fanout.add("chatbot_tickets", database.chatbot_interactions.count_documents, {
         "ticket_created": True,
         "created_at": {"$gte": start_date}
     })
 
     # Chatbot resolution rate
-    total_chatbot_queries = await database.chatbot_interactions.count_documents({
+    fanout.add("total_chatbot_queries", database.chatbot_interactions.count_documents, {
         "created_at": {"$gte": start_date}
     })
 
-    resolved_by_chatbot = await database.chatbot_interactions.count_documents({
+    fanout.add("resolved_by_chatbot", database.chatbot_interactions.count_documents, {
         "resolved_by_chatbot": True,
         "created_at": {"$gte": start_date}
     })
 
-    resolution_rate = round((resolved_by_chatbot / total_chatbot_queries * 100), 1) if total_chatbot_queries > 0 else 0
-
-    # Average time saved per resolved query (estimated)
-    # Assuming manual ticket resolution takes 2 hours, chatbot resolution takes 5 minutes
-    time_saved_per_resolution = 2 * 60 - 5  # minutes
-    total_time_saved = resolved_by_chatbot * time_saved_per_resolution
-
-    # Cost savings (estimated - assuming $50/hour agent cost)
-    hourly_rate = 50
-    cost_saved_per_resolution = (time_saved_per_resolution / 60) * hourly_rate
-    total_cost_saved = resolved_by_chatbot * cost_saved_per_resolution
-
     # Get chatbot interaction trends
     if group_by == "weekly":
         date_format = "%Y-%U"
@@ -2177,7 +2745,7 @@ async def get_chatbot_efficiency(
         }},
         {"$sort": {"_id": 1}}
     ]
-    chatbot_trends = await database.chatbot_interactions.aggregate(chatbot_trend_pipeline).to_list(None)
+    fanout.add("chatbot_trends", database.chatbot_interactions.aggregate(chatbot_trend_pipeline).to_list, None)
 
     # Manual ticket creation trend (excluding chatbot-created tickets)
     manual_trend_pipeline = [
@@ -2191,7 +2759,27 @@ async def get_chatbot_efficiency(
         }},
         {"$sort": {"_id": 1}}
     ]
-    manual_trends = await database.requests.aggregate(manual_trend_pipeline).to_list(None)
+    fanout.add("manual_trends", database.requests.aggregate(manual_trend_pipeline).to_list, None)
+    results = await fanout.run()
+
+    total_tickets = results["total_tickets"]
+    chatbot_tickets = results["chatbot_tickets"]
+    total_chatbot_queries = results["total_chatbot_queries"]
+    resolved_by_chatbot = results["resolved_by_chatbot"]
+    chatbot_trends = results["chatbot_trends"]
+    manual_trends = results["manual_trends"]
+
+    resolution_rate = round((resolved_by_chatbot / total_chatbot_queries * 100), 1) if total_chatbot_queries > 0 else 0
+
+    # Average time saved per resolved query (estimated)
+    # Assuming manual ticket resolution takes 2 hours, chatbot resolution takes 5 minutes
+    time_saved_per_resolution = 2 * 60 - 5  # minutes
+    total_time_saved = resolved_by_chatbot * time_saved_per_resolution
+
+    # Cost savings (estimated - assuming $50/hour agent cost)
+    hourly_rate = 50
+    cost_saved_per_resolution = (time_saved_per_resolution / 60) * hourly_rate
+    total_cost_saved = resolved_by_chatbot * cost_saved_per_resolution
 
     # Generate periods and merge data
     periods = []
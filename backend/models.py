@@ -95,6 +95,10 @@ class Request(BaseModel):
     escalated_at: Optional[datetime] = None
     resolved_at: Optional[datetime] = None
     closed_at: Optional[datetime] = None
+    parent_ticket_id: Optional[str] = None  # Incident this ticket was linked to as a duplicate
+    possible_duplicates: List[dict] = []
+    predictions: dict = {}  # Classifier output: {field: {value, confidence}}
+    routing_category: Optional[str] = None  # Confidently predicted category used for assignment
 
 class RequestCreate(BaseModel):
     title: str
@@ -163,6 +167,23 @@ class KnowledgeBase(BaseModel):
     helpful_votes: int = 0
     status: str = "published"  # draft, published, archived
 
+class KnowledgeImport(BaseModel):
+    """One article of a bulk knowledge base import"""
+    title: str
+    content: str
+    summary: str = ""
+    category: str
+    tags: List[str] = []
+    links: List[dict] = []
+    author: Optional[str] = None
+    status: str = "published"
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    views: int = 0
+    helpful_votes: int = 0
+    # {"filename", "content_type", and "path" (ZIP member) or "sha256" (stored blob)}
+    attachments: List[dict] = []
+
 class EscalationRule(BaseModel):
     id: Optional[str] = Field(alias="_id")
     priority: str
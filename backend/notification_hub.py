@@ -0,0 +1,156 @@
+import asyncio
+import json
+import os
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Dict, Optional, Set
+
+from cache_backend import CACHE_BACKEND, CACHE_KEY_PREFIX, REDIS_URL
+
+# "memory" delivers only to clients connected to this process; "redis" also
+# broadcasts to the other backend replicas. Follows CACHE_BACKEND by default.
+NOTIFICATION_HUB_BACKEND = os.getenv("NOTIFICATION_HUB_BACKEND") or CACHE_BACKEND
+# Undelivered events kept per connection before the oldest are dropped
+NOTIFICATION_QUEUE_SIZE = int(os.getenv("NOTIFICATION_QUEUE_SIZE", "100"))
+# Comment lines sent on idle streams so proxies don't close them
+NOTIFICATION_KEEPALIVE_SECONDS = float(os.getenv("NOTIFICATION_KEEPALIVE_SECONDS", "15"))
+
+
+def serialize_notification(notification: dict) -> dict:
+    """JSON-friendly copy of a notification document, shaped like GET /notifications items"""
+    payload = {"id": str(notification["_id"])} if "_id" in notification else {}
+    for key, value in notification.items():
+        if key == "_id":
+            continue
+        payload[key] = value.isoformat() if isinstance(value, datetime) else value
+    return payload
+
+
+def format_sse_event(payload: dict) -> str:
+    """Encode a serialized notification as a server-sent event"""
+    lines = []
+    if payload.get("id"):
+        lines.append(f"id: {payload['id']}")
+    lines.append("event: notification")
+    lines.append(f"data: {json.dumps(payload, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class NotificationHub:
+    """In-process pub/sub for pushing notifications to connected users.
+
+    Every open stream subscribes with its own bounded queue; publishing puts the
+    notification on the queues of all streams of the recipient. A slow client
+    loses its oldest undelivered events instead of holding memory, and can catch
+    up from GET /notifications (or by reconnecting with Last-Event-ID).
+
+    With the redis backend, published notifications are also sent over a
+    pub/sub channel so users connected to other replicas receive them too.
+    """
+
+    def __init__(self, backend: str = NOTIFICATION_HUB_BACKEND, redis_url: str = REDIS_URL,
+                 queue_size: int = NOTIFICATION_QUEUE_SIZE, client=None):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._stats = {"published": 0, "delivered": 0, "dropped": 0, "remote": 0}
+        self._origin = uuid.uuid4().hex
+        self._channel = f"{CACHE_KEY_PREFIX}:notifications"
+        self._listener_task: Optional[asyncio.Task] = None
+        self._redis = client
+
+        if self._redis is None and backend == "redis":
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError("NOTIFICATION_HUB_BACKEND=redis requires the 'redis' package")
+            self._redis = redis.from_url(redis_url)
+
+    async def start(self):
+        """Subscribe to notifications published by other replicas"""
+        if self._redis is not None and self._listener_task is None:
+            self._listener_task = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+
+        if self._redis is not None:
+            close = getattr(self._redis, "aclose", None) or self._redis.close
+            await close()
+
+    async def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub()
+                await pubsub.subscribe(self._channel)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    data = json.loads(message["data"])
+                    if data.get("origin") == self._origin:
+                        continue
+                    self._stats["remote"] += 1
+                    self._deliver(data["user_id"], data["notification"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Notification hub subscription error, reconnecting: {e}")
+                await asyncio.sleep(1)
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: str) -> AsyncIterator[asyncio.Queue]:
+        """Register a stream for `user_id`; yields the queue its events arrive on"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            queues = self._subscribers.get(user_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[user_id]
+
+    async def publish(self, notification: dict):
+        """Push a stored notification to its recipient's open streams (on every replica)"""
+        payload = serialize_notification(notification)
+        user_id = payload["user_id"]
+        self._stats["published"] += 1
+        self._deliver(user_id, payload)
+
+        if self._redis is not None:
+            try:
+                await self._redis.publish(self._channel, json.dumps({
+                    "origin": self._origin,
+                    "user_id": user_id,
+                    "notification": payload
+                }, default=str))
+            except Exception as e:
+                # Local delivery already happened and the notification is stored
+                print(f"Notification broadcast failed: {e}")
+
+    def _deliver(self, user_id: str, payload: dict):
+        for queue in self._subscribers.get(user_id, ()):
+            if queue.full():
+                queue.get_nowait()
+                self._stats["dropped"] += 1
+            queue.put_nowait(payload)
+            self._stats["delivered"] += 1
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "connected_users": len(self._subscribers),
+            "connections": sum(len(queues) for queues in self._subscribers.values()),
+            "broadcast": self._redis is not None
+        }
+
+
+# Global notification hub instance
+notification_hub = NotificationHub()
@@ -0,0 +1,367 @@
+import asyncio
+import os
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import database
+from indexes import ensure_ttl_index
+from notification_hub import notification_hub
+from pagination import encode_cursor, keyset_filter
+
+# Matches unread notifications, including older documents stored without is_read
+UNREAD = {"$in": [False, None]}
+
+# Outbox: notifications are written in insert_many batches at most this often;
+# 0 writes every notification as it is created
+NOTIFICATION_FLUSH_INTERVAL_MS = float(os.getenv("NOTIFICATION_FLUSH_INTERVAL_MS", "200"))
+# Attempts to write the outbox on shutdown before giving up on it
+NOTIFICATION_SHUTDOWN_FLUSH_ATTEMPTS = int(os.getenv("NOTIFICATION_SHUTDOWN_FLUSH_ATTEMPTS", "3"))
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "500"))
+# Repeated notifications of these types for the same user and ticket within the
+# window are folded into a single unread notification
+NOTIFICATION_DIGEST_WINDOW_SECONDS = float(os.getenv("NOTIFICATION_DIGEST_WINDOW_SECONDS", "300"))
+DIGEST_TYPES = {"comment_added", "ticket_updated"}
+# Read notifications are deleted this long after being read (TTL index on read_at)
+NOTIFICATION_READ_RETENTION_DAYS = int(os.getenv("NOTIFICATION_READ_RETENTION_DAYS", "30"))
+
+
+class NotificationService:
+    """Stores notifications, keeps per-user unread counters and pushes new
+    notifications to connected clients.
+
+    Writes go through an in-memory outbox that a background task flushes with
+    insert_many every NOTIFICATION_FLUSH_INTERVAL_MS, so a burst of events costs
+    a few round trips instead of one per notification; ids are assigned up
+    front, and notifications are pushed to clients once stored. Until `start()`
+    is called (scripts, the SLA checker run standalone), or with
+    NOTIFICATION_FLUSH_INTERVAL_MS=0, writes go straight to the database.
+
+    The outbox is only in memory: a clean shutdown writes it out (`close`,
+    retrying a few times), but a crash or kill loses the notifications created
+    in the last NOTIFICATION_FLUSH_INTERVAL_MS (more while the database is
+    unreachable, since failed batches stay queued).
+
+    Bursts of digestible notifications (e.g. 50 comments on one ticket) are
+    folded into the first one, which keeps its id and gets a `digest_count`.
+
+    Unread counters live in `notification_counters` ({_id: user_id, unread}),
+    are adjusted by every write here, and are rebuilt from an index-covered
+    count the first time a user's counter is read.
+    """
+
+    def __init__(self, flush_interval_ms: float = NOTIFICATION_FLUSH_INTERVAL_MS,
+                 batch_size: int = NOTIFICATION_BATCH_SIZE,
+                 digest_window_seconds: float = NOTIFICATION_DIGEST_WINDOW_SECONDS):
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = max(1, batch_size)
+        self.digest_window = digest_window_seconds
+        self._pending: List[dict] = []
+        # Digested notifications already stored, to be rewritten on next flush
+        self._pending_updates: Dict[ObjectId, dict] = {}
+        # (user_id, ticket_id, type) -> {"notification", "first_at", "stored"}
+        self._digests: Dict[tuple, dict] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"created": 0, "digested": 0, "flushes": 0, "written": 0, "failed": 0}
+
+    async def start(self):
+        """Start the background outbox flusher"""
+        if self._task is None and self.flush_interval > 0:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self, attempts: int = NOTIFICATION_SHUTDOWN_FLUSH_ATTEMPTS):
+        """Stop the flusher and write out everything still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        for attempt in range(1, max(1, attempts) + 1):
+            try:
+                await self.flush()
+                return
+            except Exception as e:
+                print(f"Notification outbox flush on shutdown failed (attempt {attempt}): {e}")
+                if attempt < attempts:
+                    await asyncio.sleep(attempt)
+        print(f"Dropping {len(self._pending)} queued notifications and "
+              f"{len(self._pending_updates)} digest updates that could not be stored")
+
+    async def ensure_indexes(self):
+        """Match the read notification TTL index to NOTIFICATION_READ_RETENTION_DAYS"""
+        await ensure_ttl_index(database.notifications, "read_at", NOTIFICATION_READ_RETENTION_DAYS * 86400)
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # Give the rest of a burst a moment to arrive
+            await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Notification outbox flush failed, retrying: {e}")
+                self._wakeup.set()
+
+    async def create(self, notification: dict) -> str:
+        """Queue a notification for storage; returns its id"""
+        now = datetime.utcnow()
+        notification.setdefault("is_read", False)
+        notification.setdefault("created_at", now)
+        self._stats["created"] += 1
+
+        digest = self._find_digest(notification)
+        if digest is not None:
+            target = digest["notification"]
+            target["digest_count"] = target.get("digest_count", 1) + 1
+            target["message"] = f"{digest['message']} (+{target['digest_count'] - 1} more)"
+            target["updated_at"] = now
+            if digest["stored"]:
+                self._pending_updates[target["_id"]] = target
+            self._stats["digested"] += 1
+            await self._schedule()
+            return str(target["_id"])
+
+        notification["_id"] = ObjectId()
+        self._remember_digest(notification)
+        self._pending.append(notification)
+        await self._schedule()
+        return str(notification["_id"])
+
+    def _digest_key(self, notification: dict) -> Optional[tuple]:
+        kind = getattr(notification.get("type"), "value", notification.get("type"))
+        if kind not in DIGEST_TYPES or not notification.get("ticket_id") or self.digest_window <= 0:
+            return None
+        return (notification["user_id"], notification["ticket_id"], kind)
+
+    def _find_digest(self, notification: dict) -> Optional[dict]:
+        key = self._digest_key(notification)
+        if key is None:
+            return None
+        digest = self._digests.get(key)
+        if digest is None or time.monotonic() - digest["first_at"] > self.digest_window:
+            self._digests.pop(key, None)
+            return None
+        return digest
+
+    def _remember_digest(self, notification: dict):
+        key = self._digest_key(notification)
+        if key is None:
+            return
+
+        now = time.monotonic()
+        for stale in [k for k, d in self._digests.items() if now - d["first_at"] > self.digest_window]:
+            del self._digests[stale]
+        self._digests[key] = {
+            "notification": notification,
+            "message": notification.get("message", ""),
+            "first_at": now,
+            "stored": False
+        }
+
+    def _forget_digests(self, user_id: str):
+        """Start new notifications for a user once they've read the current ones"""
+        for key in [k for k in self._digests if k[0] == user_id]:
+            del self._digests[key]
+
+    async def _schedule(self):
+        if self._task is None:
+            # No flusher running (scripts, startup): write through
+            await self.flush()
+        elif len(self._pending) >= self.batch_size:
+            await self.flush()
+        else:
+            self._wakeup.set()
+
+    async def flush(self):
+        """Write queued notifications and digest updates, then push them to clients"""
+        async with self._flush_lock:
+            while self._pending or self._pending_updates:
+                batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+                self._stats["flushes"] += 1
+                inserted = await self._insert_batch(batch)
+
+                updates, self._pending_updates = list(self._pending_updates.values()), {}
+                reinserted = await self._apply_updates(updates)
+                try:
+                    await self._increment_counters(inserted + reinserted)
+                except Exception as e:
+                    # The notifications are stored; a drifted counter is only cosmetic
+                    print(f"Notification counter update failed: {e}")
+
+                for notification in inserted + updates:
+                    await notification_hub.publish(notification)
+
+    async def _insert_batch(self, batch: List[dict]) -> List[dict]:
+        if not batch:
+            return []
+
+        # From here on, digest merges must be written as updates
+        digests = [self._digests.get(self._digest_key(n)) for n in batch]
+        digests = [d for d, n in zip(digests, batch) if d is not None and d["notification"] is n]
+        for digest in digests:
+            digest["stored"] = True
+
+        failed = set()
+        try:
+            await database.notifications.insert_many([dict(n) for n in batch], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                # Duplicate ids were written by an earlier, interrupted attempt
+                if error.get("code") != 11000:
+                    failed.add(error["index"])
+                    print(f"Notification write failed: {error.get('errmsg')}")
+        except Exception:
+            # Connection problems: keep the batch queued for the next flush
+            for digest in digests:
+                digest["stored"] = False
+            self._pending = batch + self._pending
+            raise
+
+        stored = [n for i, n in enumerate(batch) if i not in failed]
+        self._stats["written"] += len(stored)
+        self._stats["failed"] += len(failed)
+        return stored
+
+    async def _apply_updates(self, updates: List[dict]) -> List[dict]:
+        """Rewrite stored digest notifications; returns those re-inserted because
+        they were read in the meantime"""
+        reinserted = []
+        for notification in updates:
+            result = await database.notifications.update_one(
+                {"_id": notification["_id"], "is_read": UNREAD},
+                {"$set": {
+                    "message": notification["message"],
+                    "digest_count": notification["digest_count"],
+                    "updated_at": notification["updated_at"]
+                }}
+            )
+            if result.matched_count == 0:
+                # Read (or deleted) since the digest started: store as a new unread one
+                notification["_id"] = ObjectId()
+                notification["is_read"] = False
+                notification.pop("read_at", None)
+                reinserted += await self._insert_batch([notification])
+        return reinserted
+
+    async def _increment_counters(self, notifications: List[dict]):
+        increments = defaultdict(int)
+        for notification in notifications:
+            increments[notification["user_id"]] += 1
+        if increments:
+            await database.notification_counters.bulk_write(
+                [UpdateOne({"_id": user_id}, {"$inc": {"unread": count}}) for user_id, count in increments.items()],
+                ordered=False
+            )
+
+    async def list(self, user_id: str, limit: int = 50, cursor: Optional[str] = None,
+                   unread_only: bool = False) -> dict:
+        """One page of a user's notifications, newest first, with keyset pagination"""
+        await self.flush()
+
+        query = {"user_id": user_id, **keyset_filter(cursor)}
+        if unread_only:
+            query["is_read"] = UNREAD
+
+        # Fetch one extra document to know whether another page exists
+        notifications = await database.notifications.find(query).sort(
+            [("created_at", -1), ("_id", -1)]
+        ).limit(limit + 1).to_list(None)
+        has_more = len(notifications) > limit
+        notifications = notifications[:limit]
+
+        return {
+            "notifications": [
+                {"id": str(n["_id"]), **{k: v for k, v in n.items() if k != "_id"}} for n in notifications
+            ],
+            "pagination": {
+                "limit": limit,
+                "next_cursor": encode_cursor(notifications[-1]) if has_more else None,
+                "has_more": has_more
+            },
+            "unread_count": await self.unread_count(user_id)
+        }
+
+    async def unread_count(self, user_id: str) -> int:
+        counter = await database.notification_counters.find_one({"_id": user_id})
+        if counter is not None:
+            return max(0, counter.get("unread", 0))
+        return await self.rebuild_counter(user_id)
+
+    async def rebuild_counter(self, user_id: str) -> int:
+        """Recount a user's unread notifications and store the result"""
+        unread = await database.notifications.count_documents({"user_id": user_id, "is_read": UNREAD})
+        await database.notification_counters.update_one(
+            {"_id": user_id},
+            {"$set": {"unread": unread}},
+            upsert=True
+        )
+        return unread
+
+    async def mark_read(self, user_id: str, notification_id: str) -> bool:
+        """Mark one notification read; False if it doesn't exist for this user"""
+        await self.flush()
+        previous = await database.notifications.find_one_and_update(
+            {"_id": ObjectId(notification_id), "user_id": user_id},
+            {"$set": {"is_read": True, "read_at": datetime.utcnow()}},
+            projection={"is_read": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if previous is None:
+            return False
+
+        self._forget_digests(user_id)
+        if not previous.get("is_read"):
+            await self._decrement(user_id, 1)
+        return True
+
+    async def mark_many_read(self, user_id: str, notification_ids: Optional[List[str]] = None) -> int:
+        """Mark the given (or all) unread notifications of a user read in one update"""
+        await self.flush()
+        query = {"user_id": user_id, "is_read": UNREAD}
+        if notification_ids is not None:
+            query["_id"] = {"$in": [ObjectId(i) for i in notification_ids if ObjectId.is_valid(i)]}
+
+        result = await database.notifications.update_many(
+            query,
+            {"$set": {"is_read": True, "read_at": datetime.utcnow()}}
+        )
+        self._forget_digests(user_id)
+
+        if notification_ids is None:
+            await database.notification_counters.update_one(
+                {"_id": user_id}, {"$set": {"unread": 0}}, upsert=True
+            )
+        elif result.modified_count:
+            await self._decrement(user_id, result.modified_count)
+        return result.modified_count
+
+    async def _decrement(self, user_id: str, amount: int):
+        # Never let a drifted counter go negative
+        await database.notification_counters.update_one(
+            {"_id": user_id},
+            [{"$set": {"unread": {"$max": [0, {"$subtract": [{"$ifNull": ["$unread", 0]}, amount]}]}}}]
+        )
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "pending": len(self._pending),
+            "pending_updates": len(self._pending_updates),
+            "open_digests": len(self._digests)
+        }
+
+
+# Global notification service instance
+notification_service = NotificationService()
@@ -0,0 +1,36 @@
+import base64
+from datetime import datetime
+from typing import Optional
+
+from bson import ObjectId
+
+
+def encode_cursor(document: dict, field: str = "created_at") -> str:
+    """Opaque cursor pointing just past `document` in newest-first (field, _id) order"""
+    raw = f"{document[field].isoformat()}|{document['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        value, object_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(value), ObjectId(object_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_filter(cursor: Optional[str], field: str = "created_at") -> dict:
+    """Query clause selecting documents after `cursor` in newest-first order.
+
+    Combine with an equality filter and sort by [(field, -1), ("_id", -1)]; backed
+    by an index ending in (field: -1, _id: -1) the page costs O(limit) regardless
+    of depth, unlike skip().
+    """
+    if not cursor:
+        return {}
+    value, object_id = decode_cursor(cursor)
+    return {"$or": [
+        {field: {"$lt": value}},
+        {field: value, "_id": {"$lt": object_id}}
+    ]}
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import time
+from typing import Any, Callable, Dict
+
+# Maximum number of sub-queries a single request may have in flight at once
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("QUERY_FANOUT_MAX_CONCURRENCY", "8"))
+# Fan-outs slower than this (in milliseconds) are always traced
+SLOW_FANOUT_MS = float(os.getenv("QUERY_FANOUT_SLOW_MS", "500"))
+TRACE_ALL = os.getenv("QUERY_FANOUT_TRACE", "").lower() in ("1", "true", "yes")
+
+
+class QueryFanout:
+    """Run independent database queries concurrently with a per-request cap.
+
+    Queries are registered as callables (not coroutines) so that Motor does not
+    start them before a concurrency slot is free:
+
+        fanout = QueryFanout("sla-compliance")
+        fanout.add("total", database.requests.count_documents, {"status": "open"})
+        fanout.add("recent", database.requests.find(query).to_list, None)
+        results = await fanout.run()
+    """
+
+    def __init__(self, name: str, max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.timings: Dict[str, float] = {}
+        self._queries: Dict[str, tuple] = {}
+
+    def add(self, key: str, query: Callable, *args, **kwargs) -> "QueryFanout":
+        """Register a sub-query under `key`; it runs when `run()` is awaited"""
+        if key in self._queries:
+            raise ValueError(f"Duplicate sub-query key: {key}")
+        self._queries[key] = (query, args, kwargs)
+        return self
+
+    async def run(self) -> Dict[str, Any]:
+        """Execute all registered sub-queries and return their results by key"""
+        queries, self._queries = self._queries, {}
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_one(key: str, query: Callable, args: tuple, kwargs: dict):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    return await query(*args, **kwargs)
+                finally:
+                    self.timings[key] = round((time.perf_counter() - started) * 1000, 2)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(run_one(key, query, args, kwargs) for key, (query, args, kwargs) in queries.items())
+        )
+        self._trace(round((time.perf_counter() - started) * 1000, 2))
+
+        return dict(zip(queries.keys(), results))
+
+    def _trace(self, total_ms: float):
+        """Print per sub-query durations for slow fan-outs (or all, if enabled)"""
+        if not TRACE_ALL and total_ms < SLOW_FANOUT_MS:
+            return
+        slowest = sorted(self.timings.items(), key=lambda item: item[1], reverse=True)
+        details = ", ".join(f"{key}={ms}ms" for key, ms in slowest)
+        print(f"Query fanout '{self.name}': {len(self.timings)} sub-queries in {total_ms}ms ({details})")
+
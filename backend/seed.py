@@ -1,6 +1,7 @@
 import asyncio
 from database import database
 from auth import get_password_hash
+from kb_text import text_projection
 from datetime import datetime, timedelta
 
 async def seed_database():
@@ -430,6 +431,8 @@ async def seed_database():
         }
     ]
 
+    for article in knowledge:
+        article.update(text_projection(article["content"]))
     await database.knowledgebase.insert_many(knowledge)
 
     print("Database seeded successfully!")
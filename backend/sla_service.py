@@ -2,6 +2,9 @@ from datetime import datetime, timedelta
 from database import database
 from models import TicketUrgency, NotificationType
 from bson import ObjectId
+from ticket_events import ticket_events
+from sync_service import sync_service
+from notification_service import notification_service
 
 class SLAService:
     def __init__(self):
@@ -80,16 +83,12 @@ class SLAService:
             # Escalate to manager
             await self._escalate_to_manager(ticket)
 
-        # Create timeline entry
-        timeline_data = {
-            "ticket_id": ticket_id,
-            "user_id": "system",  # System-generated
-            "action_type": "escalated",
-            "description": f"Ticket escalated due to SLA breach (Level {current_level + 1})",
-            "metadata": {"sla_breached": True},
-            "created_at": datetime.utcnow()
-        }
-        await database.timeline.insert_one(timeline_data)
+        await ticket_events.append(
+            ticket_id,
+            "escalated",
+            f"Ticket escalated due to SLA breach (Level {current_level + 1})",
+            metadata={"sla_breached": True}
+        )
 
     async def _escalate_to_agent_level(self, ticket: dict, agent_level: int):
         """Escalate ticket to agents of specific level"""
@@ -107,8 +106,9 @@ class SLAService:
             new_agent = agents[0]
             await database.requests.update_one(
                 {"_id": ObjectId(ticket_id)},
-                {"$set": {"assigned_agent": str(new_agent["_id"])}}
+                {"$set": {"assigned_agent": str(new_agent["_id"]), "updated_at": datetime.utcnow()}}
             )
+            await self._record_reassignment(ticket, str(new_agent["_id"]))
 
             # Update agent availability
             await database.users.update_one(
@@ -125,7 +125,7 @@ class SLAService:
                 "message": f"Urgent ticket #{ticket_id[:8]} has been escalated to you",
                 "created_at": datetime.utcnow()
             }
-            await database.notifications.insert_one(notification_data)
+            await notification_service.create(notification_data)
 
     async def _escalate_to_manager(self, ticket: dict):
         """Escalate ticket to manager"""
@@ -136,8 +136,9 @@ class SLAService:
         if manager:
             await database.requests.update_one(
                 {"_id": ObjectId(ticket_id)},
-                {"$set": {"assigned_agent": str(manager["_id"])}}
+                {"$set": {"assigned_agent": str(manager["_id"]), "updated_at": datetime.utcnow()}}
             )
+            await self._record_reassignment(ticket, str(manager["_id"]))
 
             # Create notification for manager
             notification_data = {
@@ -148,7 +149,13 @@ class SLAService:
                 "message": f"Ticket #{ticket_id[:8]} has breached SLA and been escalated to management",
                 "created_at": datetime.utcnow()
             }
-            await database.notifications.insert_one(notification_data)
+            await notification_service.create(notification_data)
+
+    async def _record_reassignment(self, ticket: dict, new_assignee: str):
+        """Drop an escalated ticket from the previous assignee's synced workspace"""
+        previous = ticket.get("assigned_agent")
+        if previous and previous != new_assignee:
+            await sync_service.record_removal(str(ticket["_id"]), previous, "reassigned")
 
     async def _send_sla_warning(self, ticket: dict):
         """Send SLA warning notification"""
@@ -172,7 +179,7 @@ class SLAService:
                     "message": f"Ticket #{ticket_id[:8]} is approaching SLA breach",
                     "created_at": datetime.utcnow()
                 }
-                await database.notifications.insert_one(notification_data)
+                await notification_service.create(notification_data)
 
     async def manual_escalate(self, ticket_id: str, current_user_id: str):
         """Manually escalate a ticket"""
@@ -204,16 +211,13 @@ class SLAService:
         else:
             await self._escalate_to_manager(ticket)
 
-        # Create timeline entry
-        timeline_data = {
-            "ticket_id": ticket_id,
-            "user_id": current_user_id,
-            "action_type": "escalated",
-            "description": f"Ticket manually escalated (Level {new_count})",
-            "metadata": {"manual_escalation": True},
-            "created_at": datetime.utcnow()
-        }
-        await database.timeline.insert_one(timeline_data)
+        await ticket_events.append(
+            ticket_id,
+            "escalated",
+            f"Ticket manually escalated (Level {new_count})",
+            user_id=current_user_id,
+            metadata={"manual_escalation": True}
+        )
 
         return True
 
@@ -0,0 +1,156 @@
+import base64
+import json
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from bson import ObjectId
+
+from database import database
+from indexes import ensure_ttl_index
+from ticket_events import ticket_events
+
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "500"))
+# Changes committed slightly out of updated_at order are picked up by re-reading
+# this much history on every sync; clients apply items idempotently by id
+SYNC_OVERLAP_SECONDS = float(os.getenv("SYNC_OVERLAP_SECONDS", "5"))
+# Tombstones are kept this long (TTL index); older tokens get a full resync
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.getenv("SYNC_TOMBSTONE_RETENTION_DAYS", "30"))
+
+STAFF_ROLES = ["agent", "manager", "admin"]
+
+
+def encode_token(state: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(state, default=str).encode()).decode()
+
+
+def decode_token(token: str) -> dict:
+    """Parse a sync token; raises ValueError for malformed tokens"""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+        state["w"] = datetime.fromisoformat(state["w"])
+        if state.get("a"):
+            # Continuing a paged sync: "s" is when its first page was served
+            state["s"] = datetime.fromisoformat(state["s"])
+            state["a"] = [datetime.fromisoformat(state["a"][0]), ObjectId(state["a"][1])]
+        return state
+    except Exception as e:
+        raise ValueError("Invalid sync token") from e
+
+
+def serialize(document: dict) -> dict:
+    return {"id": str(document["_id"]), **{k: v for k, v in document.items() if k != "_id"}}
+
+
+class SyncService:
+    """Delta sync for ticket workspaces.
+
+    A sync token records the `updated_at` watermark of the previous sync. Each
+    call returns the tickets in the caller's scope changed since then (paged
+    in (updated_at, _id) order), the comments and timeline events added to
+    them, and tombstones for tickets that were deleted or left the caller's
+    scope (e.g. reassigned to another agent). Every ticket change bumps
+    `updated_at` (ticket events do so through a projection), so the cost of a
+    refresh follows the number of changes rather than the size of the history.
+    """
+
+    def __init__(self, page_size: int = SYNC_PAGE_SIZE):
+        self.page_size = page_size
+
+    async def backfill_updated_at(self):
+        """Give tickets stored before every write set updated_at a watermark"""
+        result = await database.requests.update_many(
+            {"updated_at": None},
+            [{"$set": {"updated_at": {"$ifNull": ["$created_at", "$$NOW"]}}}]
+        )
+        if result.modified_count:
+            print(f"Backfilled updated_at on {result.modified_count} tickets")
+
+    async def ensure_indexes(self):
+        """Match the tombstone TTL index to SYNC_TOMBSTONE_RETENTION_DAYS"""
+        await ensure_ttl_index(database.sync_tombstones, "deleted_at", SYNC_TOMBSTONE_RETENTION_DAYS * 86400)
+
+    async def record_removal(self, ticket_id: str, user_id: Optional[str], reason: str):
+        """Tell `user_id`'s clients (or everyone's, for None) to drop a ticket"""
+        await database.sync_tombstones.insert_one({
+            "ticket_id": ticket_id,
+            "user_id": user_id,
+            "reason": reason,
+            "deleted_at": datetime.utcnow()
+        })
+
+    async def record_removals(self, removals: List[dict]):
+        """`record_removal` for many tickets at once ({ticket_id, user_id, reason} dicts)"""
+        if removals:
+            now = datetime.utcnow()
+            await database.sync_tombstones.insert_many([{**removal, "deleted_at": now} for removal in removals])
+
+    async def changes(self, user_id: str, role: str, scope: dict, token: Optional[str] = None) -> dict:
+        """Changes in `scope` (a requests query) since `token`"""
+        now = datetime.utcnow()
+        state = decode_token(token) if token else None
+        retention_start = now - timedelta(days=SYNC_TOMBSTONE_RETENTION_DAYS)
+        if state is None or (not state.get("a") and state["w"] < retention_start):
+            # Full sync: every ticket in scope, no deltas or tombstones needed
+            state = {"w": datetime.min, "f": True}
+        since, after, full = state["w"], state.get("a"), state.get("f", False)
+        started = state["s"] if after else now
+        # Only the first page of a full sync tells the client to drop its copy
+        reset = full and not after
+
+        # Make sure queued ticket events (and their updated_at bumps) are stored
+        await ticket_events.flush()
+
+        query = {**scope, "updated_at": {"$gt": since}}
+        if after:
+            query = {"$and": [query, {"$or": [
+                {"updated_at": {"$gt": after[0]}},
+                {"updated_at": after[0], "_id": {"$gt": after[1]}}
+            ]}]}
+        tickets = await database.requests.find(query).sort(
+            [("updated_at", 1), ("_id", 1)]
+        ).limit(self.page_size + 1).to_list(None)
+        has_more = len(tickets) > self.page_size
+        tickets = tickets[:self.page_size]
+        ticket_ids = [str(t["_id"]) for t in tickets]
+
+        comments, events, deleted = [], [], []
+        if not full and ticket_ids:
+            comment_query = {"ticket_id": {"$in": ticket_ids}, "created_at": {"$gt": since}}
+            if role not in STAFF_ROLES:
+                comment_query["is_internal"] = {"$in": [False, None]}
+            comments = await database.comments.find(comment_query).sort("created_at", 1).to_list(None)
+            events = await database.timeline.find(
+                {"ticket_id": {"$in": ticket_ids}, "created_at": {"$gt": since}}
+            ).sort([("ticket_id", 1), ("seq", 1)]).to_list(None)
+
+        if not full and not after:
+            deleted = await self._removed_since(user_id, since, set(ticket_ids))
+
+        if has_more:
+            last = tickets[-1]
+            next_state = {"w": since, "s": started, "f": full, "a": [last["updated_at"], str(last["_id"])]}
+        else:
+            next_state = {"w": started - timedelta(seconds=SYNC_OVERLAP_SECONDS)}
+
+        return {
+            "tickets": [serialize(t) for t in tickets],
+            "comments": [serialize(c) for c in comments],
+            "events": [serialize(e) for e in events],
+            "deleted": deleted,
+            "reset": reset,
+            "has_more": has_more,
+            "token": encode_token(next_state)
+        }
+
+    async def _removed_since(self, user_id: str, since: datetime, still_visible: set) -> List[str]:
+        tombstones = await database.sync_tombstones.find(
+            {"user_id": {"$in": [user_id, None]}, "deleted_at": {"$gt": since}},
+            {"ticket_id": 1}
+        ).to_list(None)
+        # A ticket that came back into scope is returned as a change instead
+        return sorted({t["ticket_id"] for t in tombstones} - still_visible)
+
+
+# Global sync service instance
+sync_service = SyncService()
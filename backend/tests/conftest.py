@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Modules import each other by name from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="helpdesk-test-uploads-"))
@@ -0,0 +1,109 @@
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from fastapi.testclient import TestClient
+
+import download_service as download_module
+import main
+from auth import get_current_user_from_header_or_query
+from models import User
+
+OWNER = User(_id=str(ObjectId()), email="owner@example.com", name="Owner", role="client")
+OTHER = User(_id=str(ObjectId()), email="other@example.com", name="Other", role="client")
+AGENT = User(_id=str(ObjectId()), email="agent@example.com", name="Agent", role="agent")
+TICKET_ID = ObjectId()
+
+
+class FakeCollection:
+    """The queries download_service makes: equality and $in conditions, and
+    `attachments.stored_filename` with the `attachments.$` projection"""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.queries = 0
+
+    def _matches(self, query):
+        for document in self.documents:
+            attachments = document.get("attachments", [])
+            if "attachments.stored_filename" in query:
+                attachments = [a for a in attachments if a["stored_filename"] == query["attachments.stored_filename"]]
+                if not attachments:
+                    continue
+            conditions = {k: v for k, v in query.items() if k != "attachments.stored_filename"}
+            if all(document.get(field) in condition["$in"] if isinstance(condition, dict)
+                   else document.get(field) == condition for field, condition in conditions.items()):
+                yield {**document, "attachments": attachments[:1]}
+
+    async def find_one(self, query, projection=None):
+        self.queries += 1
+        return next(self._matches(query), None)
+
+    async def distinct(self, field, query):
+        return [document[field] for document in self._matches(query)]
+
+
+def attachment(stored_filename):
+    return {"stored_filename": stored_filename, "filename": "report.txt", "content_type": "text/plain", "size": 5}
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    for name in ("ticket.txt", "internal.txt", "article.txt", "comment.txt"):
+        (tmp_path / name).write_text("hello")
+    monkeypatch.setattr(download_module.download_service.storage, "upload_dir", str(tmp_path))
+    monkeypatch.setattr(download_module, "database", SimpleNamespace(
+        knowledgebase=FakeCollection([{"_id": ObjectId(), "attachments": [attachment("article.txt")]}]),
+        # The owner's ticket comes after many others sharing the same blob
+        requests=FakeCollection([{"_id": ObjectId(), "user_id": str(ObjectId()), "attachments": [attachment("ticket.txt")]}
+                                 for _ in range(150)]
+                                + [{"_id": TICKET_ID, "user_id": OWNER.id, "attachments": [attachment("ticket.txt")]},
+                                   {"_id": ObjectId(), "user_id": OTHER.id, "attachments": []}]),
+        comments=FakeCollection([{"_id": ObjectId(), "ticket_id": str(TICKET_ID), "is_internal": True,
+                                  "attachments": [attachment("internal.txt")]}]
+                                + [{"_id": ObjectId(), "ticket_id": str(ObjectId()), "is_internal": False,
+                                    "attachments": [attachment("comment.txt")]} for _ in range(150)]
+                                + [{"_id": ObjectId(), "ticket_id": str(TICKET_ID), "is_internal": False,
+                                    "attachments": [attachment("comment.txt")]}])
+    ))
+    def as_user(user: User) -> TestClient:
+        main.app.dependency_overrides[get_current_user_from_header_or_query] = lambda: user
+        return TestClient(main.app)
+
+    yield as_user
+    main.app.dependency_overrides.clear()
+
+
+@pytest.mark.parametrize("user,status", [(OWNER, 200), (AGENT, 200), (OTHER, 403)])
+def test_ticket_attachment(client, user, status):
+    response = client(user).get("/attachments/ticket.txt")
+    assert response.status_code == status
+    if status == 200:
+        assert response.content == b"hello"
+
+
+@pytest.mark.parametrize("user,status", [(OWNER, 403), (AGENT, 200)])
+def test_internal_comment_attachment_is_staff_only(client, user, status):
+    assert client(user).get("/attachments/internal.txt").status_code == status
+
+
+@pytest.mark.parametrize("user,status", [(OWNER, 200), (AGENT, 200), (OTHER, 403)])
+def test_blob_shared_by_many_comments(client, user, status):
+    assert client(user).get("/attachments/comment.txt").status_code == status
+
+
+def test_knowledge_base_attachment_readable_by_any_user(client):
+    assert client(OTHER).get("/attachments/article.txt").status_code == 200
+
+
+def test_unknown_attachment(client):
+    assert client(AGENT).get("/attachments/missing.txt").status_code == 404
+
+
+def test_legacy_upload_path_is_authorized(client):
+    assert client(OTHER).get("/uploads/ticket.txt").status_code == 403
+    assert client(OWNER).get("/uploads/ticket.txt").status_code == 200
+
+
+def test_requires_authentication():
+    assert TestClient(main.app).get("/attachments/ticket.txt").status_code == 401
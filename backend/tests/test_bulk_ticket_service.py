@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+import pytest
+
+from bulk_ticket_service import BulkTicketService, LineTooLongError, iter_lines
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+async def collect(lines):
+    return [line async for line in lines]
+
+
+def ticket_lines(count, read):
+    async def lines():
+        for n in range(count):
+            read.append(n)
+            yield json.dumps({"title": f"T{n}", "description": "d", "category": "c", "priority": "low"})
+    return lines()
+
+
+class Actor:
+    id = "u1"
+
+
+def service(monkeypatch, **settings):
+    bulk = BulkTicketService(**settings)
+    monkeypatch.setattr(bulk, "_new_ticket", lambda ticket, actor: {"title": ticket.title})
+
+    async def ingest(batch, ids, errors, stats, actor):
+        for line_number, document in batch:
+            ids[line_number - 1] = document["title"]
+            stats["created"] += 1
+    monkeypatch.setattr(bulk, "_ingest_batch", ingest)
+    return bulk
+
+
+def test_iter_lines_joins_chunks():
+    lines = asyncio.run(collect(iter_lines(chunks(b"a\nb", b"c\n", b"d"))))
+    assert lines == ["a", "bc", "d"]
+
+
+def test_iter_lines_rejects_long_line_before_it_ends():
+    with pytest.raises(LineTooLongError):
+        asyncio.run(collect(iter_lines(chunks(b"ok\n", b"x" * 6, b"x" * 6), max_line_bytes=10)))
+
+
+def test_create_many_stops_reading_past_the_cap(monkeypatch):
+    read = []
+    result = asyncio.run(service(monkeypatch, max_tickets=3).create_many(ticket_lines(1000, read), Actor()))
+
+    assert result["created"] == 3
+    assert result["ids"] == ["T0", "T1", "T2"]
+    assert len(result["errors"]) == 1 and result["errors"][0]["line"] == 4
+    assert len(read) == 4
+
+
+def test_create_many_reports_long_line(monkeypatch):
+    body = json.dumps({"title": "T0", "description": "d", "category": "c", "priority": "low"}).encode()
+    lines = iter_lines(chunks(body + b"\n", b"x" * 200, b"\n" + body), max_line_bytes=100)
+    result = asyncio.run(service(monkeypatch).create_many(lines, Actor()))
+
+    assert result["ids"] == ["T0"]
+    assert result["errors"] == [{"line": 2, "error": "Line longer than 100 bytes; this line and any after it were not read"}]
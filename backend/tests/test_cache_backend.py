@@ -0,0 +1,61 @@
+import asyncio
+
+import fakeredis.aioredis
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from cache_backend import RedisCacheBackend
+
+
+class FlakyRedis:
+    """A fake Redis client that raises connection errors while `down`"""
+
+    def __init__(self):
+        self.redis = fakeredis.aioredis.FakeRedis()
+        self.down = False
+
+    def __getattr__(self, name):
+        method = getattr(self.redis, name)
+
+        async def call(*args, **kwargs):
+            if self.down:
+                raise RedisConnectionError("Connection refused")
+            return await method(*args, **kwargs)
+        return call
+
+
+def test_outage_degrades_to_misses_and_skipped_writes():
+    async def scenario():
+        client = FlakyRedis()
+        backend = RedisCacheBackend(client=client, version_ttl=60)
+        await backend.set("articles", "a", {"title": "cached"})
+        client.down = True
+        assert await backend.get("articles", "a") is None
+        await backend.set("articles", "b", 1)
+        await backend.delete("articles", "a")
+        assert backend.stats()["errors"] == 3
+        client.down = False
+        return await backend.get("articles", "a")
+
+    assert asyncio.run(scenario()) == {"title": "cached"}
+
+
+def test_invalidation_during_outage_is_applied_locally_and_sent_on_recovery():
+    async def scenario():
+        client = FlakyRedis()
+        backend = RedisCacheBackend(client=client, version_ttl=60)
+        other = RedisCacheBackend(client=client, version_ttl=0)
+        invalidated = []
+        backend.add_invalidation_listener(invalidated.append)
+
+        await backend.set("answers", "q", "old answer")
+        client.down = True
+        await backend.invalidate("answers")
+        assert invalidated == ["answers"]
+        client.down = False
+
+        # The stale entry is not served here, nor by other replicas once Redis is back
+        assert await backend.get("answers", "q") is None
+        assert await other.get("answers", "q") is None
+        assert await backend.version("answers") == await other.version("answers") == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,50 @@
+import random
+import string
+
+from duplicate_detector import DuplicateDetector
+
+_rng = random.Random(0)
+# Made-up words: shared character shingles between unrelated tickets stay rare
+WORDS = ["".join(_rng.choice(string.ascii_lowercase) for _ in range(6)) for _ in range(2000)]
+
+
+def tickets(count: int, seed: int):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(25)) for _ in range(count)]
+
+
+def edited(text: str, rng: random.Random) -> str:
+    """`text` with one word replaced"""
+    words = text.split()
+    words[rng.randrange(len(words))] = rng.choice(WORDS)
+    return " ".join(words)
+
+
+def test_near_duplicates_are_candidates():
+    detector = DuplicateDetector()
+    originals = tickets(200, seed=1)
+    for number, text in enumerate(originals):
+        detector._add(f"t{number}", detector.signature(text, ""))
+
+    rng = random.Random(2)
+    found = sum(
+        f"t{number}" in [ticket_id for ticket_id, _ in detector.candidates(detector.signature(edited(text, rng), ""))]
+        for number, text in enumerate(originals)
+    )
+    assert found / len(originals) >= 0.95
+
+
+def test_unrelated_tickets_are_not_candidates():
+    detector = DuplicateDetector()
+    for number, text in enumerate(tickets(200, seed=1)):
+        detector._add(f"t{number}", detector.signature(text, ""))
+
+    flagged = sum(bool(detector.candidates(detector.signature(text, ""))) for text in tickets(200, seed=3))
+    assert flagged / 200 <= 0.05
+
+
+def test_similarity_estimates_jaccard():
+    detector = DuplicateDetector()
+    text = tickets(1, seed=4)[0]
+    assert detector.similarity(detector.signature(text, ""), detector.signature(text, "")) == 1.0
+    assert detector.similarity(detector.signature(text, ""), detector.signature(tickets(1, seed=5)[0], "")) < 0.5
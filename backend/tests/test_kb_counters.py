@@ -0,0 +1,81 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+import kb_counters
+from kb_counters import KnowledgeCounterBuffer
+
+
+class FailingCollection:
+    """bulk_write that rejects the updates at `failed` (or raises `error`)"""
+
+    def __init__(self, failed=(), error=None):
+        self.failed = failed
+        self.error = error
+        self.calls = []
+
+    async def bulk_write(self, updates, ordered=True):
+        self.calls.append(updates)
+        if self.error is not None:
+            raise self.error
+        if self.failed:
+            raise BulkWriteError({"writeErrors": [{"index": i, "errmsg": "failed"} for i in self.failed]})
+
+
+def buffered(monkeypatch, collection):
+    monkeypatch.setattr(kb_counters, "database", SimpleNamespace(knowledgebase=collection))
+    buffer = KnowledgeCounterBuffer()
+    # As if started: increments are only buffered
+    buffer._task = object()
+    return buffer
+
+
+def test_partial_failure_requeues_only_failed_updates(monkeypatch):
+    collection = FailingCollection(failed=[1])
+    buffer = buffered(monkeypatch, collection)
+    first, second, third = (str(ObjectId()) for _ in range(3))
+
+    async def scenario():
+        await buffer.increment(first, "views", 2)
+        await buffer.increment(second, "views")
+        await buffer.increment(second, "helpful_votes")
+        await buffer.increment(third, "views")
+        await buffer.flush()
+
+    asyncio.run(scenario())
+    assert len(collection.calls[0]) == 3
+    assert buffer.pending(first) == {}
+    assert buffer.pending(second) == {"views": 1, "helpful_votes": 1}
+    assert buffer.pending(third) == {}
+    assert buffer.stats()["failed"] == 1
+
+
+def test_requeued_deltas_add_to_new_increments(monkeypatch):
+    collection = FailingCollection(failed=[0])
+    buffer = buffered(monkeypatch, collection)
+    article_id = str(ObjectId())
+
+    async def scenario():
+        await buffer.increment(article_id, "views", 3)
+        await buffer.flush()
+        await buffer.increment(article_id, "views")
+
+    asyncio.run(scenario())
+    assert buffer.pending(article_id) == {"views": 4}
+    assert buffer.apply_pending({"_id": ObjectId(article_id), "views": 10})["views"] == 14
+
+
+def test_connection_failure_keeps_everything(monkeypatch):
+    buffer = buffered(monkeypatch, FailingCollection(error=AutoReconnect("down")))
+    article_id = str(ObjectId())
+
+    async def scenario():
+        await buffer.increment(article_id, "helpful_votes", 5)
+        await buffer.flush()
+
+    with pytest.raises(AutoReconnect):
+        asyncio.run(scenario())
+    assert buffer.pending(article_id) == {"helpful_votes": 5}
@@ -0,0 +1,26 @@
+import pytest
+
+from kb_revisions import apply_delta, content_delta, tokenize
+
+REVISIONS = [
+    "",
+    "<p>Restart the router.</p>",
+    "<p>Restart the router and wait two minutes.</p>",
+    "<h2>Wi-Fi</h2><p>Restart the router and wait <b>two</b> minutes.</p>\n<ul><li>Check cables</li></ul>",
+    "<p>Unplug the router &amp; wait.</p> a < b <br> done",
+    "",
+]
+
+
+@pytest.mark.parametrize("old,new", list(zip(REVISIONS, REVISIONS[1:])) + [(REVISIONS[3], REVISIONS[1])])
+def test_delta_round_trip(old, new):
+    assert apply_delta(old, content_delta(old, new)) == new
+
+
+def test_tokens_join_back_into_text():
+    text = "<p class='x'>a  b</p>\n< lone bracket"
+    assert "".join(tokenize(text)) == text
+
+
+def test_unchanged_content_has_empty_delta():
+    assert content_delta(REVISIONS[3], REVISIONS[3]) == []
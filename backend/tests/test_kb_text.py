@@ -0,0 +1,35 @@
+from kb_text import plain_text, snippet, text_projection
+
+
+def test_plain_text_drops_tags_scripts_and_entities():
+    html = "<h1>Reset</h1><p>Open&nbsp;<b>Settings</b> &amp; click</p><script>alert(1)</script><style>p{}</style>"
+    assert plain_text(html) == "Reset Open Settings & click"
+
+
+def test_plain_text_keeps_words_apart_at_block_tags():
+    assert plain_text("<p>one</p><p>two</p><br>three<li>four</li>") == "one two three four"
+
+
+def test_plain_text_of_empty_content():
+    assert plain_text(None) == ""
+    assert plain_text("") == ""
+
+
+def test_snippet_short_text_unchanged():
+    assert snippet("short text", 20) == "short text"
+
+
+def test_snippet_cuts_at_word_boundary():
+    text = "The quick brown fox jumps over the lazy dog"
+    cut = snippet(text, 18)
+    assert cut == "The quick brown…"
+    assert len(cut) <= 19
+
+
+def test_snippet_of_one_long_word():
+    assert snippet("x" * 50, 10) == "x" * 10 + "…"
+
+
+def test_text_projection_counts_words():
+    projection = text_projection("<p>Hello <i>big</i> world</p>")
+    assert projection == {"plain_text": "Hello big world", "snippet": "Hello big world", "word_count": 3}
@@ -0,0 +1,37 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from pagination import decode_cursor, encode_cursor, keyset_filter
+
+
+def test_cursor_round_trip():
+    document = {"_id": ObjectId(), "created_at": datetime(2024, 5, 1, 12, 30, 15, 123000)}
+    assert decode_cursor(encode_cursor(document)) == (document["created_at"], document["_id"])
+
+
+def test_cursor_on_other_field():
+    document = {"_id": ObjectId(), "updated_at": datetime(2024, 1, 2)}
+    value, object_id = decode_cursor(encode_cursor(document, "updated_at"))
+    assert value == document["updated_at"]
+    assert object_id == document["_id"]
+
+
+def test_keyset_filter_selects_documents_after_cursor():
+    document = {"_id": ObjectId(), "created_at": datetime(2024, 5, 1)}
+    assert keyset_filter(encode_cursor(document)) == {"$or": [
+        {"created_at": {"$lt": document["created_at"]}},
+        {"created_at": document["created_at"], "_id": {"$lt": document["_id"]}}
+    ]}
+
+
+def test_keyset_filter_without_cursor():
+    assert keyset_filter(None) == {}
+    assert keyset_filter("") == {}
+
+
+@pytest.mark.parametrize("cursor", ["zzz", "bm90LWEtY3Vyc29y", encode_cursor({"_id": "x", "created_at": datetime(2024, 1, 1)})])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        keyset_filter(cursor)
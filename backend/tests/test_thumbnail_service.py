@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime
+
+from bson import ObjectId
+
+import thumbnail_service as thumbnail_module
+from thumbnail_service import ThumbnailService
+
+DIGEST = "a" * 64
+
+
+class RecordingCollection:
+    def __init__(self, document=None):
+        self.document = document
+        self.updates = []
+
+    async def find_one_and_update(self, query, update, projection=None, array_filters=None):
+        self.updates.append((query, update, array_filters))
+        return self.document
+
+    async def update_one(self, query, update):
+        self.updates.append((query, update, None))
+
+
+class RecordingDatabase(dict):
+    def __getattr__(self, name):
+        return self[name]
+
+
+def record(monkeypatch, collection, document):
+    database = RecordingDatabase(requests=RecordingCollection(document), comments=RecordingCollection(document))
+    monkeypatch.setattr(thumbnail_module, "database", database)
+    asyncio.run(ThumbnailService()._record(collection, str(document["_id"]), DIGEST, {"thumbnail": {"width": 64}}))
+    return database
+
+
+def test_ticket_thumbnail_moves_updated_at(monkeypatch):
+    ticket = {"_id": ObjectId()}
+    database = record(monkeypatch, "requests", ticket)
+
+    (query, update, array_filters), = database.requests.updates
+    assert query == {"_id": ticket["_id"]}
+    assert update["$set"]["attachments.$[a].thumbnail_url"].endswith(f"/attachments/{DIGEST}/thumbnail")
+    assert update["$set"]["attachments.$[a].thumbnail_width"] == 64
+    assert isinstance(update["$max"]["updated_at"], datetime)
+    assert array_filters == [{"a.stored_filename": DIGEST}]
+
+
+def test_comment_thumbnail_moves_its_ticket_updated_at(monkeypatch):
+    ticket_id = ObjectId()
+    database = record(monkeypatch, "comments", {"_id": ObjectId(), "ticket_id": str(ticket_id)})
+
+    (_, comment_update, _), = database.comments.updates
+    (query, ticket_update, _), = database.requests.updates
+    assert query == {"_id": ticket_id}
+    assert ticket_update == {"$max": {"updated_at": comment_update["$max"]["updated_at"]}}
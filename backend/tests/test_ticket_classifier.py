@@ -0,0 +1,81 @@
+import asyncio
+import random
+import sys
+import types
+
+from bson import ObjectId
+
+from ticket_classifier import TicketClassifier, shuffled
+
+WORDS = {
+    "network": ["vpn", "wifi", "router", "dns", "latency"],
+    "hardware": ["laptop", "screen", "keyboard", "battery", "printer"],
+}
+
+
+class Cursor:
+    def __init__(self, documents, passes):
+        self.documents = documents
+        self.passes = passes
+        self.count = None
+
+    def sort(self, *args):
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def limit(self, count):
+        self.count = count
+        return self
+
+    async def __aiter__(self):
+        self.passes.append(self.count)
+        for document in self.documents[:self.count]:
+            yield document
+
+
+class Requests:
+    def __init__(self, documents):
+        self.documents = documents
+        self.passes = []
+
+    def find(self, query, projection):
+        return Cursor(self.documents, self.passes)
+
+
+def tickets(count):
+    rng = random.Random(1)
+    documents = []
+    for n in range(count):
+        category = "network" if n % 2 else "hardware"
+        words = " ".join(rng.choice(WORDS[category]) for _ in range(6))
+        documents.append({"_id": ObjectId(), "title": words, "description": words,
+                          "category": category, "urgency_level": 1 + n % 3})
+    return documents
+
+
+def test_shuffled_keeps_every_item():
+    async def items():
+        for n in range(100):
+            yield n
+
+    async def collect():
+        return [n async for n in shuffled(items(), 10, random.Random(0))]
+
+    result = asyncio.run(collect())
+    assert sorted(result) == list(range(100)) and result != list(range(100))
+
+
+def test_train_streams_one_pass_per_epoch(monkeypatch, tmp_path):
+    requests = Requests(tickets(400))
+    monkeypatch.setitem(sys.modules, "database", types.SimpleNamespace(database=types.SimpleNamespace(requests=requests)))
+    classifier = TicketClassifier(path=str(tmp_path / "model.json"))
+
+    asyncio.run(classifier.train(epochs=3, limit=300, shuffle_buffer=50))
+
+    # Labels, three epochs, holdout
+    assert requests.passes == [300] * 5
+    assert set(classifier.models) == {"category", "urgency_level"}
+    assert classifier.predict("vpn dns", "wifi router")["category"]["value"] == "network"
+    assert TicketClassifier(path=str(tmp_path / "model.json")).load()
@@ -0,0 +1,89 @@
+import asyncio
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+import ticket_search as ticket_search_module
+from ticket_search import TicketSearchService, highlight
+
+
+def test_highlight_escapes_ticket_text():
+    snippet = highlight('<script>alert("x")</script> printer is broken & offline', ["printer"])
+    assert "<script>" not in snippet
+    assert "&lt;script&gt;alert(&quot;x&quot;)&lt;/script&gt;" in snippet
+    assert "&amp; offline" in snippet
+    assert "<mark>printer</mark>" in snippet
+
+
+def test_highlight_escapes_the_match_itself():
+    assert highlight("see <b>router</b>", ["router"]) == "see &lt;b&gt;<mark>router</mark>&lt;/b&gt;"
+
+
+def test_highlight_matches_stems():
+    assert highlight("Cannot connect to VPN", ["connection"]) == "Cannot <mark>connect</mark> to VPN"
+
+
+def test_highlight_without_match():
+    assert highlight("nothing here", ["printer"]) is None
+    assert highlight("", ["printer"]) is None
+
+
+def matches(document: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        if field == "$and":
+            if not all(matches(document, part) for part in condition):
+                return False
+        elif field == "$text":
+            text = f"{document.get('title', '')} {document.get('description', '')} {document.get('content', '')}"
+            if condition["$search"] not in text:
+                return False
+        elif isinstance(condition, dict):
+            if "$in" in condition and document.get(field) not in condition["$in"]:
+                return False
+        elif document.get(field) != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        # $text results carry their score; best first, as sorted by textScore
+        self.documents = sorted(documents, key=lambda d: d.get("score", 0), reverse=True)
+
+    def sort(self, *args):
+        return self
+
+    def limit(self, count):
+        self.documents = self.documents[:count]
+        return self
+
+    async def to_list(self, length):
+        return self.documents
+
+
+class FakeCollection:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def find(self, query, projection=None):
+        return FakeCursor([dict(d) for d in self.documents if matches(d, query)])
+
+
+def test_own_comment_match_ranks_below_foreign_matches(monkeypatch):
+    client_id = str(ObjectId())
+    own_ticket = {"_id": ObjectId(), "user_id": client_id, "title": "Laptop", "description": "slow"}
+    foreign_tickets = [{"_id": ObjectId(), "user_id": str(ObjectId()), "title": "Other", "description": "x"}
+                       for _ in range(300)]
+    comments = [{"_id": ObjectId(), "ticket_id": str(t["_id"]), "content": "printer jam", "score": 5.0}
+                for t in foreign_tickets]
+    comments.append({"_id": ObjectId(), "ticket_id": str(own_ticket["_id"]), "content": "printer jam", "score": 1.0})
+    monkeypatch.setattr(ticket_search_module, "database", SimpleNamespace(
+        requests=FakeCollection([own_ticket] + foreign_tickets),
+        comments=FakeCollection(comments)
+    ))
+
+    results = asyncio.run(TicketSearchService(comment_candidates=200).search(
+        "printer", {"user_id": client_id}, "client"
+    ))["results"]
+    assert [r["id"] for r in results] == [str(own_ticket["_id"])]
+    assert results[0]["highlights"]["comment"]["snippet"] == "<mark>printer</mark> jam"
@@ -0,0 +1,176 @@
+import asyncio
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+
+from attachment_service import AttachmentService, attachment_service, is_blob_name
+from database import database
+from kb_article_cache import kb_article_cache
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+# Images larger than this many pixels are left alone (decompression bombs)
+THUMBNAIL_MAX_PIXELS = int(os.getenv("THUMBNAIL_MAX_PIXELS", str(50_000_000)))
+
+# variant -> (longest edge in pixels, JPEG quality)
+VARIANTS = {
+    "thumbnail": (256, 75),
+    "preview": (1280, 80),
+}
+
+IMAGE_CONTENT_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp", "image/bmp", "image/tiff"}
+
+
+def _render_variants(source_path: str, targets: Dict[str, str]) -> Dict[str, dict]:
+    """Render every requested variant of one image (runs in a worker process).
+
+    `targets` maps variant name to output path. Each variant is written to a
+    temporary file and renamed into place, so readers never see partial files.
+    """
+    Image.MAX_IMAGE_PIXELS = THUMBNAIL_MAX_PIXELS
+    rendered = {}
+    with Image.open(source_path) as image:
+        # Let the JPEG decoder downscale while decoding when it can
+        largest = max(VARIANTS[variant][0] for variant in targets)
+        image.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(image)
+
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        for variant, output_path in targets.items():
+            edge, quality = VARIANTS[variant]
+            derivative = image.copy()
+            derivative.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            temp_path = f"{output_path}.{uuid.uuid4().hex}.part"
+            derivative.save(temp_path, "JPEG", quality=quality, optimize=True, progressive=True)
+            os.replace(temp_path, output_path)
+
+            rendered[variant] = {"width": derivative.width, "height": derivative.height}
+
+    return rendered
+
+
+class ThumbnailService:
+    """Generates thumbnails and previews for image attachments in the background.
+
+    Rendering is CPU-bound, so it runs in a small process pool instead of the
+    event loop or its thread pool. Derivatives are stored per blob digest, so an
+    image uploaded many times is rendered once. Once rendered, the variant URLs
+    are recorded on every matching attachment entry of the owning document.
+
+    Requires Pillow; without it uploads work as before, just without previews.
+    """
+
+    def __init__(self, storage: AttachmentService = attachment_service, workers: int = THUMBNAIL_WORKERS):
+        self.storage = storage
+        self.workers = max(1, workers)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._stats = {"generated": 0, "reused": 0, "failed": 0}
+        if Image is None:
+            print("Pillow is not installed, attachment thumbnails are disabled")
+
+    @property
+    def enabled(self) -> bool:
+        return Image is not None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def close(self):
+        """Shut down the worker processes"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    @staticmethod
+    def is_image(attachment: dict) -> bool:
+        return (attachment.get("content_type") or "").lower() in IMAGE_CONTENT_TYPES \
+            and is_blob_name(attachment.get("stored_filename"))
+
+    def variant_url(self, digest: str, variant: str) -> str:
+        return f"/attachments/{digest}/{variant}"
+
+    async def generate(self, collection: str, document_id: str, attachments: List[dict]):
+        """Render derivatives for the image attachments of one document.
+
+        Meant to run as a background task after the upload response has been
+        sent; errors are logged and never propagate.
+        """
+        if not self.enabled:
+            return
+
+        digests = {a["stored_filename"] for a in attachments if self.is_image(a)}
+        for digest in digests:
+            try:
+                variants = await self._render(digest)
+                if variants:
+                    await self._record(collection, document_id, digest, variants)
+            except Exception as e:
+                self._stats["failed"] += 1
+                print(f"Thumbnail generation failed for {digest}: {e}")
+
+    async def _render(self, digest: str) -> Dict[str, dict]:
+        targets = {variant: self.storage.derivative_path(digest, variant) for variant in VARIANTS}
+        existing = await asyncio.to_thread(lambda: all(os.path.exists(path) for path in targets.values()))
+        if existing:
+            self._stats["reused"] += 1
+            return {variant: {} for variant in VARIANTS}
+
+        loop = asyncio.get_running_loop()
+        variants = await loop.run_in_executor(
+            self._executor(), _render_variants, self.storage.path_for(digest), targets
+        )
+        self._stats["generated"] += 1
+        return variants
+
+    async def _record(self, collection: str, document_id: str, digest: str, variants: Dict[str, dict]):
+        """Store the derivative URLs (and dimensions) on the matching attachment entries"""
+        update = {}
+        for variant, info in variants.items():
+            update[f"attachments.$[a].{variant}_url"] = self.variant_url(digest, variant)
+            for field, value in info.items():
+                update[f"attachments.$[a].{variant}_{field}"] = value
+
+        changes = {"$set": update}
+        if collection in ("requests", "comments"):
+            # Moves the ticket's detail ETag and sync watermark on, so clients
+            # holding the ticket fetch the new URLs
+            changes["$max"] = {"updated_at": datetime.utcnow()}
+        document = await database[collection].find_one_and_update(
+            {"_id": ObjectId(document_id)},
+            changes,
+            projection={"ticket_id": 1},
+            array_filters=[{"a.stored_filename": digest}]
+        )
+        if collection == "comments" and document and ObjectId.is_valid(document.get("ticket_id")):
+            await database.requests.update_one(
+                {"_id": ObjectId(document["ticket_id"])}, {"$max": {"updated_at": changes["$max"]["updated_at"]}}
+            )
+        if collection == "knowledgebase":
+            # Cached article responses carry the attachment URLs
+            await kb_article_cache.invalidate(document_id)
+
+    def stats(self) -> dict:
+        return {**self._stats, "enabled": self.enabled, "workers": self.workers}
+
+
+# Global thumbnail service instance
+thumbnail_service = ThumbnailService()
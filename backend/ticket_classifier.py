@@ -0,0 +1,325 @@
+"""Ticket category and urgency prediction.
+
+Tickets are turned into hashed word unigram/bigram features and scored by a
+multinomial logistic regression per predicted field. The model is trained
+offline from the `requests` collection and saved as JSON; the API loads it once
+at startup.
+
+    python ticket_classifier.py train [--epochs 5] [--limit N]
+    python ticket_classifier.py benchmark [--samples 10000]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+import zlib
+from collections import Counter
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from duplicate_detector import normalize
+
+TICKET_CLASSIFIER_PATH = os.getenv("TICKET_CLASSIFIER_PATH", "classifier/ticket_classifier.json")
+# Predictions below this confidence are recorded but not acted on
+TICKET_CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("TICKET_CLASSIFIER_MIN_CONFIDENCE", "0.7"))
+
+FEATURE_BITS = 18
+FIELDS = ("category", "urgency_level")
+# Tickets held at once while shuffling the training stream
+SHUFFLE_BUFFER = 10000
+
+
+def features(title: str, description: str, bits: int = FEATURE_BITS) -> List[Tuple[int, float]]:
+    """L2-normalized hashed word unigrams and bigrams; title words get their own features"""
+    mask = (1 << bits) - 1
+    counts: Counter = Counter()
+    for prefix, text in (("t", title), ("d", description)):
+        tokens = normalize(text or "").split()
+        for gram in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            counts[zlib.crc32(f"{prefix}:{gram}".encode()) & mask] += 1
+            counts[zlib.crc32(gram.encode()) & mask] += 1
+
+    values = [(index, 1 + math.log(count)) for index, count in counts.items()]
+    norm = math.sqrt(sum(value * value for _, value in values)) or 1.0
+    return [(index, value / norm) for index, value in values]
+
+
+async def shuffled(items: AsyncIterator, size: int, rng: random.Random) -> AsyncIterator:
+    """Approximately shuffle a stream, holding at most `size` items"""
+    buffer = []
+    async for item in items:
+        if len(buffer) < size:
+            buffer.append(item)
+            continue
+        i = rng.randrange(size)
+        yield buffer[i]
+        buffer[i] = item
+    rng.shuffle(buffer)
+    for item in buffer:
+        yield item
+
+
+def softmax(scores: List[float]) -> List[float]:
+    top = max(scores)
+    exps = [math.exp(score - top) for score in scores]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+
+class LinearModel:
+    """Multinomial logistic regression over sparse features"""
+
+    def __init__(self, labels: list, weights: Optional[Dict[int, List[float]]] = None,
+                 bias: Optional[List[float]] = None):
+        self.labels = labels
+        self.weights = weights or {}
+        self.bias = bias or [0.0] * len(labels)
+        self.steps = 0
+
+    def probabilities(self, x: List[Tuple[int, float]]) -> List[float]:
+        scores = list(self.bias)
+        for index, value in x:
+            row = self.weights.get(index)
+            if row is not None:
+                for k, weight in enumerate(row):
+                    scores[k] += weight * value
+        return softmax(scores)
+
+    def predict(self, x: List[Tuple[int, float]]) -> Tuple[object, float]:
+        probabilities = self.probabilities(x)
+        best = max(range(len(probabilities)), key=probabilities.__getitem__)
+        return self.labels[best], probabilities[best]
+
+    def update(self, x: List[Tuple[int, float]], y: int, learning_rate: float = 0.5, l2: float = 1e-6):
+        """One SGD step on the log loss for features `x` with label index `y`"""
+        classes = len(self.labels)
+        self.steps += 1
+        rate = learning_rate / (1 + self.steps * 1e-5)
+        gradient = self.probabilities(x)
+        gradient[y] -= 1.0
+        for k in range(classes):
+            self.bias[k] -= rate * gradient[k]
+        for index, value in x:
+            row = self.weights.get(index)
+            if row is None:
+                row = self.weights[index] = [0.0] * classes
+            for k in range(classes):
+                row[k] -= rate * (gradient[k] * value + l2 * row[k])
+
+    def fit(self, samples: List[Tuple[List[Tuple[int, float]], int]], epochs: int = 5,
+            learning_rate: float = 0.5, l2: float = 1e-6, seed: int = 0):
+        """Plain SGD on in-memory (features, label index) pairs"""
+        rng = random.Random(seed)
+        for _ in range(epochs):
+            rng.shuffle(samples)
+            for x, y in samples:
+                self.update(x, y, learning_rate, l2)
+
+    def to_dict(self, min_weight: float = 1e-4) -> dict:
+        return {
+            "labels": self.labels,
+            "bias": self.bias,
+            # Near-zero rows only cost memory
+            "weights": {str(index): [round(w, 6) for w in row]
+                        for index, row in self.weights.items() if max(abs(w) for w in row) >= min_weight}
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LinearModel":
+        return cls(data["labels"], {int(index): row for index, row in data["weights"].items()}, data["bias"])
+
+
+class TicketClassifier:
+    """Predicts a new ticket's category and urgency level.
+
+    Predictions are stored on the ticket (`predictions`). Confident ones are
+    also acted on: a predicted category different from the chosen one becomes
+    the ticket's `routing_category` (what assignment matches agents against),
+    and a predicted urgency higher than the chosen one raises it. A user's
+    urgency is never lowered. Without a trained model nothing is predicted.
+    """
+
+    def __init__(self, path: str = TICKET_CLASSIFIER_PATH, min_confidence: float = TICKET_CLASSIFIER_MIN_CONFIDENCE):
+        self.path = path
+        self.min_confidence = min_confidence
+        self.models: Dict[str, LinearModel] = {}
+        self.feature_bits = FEATURE_BITS
+        self.trained_at: Optional[str] = None
+
+    def load(self) -> bool:
+        """Load the trained model if there is one"""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            print(f"No ticket classifier at {self.path}; predictions disabled")
+            return False
+        self.feature_bits = data["feature_bits"]
+        self.trained_at = data.get("trained_at")
+        self.models = {field: LinearModel.from_dict(model) for field, model in data["models"].items()}
+        print(f"Loaded ticket classifier trained {self.trained_at} on {data.get('samples')} tickets")
+        return True
+
+    def save(self, samples: int):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        data = {
+            "feature_bits": self.feature_bits,
+            "trained_at": datetime.utcnow().isoformat(),
+            "samples": samples,
+            "models": {field: model.to_dict() for field, model in self.models.items()}
+        }
+        # Write then rename, so a running API never reads half a model
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def predict(self, title: str, description: str) -> Dict[str, dict]:
+        """{field: {"value", "confidence"}} for every field the model predicts"""
+        if not self.models:
+            return {}
+        x = features(title, description, self.feature_bits)
+        predictions = {}
+        for field, model in self.models.items():
+            value, confidence = model.predict(x)
+            predictions[field] = {"value": value, "confidence": round(confidence, 3)}
+        return predictions
+
+    def apply(self, ticket: dict):
+        """Record predictions on a new ticket document and act on confident ones"""
+        predictions = self.predict(ticket.get("title", ""), ticket.get("description", ""))
+        if not predictions:
+            return
+        ticket["predictions"] = predictions
+
+        category = predictions.get("category")
+        if category and category["confidence"] >= self.min_confidence and category["value"] != ticket.get("category"):
+            ticket["routing_category"] = category["value"]
+
+        urgency = predictions.get("urgency_level")
+        if urgency and urgency["confidence"] >= self.min_confidence:
+            # Lower numbers are more urgent
+            current = int(ticket.get("urgency_level") or 3)
+            if int(urgency["value"]) < current:
+                ticket["urgency_level"] = int(urgency["value"])
+
+    async def train(self, epochs: int = 5, limit: Optional[int] = None, holdout: float = 0.1,
+                    shuffle_buffer: int = SHUFFLE_BUFFER):
+        """Fit a model per field from `requests`; prints holdout accuracy.
+
+        Tickets are read from the database once to collect labels, once per
+        epoch and once more to score the holdout, so memory stays bounded by
+        the shuffle buffer and the weights however many tickets there are.
+        """
+        from database import database
+
+        def tickets():
+            cursor = database.requests.find(
+                {"title": {"$exists": True}},
+                {"title": 1, "description": 1, "category": 1, "urgency_level": 1}
+            ).sort("_id", 1).batch_size(1000)
+            # Sorted, so every pass reads the same `limit` tickets
+            return cursor.limit(limit) if limit else cursor
+
+        def held_out(ticket: dict) -> bool:
+            return zlib.crc32(str(ticket["_id"]).encode()) % 1000 < holdout * 1000
+
+        read = 0
+        values = {field: set() for field in FIELDS}
+        async for ticket in tickets():
+            read += 1
+            for field in FIELDS:
+                if ticket.get(field) not in (None, ""):
+                    values[field].add(ticket[field])
+        print(f"Read {read} tickets")
+
+        models = {}
+        for field in FIELDS:
+            if len(values[field]) < 2:
+                print(f"Not enough distinct {field} values to train on")
+                continue
+            models[field] = LinearModel(sorted(values[field], key=str))
+        if not models:
+            return
+        indexes = {field: {label: i for i, label in enumerate(model.labels)} for field, model in models.items()}
+
+        rng = random.Random(42)
+        started = time.perf_counter()
+        for _ in range(epochs):
+            async for ticket in shuffled(tickets(), shuffle_buffer, rng):
+                if held_out(ticket):
+                    continue
+                x = features(ticket.get("title", ""), ticket.get("description", ""), self.feature_bits)
+                for field, model in models.items():
+                    # Tickets created since the first pass may carry new labels
+                    y = indexes[field].get(ticket.get(field))
+                    if y is not None:
+                        model.update(x, y)
+        elapsed = time.perf_counter() - started
+
+        trained, tested, correct = Counter(), Counter(), Counter()
+        async for ticket in tickets():
+            x = None
+            for field, model in models.items():
+                label = ticket.get(field)
+                if label not in indexes[field]:
+                    continue
+                if not held_out(ticket):
+                    trained[field] += 1
+                    continue
+                if x is None:
+                    x = features(ticket.get("title", ""), ticket.get("description", ""), self.feature_bits)
+                tested[field] += 1
+                correct[field] += model.predict(x)[0] == label
+        for field, model in models.items():
+            accuracy = f"{correct[field] / tested[field]:.1%} holdout accuracy" if tested[field] else "no holdout"
+            print(f"{field}: {len(model.labels)} classes, {trained[field]} samples, {accuracy}")
+        print(f"Trained in {elapsed:.1f}s")
+
+        self.models.update(models)
+        self.save(read)
+        print(f"Saved model to {self.path}")
+
+    async def benchmark(self, samples: int = 10000):
+        """Time predictions on stored tickets (including feature extraction)"""
+        from database import database
+
+        if not self.models and not self.load():
+            return
+        tickets = await database.requests.find({}, {"title": 1, "description": 1}).limit(samples).to_list(None)
+        if not tickets:
+            print("No tickets to benchmark on")
+            return
+
+        texts = [(t.get("title", ""), t.get("description", "")) for t in tickets]
+        rounds = max(1, samples // len(texts))
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for title, description in texts:
+                self.predict(title, description)
+        elapsed = time.perf_counter() - started
+        count = rounds * len(texts)
+        print(f"{count} predictions in {elapsed:.2f}s: {elapsed / count * 1e6:.0f} us per ticket, "
+              f"{count / elapsed:.0f} tickets/s")
+
+
+# Global ticket classifier instance
+ticket_classifier = TicketClassifier()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train or benchmark the ticket classifier")
+    commands = parser.add_subparsers(dest="command", required=True)
+    train_parser = commands.add_parser("train", help="Retrain from the requests collection")
+    train_parser.add_argument("--epochs", type=int, default=5)
+    train_parser.add_argument("--limit", type=int, default=None, help="Train on at most this many tickets")
+    benchmark_parser = commands.add_parser("benchmark", help="Measure inference throughput")
+    benchmark_parser.add_argument("--samples", type=int, default=10000)
+    args = parser.parse_args()
+
+    if args.command == "train":
+        asyncio.run(ticket_classifier.train(epochs=args.epochs, limit=args.limit))
+    else:
+        asyncio.run(ticket_classifier.benchmark(samples=args.samples))
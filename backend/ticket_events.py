@@ -0,0 +1,280 @@
+import asyncio
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from analytics_cache import analytics_cache
+from database import database
+
+# Events are written in batches at most this often
+TICKET_EVENT_FLUSH_INTERVAL_MS = float(os.getenv("TICKET_EVENT_FLUSH_INTERVAL_MS", "100"))
+TICKET_EVENT_BATCH_SIZE = int(os.getenv("TICKET_EVENT_BATCH_SIZE", "500"))
+
+# Analytics responses affected by each kind of event
+ANALYTICS_TAGS = {
+    "created": ("tickets",),
+    "assigned": ("tickets", "agents"),
+    "status_changed": ("tickets", "agents"),
+    "escalated": ("tickets", "agents"),
+    "priority_changed": ("tickets",),
+}
+
+EventHandler = Callable[[List[dict]], Awaitable[None]]
+
+
+class TicketEventLog:
+    """Append-only log of everything that happens to a ticket.
+
+    Events live in the `timeline` collection (the timeline view reads them
+    directly) and carry a per-ticket `seq` that increases monotonically. Appends
+    are queued and written in batches: one `ticket_event_state` update per
+    ticket reserves the sequence numbers and bumps the per-ticket event counts
+    (tickets created in the batch get theirs with a single insert_many), then
+    the events go in with one insert_many. Reads flush first, so callers
+    always see their own events.
+
+    Projections subscribe with `subscribe(handler)` and receive each stored
+    batch; the built-in ones move the tickets' `updated_at` forward (what delta
+    sync keys on) and invalidate the analytics responses derived from tickets.
+    `rebuild_counters()` replays the log to recompute a ticket's counts.
+    """
+
+    def __init__(self, flush_interval_ms: float = TICKET_EVENT_FLUSH_INTERVAL_MS,
+                 batch_size: int = TICKET_EVENT_BATCH_SIZE):
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = max(1, batch_size)
+        self._pending: List[dict] = []
+        self._handlers: List[EventHandler] = [self._touch_tickets, self._invalidate_analytics]
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"appended": 0, "written": 0, "flushes": 0, "failed": 0}
+
+    async def start(self):
+        """Start the background flusher"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop the flusher and write out everything still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Ticket event flush failed, retrying: {e}")
+                self._wakeup.set()
+
+    def subscribe(self, handler: EventHandler):
+        """Call `await handler(events)` with every batch of stored events"""
+        self._handlers.append(handler)
+
+    @staticmethod
+    def _new_event(ticket_id: str, action_type: str, description: str,
+                   user_id: Optional[str] = None, metadata: Optional[dict] = None) -> dict:
+        return {
+            "_id": ObjectId(),
+            "ticket_id": ticket_id,
+            "user_id": user_id or "system",
+            "action_type": action_type,
+            "description": description,
+            "metadata": metadata or {},
+            "created_at": datetime.utcnow()
+        }
+
+    async def append(self, ticket_id: str, action_type: str, description: str,
+                     user_id: Optional[str] = None, metadata: Optional[dict] = None) -> str:
+        """Queue an event for a ticket; returns the event id"""
+        event = self._new_event(ticket_id, action_type, description, user_id, metadata)
+        await self._queue([event])
+        return str(event["_id"])
+
+    async def append_many(self, events: List[dict]) -> List[str]:
+        """Queue several events (dicts of `append`'s arguments) to be written together"""
+        queued = [self._new_event(**event) for event in events]
+        await self._queue(queued)
+        return [str(event["_id"]) for event in queued]
+
+    async def _queue(self, events: List[dict]):
+        if not events:
+            return
+        self._pending.extend(events)
+        self._stats["appended"] += len(events)
+
+        if self._task is None or len(self._pending) >= self.batch_size:
+            # No flusher running (scripts, SLA checker) or a full batch: write now
+            await self.flush()
+        else:
+            self._wakeup.set()
+
+    async def flush(self):
+        """Write every queued event and run the projections on them"""
+        async with self._flush_lock:
+            while self._pending:
+                batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+                self._stats["flushes"] += 1
+                try:
+                    stored = await self._write(batch)
+                except Exception:
+                    # Keep the events (and any sequence numbers they got) for the next attempt
+                    self._pending = batch + self._pending
+                    raise
+
+                for handler in self._handlers:
+                    try:
+                        await handler(stored)
+                    except Exception as e:
+                        print(f"Ticket event projection {getattr(handler, '__name__', handler)} failed: {e}")
+
+    async def _write(self, batch: List[dict]) -> List[dict]:
+        by_ticket: Dict[str, List[dict]] = OrderedDict()
+        for event in batch:
+            if "seq" not in event:
+                by_ticket.setdefault(event["ticket_id"], []).append(event)
+
+        # New tickets (their first event is "created") get their state documents
+        # in one insert_many; others need a round trip per ticket that reserves
+        # a block of sequence numbers and updates the per-ticket counts
+        reserved = await self._reserve_new_tickets(by_ticket)
+        for ticket_id, events in by_ticket.items():
+            if ticket_id in reserved:
+                continue
+            counts: Dict[str, int] = {}
+            for event in events:
+                counts[f"counts.{event['action_type']}"] = counts.get(f"counts.{event['action_type']}", 0) + 1
+            state = await database.ticket_event_state.find_one_and_update(
+                {"_id": ticket_id},
+                {"$inc": {"seq": len(events), **counts}, "$set": {"last_event_at": events[-1]["created_at"]}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            first_seq = state["seq"] - len(events) + 1
+            for offset, event in enumerate(events):
+                event["seq"] = first_seq + offset
+
+        failed = set()
+        try:
+            await database.timeline.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                # Duplicates were written by an earlier, interrupted attempt
+                if error.get("code") != 11000:
+                    failed.add(error["index"])
+                    print(f"Ticket event write failed: {error.get('errmsg')}")
+
+        stored = [event for i, event in enumerate(batch) if i not in failed]
+        self._stats["written"] += len(stored)
+        self._stats["failed"] += len(failed)
+        return stored
+
+    async def _reserve_new_tickets(self, by_ticket: Dict[str, List[dict]]) -> set:
+        """Number the events of tickets created in this batch; returns their ids"""
+        fresh = [ticket_id for ticket_id, events in by_ticket.items()
+                 if any(event["action_type"] == "created" for event in events)]
+        if not fresh:
+            return set()
+
+        states = []
+        for ticket_id in fresh:
+            counts: Dict[str, int] = {}
+            for event in by_ticket[ticket_id]:
+                counts[event["action_type"]] = counts.get(event["action_type"], 0) + 1
+            states.append({
+                "_id": ticket_id,
+                "seq": len(by_ticket[ticket_id]),
+                "counts": counts,
+                "last_event_at": by_ticket[ticket_id][-1]["created_at"]
+            })
+
+        failed = set()
+        try:
+            await database.ticket_event_state.insert_many(states, ordered=False)
+        except BulkWriteError as e:
+            # Already has a state (e.g. a retried batch): number it the usual way
+            failed = {fresh[error["index"]] for error in e.details.get("writeErrors", [])}
+
+        reserved = set(fresh) - failed
+        for ticket_id in reserved:
+            for seq, event in enumerate(by_ticket[ticket_id], start=1):
+                event["seq"] = seq
+        return reserved
+
+    async def _touch_tickets(self, events: List[dict]):
+        """Projection: a ticket's updated_at is at least the time of its latest event"""
+        latest: Dict[str, datetime] = {}
+        for event in events:
+            if ObjectId.is_valid(event["ticket_id"]):
+                latest[event["ticket_id"]] = max(latest.get(event["ticket_id"], event["created_at"]), event["created_at"])
+        if latest:
+            await database.requests.bulk_write(
+                [UpdateOne({"_id": ObjectId(ticket_id)}, {"$max": {"updated_at": at}}) for ticket_id, at in latest.items()],
+                ordered=False
+            )
+
+    async def _invalidate_analytics(self, events: List[dict]):
+        """Projection: drop cached analytics derived from the changed tickets"""
+        tags = set()
+        for event in events:
+            tags.update(ANALYTICS_TAGS.get(event["action_type"], ()))
+        if tags:
+            await analytics_cache.invalidate(*sorted(tags))
+
+    async def list_events(self, ticket_id: str, projection: Optional[dict] = None) -> List[dict]:
+        """All events of a ticket in order (flushes queued events first)"""
+        await self.flush()
+        # Entries written before sequence numbers existed have no seq and sort first
+        return await database.timeline.find({"ticket_id": ticket_id}, projection).sort(
+            [("seq", 1), ("created_at", 1)]
+        ).to_list(None)
+
+    async def counts(self, ticket_id: str) -> Dict[str, int]:
+        """Number of events of each action type for a ticket"""
+        await self.flush()
+        state = await database.ticket_event_state.find_one({"_id": ticket_id}, {"counts": 1})
+        if state is None:
+            return await self.rebuild_counters(ticket_id)
+        return state.get("counts", {})
+
+    async def rebuild_counters(self, ticket_id: str) -> Dict[str, int]:
+        """Recompute a ticket's event counts (and sequence high-water mark) from the log"""
+        await self.flush()
+        pipeline = [
+            {"$match": {"ticket_id": ticket_id}},
+            {"$group": {"_id": "$action_type", "count": {"$sum": 1}, "max_seq": {"$max": "$seq"}}}
+        ]
+        groups = await database.timeline.aggregate(pipeline).to_list(None)
+        counts = {group["_id"]: group["count"] for group in groups}
+        max_seq = max([group.get("max_seq") or 0 for group in groups] + [0])
+
+        # $max keeps sequence numbers monotonic even if appends raced with the rebuild
+        await database.ticket_event_state.update_one(
+            {"_id": ticket_id},
+            {"$set": {"counts": counts}, "$max": {"seq": max_seq}},
+            upsert=True
+        )
+        return counts
+
+    def stats(self) -> dict:
+        return {**self._stats, "pending": len(self._pending)}
+
+
+# Global ticket event log instance
+ticket_events = TicketEventLog()
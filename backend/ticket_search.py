@@ -0,0 +1,221 @@
+import html
+import os
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import TEXT
+from pymongo.errors import OperationFailure
+
+from database import database
+from query_fanout import QueryFanout
+
+# Matching comments considered per search (best text score first); their
+# tickets compete with the tickets matched on title/description
+TICKET_SEARCH_COMMENT_CANDIDATES = int(os.getenv("TICKET_SEARCH_COMMENT_CANDIDATES", "200"))
+# Searches whose scope and filters leave at most this many tickets restrict the
+# comment query to their ids; broader ones join comments to their tickets
+TICKET_SEARCH_SCOPE_MAX_TICKETS = int(os.getenv("TICKET_SEARCH_SCOPE_MAX_TICKETS", "5000"))
+# Weight of a ticket's best matching comment relative to its own text score
+COMMENT_SCORE_WEIGHT = 0.5
+SNIPPET_LENGTH = 160
+STAFF_ROLES = ["agent", "manager", "admin"]
+
+RESULT_FIELDS = {"title": 1, "description": 1, "status": 1, "category": 1, "priority": 1,
+                 "assigned_agent": 1, "user_id": 1, "created_at": 1, "updated_at": 1}
+
+
+def search_terms(q: str) -> List[str]:
+    """Words to highlight: those $text searches for (negated words excluded)"""
+    phrases = re.findall(r'"([^"]+)"', q)
+    words = [w for w in re.sub(r'"[^"]*"', " ", q).split() if not w.startswith("-")]
+    return [t.lower() for t in re.findall(r"\w+", " ".join(words + phrases))]
+
+
+def highlight(text: str, terms: List[str], length: int = SNIPPET_LENGTH) -> Optional[str]:
+    """HTML snippet of `text` around the first match with matches wrapped in <mark>.
+
+    $text matches stemmed words, so words starting with a term's stem-ish
+    prefix count as matches ("connecting" for "connection").
+    """
+    if not text or not terms:
+        return None
+    stems = sorted({t[:max(3, len(t) - 3)] for t in terms}, key=len, reverse=True)
+    pattern = re.compile(r"\b(" + "|".join(re.escape(s) for s in stems) + r")\w*", re.IGNORECASE)
+    first = pattern.search(text)
+    if first is None:
+        return None
+
+    start = max(0, first.start() - length // 4)
+    end = min(len(text), start + length)
+    snippet = text[start:end]
+
+    # The snippet is HTML: escape the ticket text around the marks
+    parts, position = [], 0
+    for match in pattern.finditer(snippet):
+        parts.append(html.escape(snippet[position:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group(0))}</mark>")
+        position = match.end()
+    parts.append(html.escape(snippet[position:]))
+    return ("…" if start > 0 else "") + "".join(parts) + ("…" if end < len(text) else "")
+
+
+class TicketSearchService:
+    """Full-text ticket search over titles, descriptions and comments.
+
+    Uses MongoDB text indexes, which the database keeps up to date on every
+    insert/update (so create_request and add_comment need nothing extra).
+    Tickets matching on their own text and tickets with matching comments are
+    fetched concurrently, both limited and sorted by text score inside the
+    database, then merged: a ticket's score is its own text score plus half of
+    its best comment's. Internal comments are only searched for staff, and
+    only comments on tickets in the caller's scope (and filters) compete.
+    """
+
+    def __init__(self, comment_candidates: int = TICKET_SEARCH_COMMENT_CANDIDATES,
+                 scope_max_tickets: int = TICKET_SEARCH_SCOPE_MAX_TICKETS):
+        self.comment_candidates = comment_candidates
+        self.scope_max_tickets = scope_max_tickets
+
+    async def ensure_indexes(self):
+        """Create the text indexes if the database predates them"""
+        await database.requests.create_index(
+            [("title", TEXT), ("description", TEXT)],
+            weights={"title": 3, "description": 1},
+            name="ticket_text"
+        )
+        await database.comments.create_index([("content", TEXT)], name="comment_text")
+
+    async def search(self, q: str, scope: dict, role: str, limit: int = 20,
+                     status: Optional[str] = None, category: Optional[str] = None,
+                     agent: Optional[str] = None, created_from: Optional[datetime] = None,
+                     created_to: Optional[datetime] = None) -> dict:
+        filters = [scope] if scope else []
+        if status:
+            filters.append({"status": status})
+        if category:
+            filters.append({"category": category})
+        if agent:
+            filters.append({"assigned_agent": agent})
+        if created_from or created_to:
+            created = {}
+            if created_from:
+                created["$gte"] = created_from
+            if created_to:
+                created["$lte"] = created_to
+            filters.append({"created_at": created})
+
+        text = {"$text": {"$search": q}}
+        score = {"score": {"$meta": "textScore"}}
+        comment_query = dict(text)
+        if role not in STAFF_ROLES:
+            comment_query["is_internal"] = {"$in": [False, None]}
+
+        fanout = QueryFanout("ticket-search")
+        fanout.add("tickets", database.requests.find(
+            {"$and": [text, *filters]}, {**RESULT_FIELDS, **score}
+        ).sort([("score", {"$meta": "textScore"})]).limit(limit).to_list, None)
+        fanout.add("comments", self._matching_comments, comment_query, filters)
+        try:
+            results = await fanout.run()
+        except OperationFailure as e:
+            raise RuntimeError(f"Ticket search is unavailable: {e}") from e
+
+        tickets: Dict[str, dict] = {str(t["_id"]): t for t in results["tickets"]}
+        best_comments: Dict[str, dict] = {}
+        for comment in results["comments"]:
+            current = best_comments.get(comment["ticket_id"])
+            if current is None or comment["score"] > current["score"]:
+                best_comments[comment["ticket_id"]] = comment
+
+        # Tickets found only through comments still have to pass the scope and filters
+        missing = [ticket_id for ticket_id in best_comments if ticket_id not in tickets]
+        if missing:
+            object_ids = [ObjectId(t) for t in missing if ObjectId.is_valid(t)]
+            for ticket in await database.requests.find(
+                {"$and": [{"_id": {"$in": object_ids}}, *filters]}, RESULT_FIELDS
+            ).to_list(None):
+                ticket["score"] = 0.0
+                tickets[str(ticket["_id"])] = ticket
+
+        def total(ticket_id: str) -> float:
+            comment = best_comments.get(ticket_id)
+            return tickets[ticket_id]["score"] + (COMMENT_SCORE_WEIGHT * comment["score"] if comment else 0.0)
+
+        ranked = sorted(tickets, key=total, reverse=True)[:limit]
+        terms = search_terms(q)
+        return {
+            "query": q,
+            "results": [self._result(tickets[ticket_id], best_comments.get(ticket_id), total(ticket_id), terms)
+                        for ticket_id in ranked],
+            "timings_ms": fanout.timings
+        }
+
+    async def _matching_comments(self, comment_query: dict, filters: List[dict]) -> List[dict]:
+        """The best matching comments on tickets that pass the scope and filters.
+
+        The scope goes into the comment query itself: limiting candidates
+        across all tickets first would leave only other users' comments for
+        anyone whose scope is a small share of the tickets.
+        """
+        score = {"score": {"$meta": "textScore"}}
+        if filters:
+            in_scope = await database.requests.find(
+                {"$and": filters}, {"_id": 1}
+            ).limit(self.scope_max_tickets + 1).to_list(None)
+            if len(in_scope) > self.scope_max_tickets:
+                return await self._matching_comments_joined(comment_query, filters)
+            comment_query = {**comment_query, "ticket_id": {"$in": [str(t["_id"]) for t in in_scope]}}
+
+        return await database.comments.find(
+            comment_query, {"ticket_id": 1, "content": 1, **score}
+        ).sort([("score", {"$meta": "textScore"})]).limit(self.comment_candidates).to_list(None)
+
+    async def _matching_comments_joined(self, comment_query: dict, filters: List[dict]) -> List[dict]:
+        """`_matching_comments` for broad scopes: every matching comment is joined
+        to its ticket, and only those passing the filters are ranked"""
+        return await database.comments.aggregate([
+            {"$match": comment_query},
+            {"$addFields": {
+                "score": {"$meta": "textScore"},
+                "ticket_object_id": {"$convert": {"input": "$ticket_id", "to": "objectId", "onError": None}}
+            }},
+            {"$lookup": {
+                "from": "requests",
+                "let": {"ticket_object_id": "$ticket_object_id"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$_id", "$$ticket_object_id"]}}},
+                    {"$match": {"$and": filters}},
+                    {"$project": {"_id": 1}}
+                ],
+                "as": "ticket"
+            }},
+            {"$match": {"ticket": {"$ne": []}}},
+            {"$sort": {"score": -1}},
+            {"$limit": self.comment_candidates},
+            {"$project": {"ticket_id": 1, "content": 1, "score": 1}}
+        ]).to_list(None)
+
+    @staticmethod
+    def _result(ticket: dict, comment: Optional[dict], score: float, terms: List[str]) -> dict:
+        result = {
+            "id": str(ticket["_id"]),
+            **{field: ticket.get(field) for field in RESULT_FIELDS if field not in ("title", "description")},
+            "title": ticket.get("title", ""),
+            "score": round(score, 3),
+            "highlights": {
+                "title": highlight(ticket.get("title", ""), terms, length=10_000),
+                "description": highlight(ticket.get("description", ""), terms)
+            }
+        }
+        if comment is not None:
+            result["highlights"]["comment"] = {
+                "id": str(comment["_id"]),
+                "snippet": highlight(comment.get("content", ""), terms)
+            }
+        return result
+
+
+# Global ticket search service instance
+ticket_search = TicketSearchService()
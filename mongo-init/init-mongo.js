@@ -12,6 +12,12 @@ db.createCollection('categories');
 db.createCollection('departments');
 db.createCollection('sla_rules');
 db.createCollection('chatbot_interactions');
+db.createCollection('attachment_blobs');
+db.createCollection('notification_counters');
+db.createCollection('ticket_event_state');
+db.createCollection('sync_tombstones');
+db.createCollection('ticket_signatures');
+db.createCollection('kb_revisions');
 
 // Create indexes for better performance
 db.users.createIndex({ "email": 1 }, { unique: true });
@@ -30,23 +36,54 @@ db.requests.createIndex({ "created_at": 1 });
 db.requests.createIndex({ "updated_at": 1 });
 db.requests.createIndex({ "escalated": 1 });
 db.requests.createIndex({ "sla_breached": 1 });
+db.requests.createIndex({ "attachments.stored_filename": 1 });
+// Delta sync pages through a workspace in (updated_at, _id) order
+db.requests.createIndex({ "assigned_agent": 1, "updated_at": 1, "_id": 1 });
+db.requests.createIndex({ "user_id": 1, "updated_at": 1, "_id": 1 });
+db.requests.createIndex({ "parent_ticket_id": 1, "status": 1 });
+// Ticket search (the backend also creates these at startup)
+db.requests.createIndex({ "title": "text", "description": "text" }, { name: "ticket_text", weights: { "title": 3, "description": 1 } });
 
 db.comments.createIndex({ "ticket_id": 1 });
 db.comments.createIndex({ "user_id": 1 });
 db.comments.createIndex({ "created_at": 1 });
+// Keyset pagination of a ticket's comments (all, and without internal ones)
+db.comments.createIndex({ "ticket_id": 1, "created_at": -1, "_id": -1 });
+db.comments.createIndex({ "ticket_id": 1, "is_internal": 1, "created_at": -1, "_id": -1 });
+db.comments.createIndex({ "attachments.stored_filename": 1 });
+db.comments.createIndex({ "content": "text" }, { name: "comment_text" });
 
 db.notifications.createIndex({ "user_id": 1 });
 db.notifications.createIndex({ "created_at": 1 });
 db.notifications.createIndex({ "is_read": 1 });
+db.notifications.createIndex({ "user_id": 1, "is_read": 1, "created_at": -1 });
+db.notifications.createIndex({ "user_id": 1, "created_at": -1, "_id": -1 });
+// Read notifications are removed 30 days after being read; unread ones are kept.
+// The backend sets the expiry from NOTIFICATION_READ_RETENTION_DAYS at startup
+db.notifications.createIndex({ "read_at": 1 }, { expireAfterSeconds: 2592000 });
 
 db.timeline.createIndex({ "ticket_id": 1 });
 db.timeline.createIndex({ "user_id": 1 });
 db.timeline.createIndex({ "created_at": 1 });
+// Per-ticket event sequence; older entries without seq are left out of the unique constraint
+db.timeline.createIndex({ "ticket_id": 1, "seq": 1 }, { unique: true, partialFilterExpression: { "seq": { "$exists": true } } });
+
+db.sync_tombstones.createIndex({ "user_id": 1, "deleted_at": 1 });
+// Tokens older than this get a full resync, so older tombstones can go.
+// The backend sets the expiry from SYNC_TOMBSTONE_RETENTION_DAYS at startup
+db.sync_tombstones.createIndex({ "deleted_at": 1 }, { expireAfterSeconds: 2592000 });
+
+// Duplicate detection signatures of open tickets, picked up by other replicas by created_at
+db.ticket_signatures.createIndex({ "created_at": 1 });
 
 db.knowledgebase.createIndex({ "title": "text", "content": "text", "summary": "text", "tags": "text" });
 db.knowledgebase.createIndex({ "category": 1 });
 db.knowledgebase.createIndex({ "status": 1 });
 db.knowledgebase.createIndex({ "created_at": 1 });
+db.knowledgebase.createIndex({ "attachments.stored_filename": 1 });
+
+// Knowledge base article revisions
+db.kb_revisions.createIndex({ "article_id": 1, "revision": 1 }, { unique: true });
 
 db.chatbot_interactions.createIndex({ "created_at": 1 });
 db.chatbot_interactions.createIndex({ "resolved_by_chatbot": 1 });